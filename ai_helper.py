@@ -1,36 +1,250 @@
-import openai
+import asyncio
+import concurrent.futures
+import json
+import re
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
 import streamlit as st
 
+from consultation_context import update_context
+from emergency_detector import EMERGENCY_RECOMMENDATION, is_emergency_answer
+from llm_client import AsyncLLMClient
+from result_cache import ResultCache, canonical_key
+from specialty_classifier import log_consultation, predict_specialty
+from text_utils import estimate_tokens, normalize_text
+
 # Настройки Yandex Cloud
 YANDEX_CLOUD_FOLDER = ""
 YANDEX_CLOUD_API_KEY = ""
 
-# Инициализация клиента
-client = openai.OpenAI(
+# Сколько ждать ответа select_top_doctors, прежде чем показать локальный рейтинг врачей
+SELECT_TOP_DOCTORS_TIMEOUT = 30
+
+# Структурированный подбор (select_top_doctors_structured): LLM возвращает только номера кандидатов
+# и короткие причины в JSON, карточки врачей строятся из каталога. Ответ - около 60 токенов на врача
+# вместо 1500 токенов свободного текста
+SELECTION_JSON_TOKENS_PER_DOCTOR = 60
+JSON_ARRAY_RE = re.compile(r'\[.*\]', re.S)
+
+# Подбор в два этапа (map-reduce): если упакованные профили кандидатов длиннее SELECTION_MAP_REDUCE_TOKENS,
+# они делятся на части не длиннее SELECTION_CHUNK_TOKENS, из каждой части LLM параллельно выбирает
+# num_doctors лучших (map), итоговый выбор идет по объединению выбранных (reduce). Короткие промпты
+# частей обрабатываются быстрее, и кандидаты из конца длинного списка не теряются. Сравнение с выбором
+# одним запросом: python benchmark.py selection --llm
+SELECTION_MAP_REDUCE_TOKENS = 4000
+SELECTION_CHUNK_TOKENS = 2000
+
+# Объяснения "почему подходит" для итоговых врачей: по одному короткому запросу на врача, все
+# параллельно; карточка врача выводится, как только пришло ее объяснение
+EXPLANATION_MAX_TOKENS = 200
+EXPLANATION_TIMEOUT = 20
+
+# Общий для всех сессий кэш ответов select_top_doctors. Только в памяти: причины выбора пересказывают
+# критерии пациента (диагнозы, хронические заболевания), на диске они не хранятся
+SELECTION_CACHE_PATH = None
+SELECTION_CACHE = ResultCache(max_entries=512, ttl_seconds=12 * 3600, path=SELECTION_CACHE_PATH)
+
+# Общий для всех сессий кэш ответов ask_question: одинаковые промпты (например, первый вопрос
+# по одной и той же жалобе) не отправляются в LLM повторно. Размер ограничен суммарным объемом ответов.
+# Только в памяти: ответы содержат пересказ жалоб пациента, на диске они не хранятся
+ASK_CACHE_PATH = None
+ASK_CACHE_MAX_BYTES = 4 * 1024 * 1024
+ASK_CACHE = ResultCache(max_entries=8192, ttl_seconds=24 * 3600, path=ASK_CACHE_PATH, max_bytes=ASK_CACHE_MAX_BYTES)
+
+# Срок жизни ответа в кэше по типу промпта (с)
+ASK_CACHE_TTL = {
+    'question': 24 * 3600,  # уточняющий вопрос консультации
+    'recommendation': 7 * 24 * 3600,  # специалист по описанию жалоб
+    'final_recommendation': 24 * 3600,  # рекомендация с учетом критериев поиска
+    'doctor_explanation': 12 * 3600,  # почему врач подходит пациенту
+}
+
+# Консультация: не больше MAX_CONSULTATION_QUESTIONS вопросов; сбор жалоб завершается раньше,
+# как только уверенность LLM в специалисте достигает EARLY_STOP_CONFIDENCE
+MAX_CONSULTATION_QUESTIONS = 4
+EARLY_STOP_CONFIDENCE = 0.85
+
+# Разбор ответа консультации: "Специалист: ...", "Уверенность: ...", "Вопрос: ..."
+TRIAGE_SPECIALTY_RE = re.compile(r'^\W*специалист\W*:\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE)
+TRIAGE_CONFIDENCE_RE = re.compile(r'уверенность\W*:\s*(\d+(?:[.,]\d+)?)', re.IGNORECASE)
+TRIAGE_QUESTION_RE = re.compile(r'^\W*вопрос\W*:\s*', re.IGNORECASE | re.MULTILINE)
+TRIAGE_NO_QUESTION = {'', '-', '—', 'нет'}
+# Разметка markdown, которой LLM иногда выделяет подписи ("**Уверенность:** 60"), перед разбором убирается
+TRIAGE_MARKDOWN_RE = re.compile(r'[*_]')
+
+# Ответ ask_question, если AI недоступен
+ASK_QUESTION_FALLBACK = "Пожалуйста, опишите ваши симптомы подробнее."
+
+# Метрики последних вызовов LLM: время до первого токена (TTFT) и полное время ответа
+LLM_METRICS = deque(maxlen=500)
+
+# Ограничения общего клиента LLM: одновременные запросы, соединения в пуле, таймаут вызова (с)
+LLM_MAX_CONCURRENCY = 16
+LLM_MAX_CONNECTIONS = 32
+LLM_TIMEOUT = 60
+
+# Инициализация клиента: один асинхронный клиент с пулом соединений на процесс
+client = AsyncLLMClient(
     api_key=YANDEX_CLOUD_API_KEY,
-    base_url="https://llm.api.cloud.yandex.net/v1"
+    base_url="https://llm.api.cloud.yandex.net/v1",
+    model=f"gpt://{YANDEX_CLOUD_FOLDER}/qwen3-235b-a22b-fp8/latest",
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_connections=LLM_MAX_CONNECTIONS,
+    timeout=LLM_TIMEOUT
 )
 
 
-def ask_question(messages):
-    """Функция для взаимодействия с AI"""
+def _record_llm_call(name: str, stream: bool, started: float, first_token_at: Optional[float], ok: bool) -> Dict:
+    """Запись времени вызова LLM (для обычного вызова первый токен приходит вместе с ответом)"""
+    finished = time.perf_counter()
+    metric = {
+        'call': name,
+        'stream': stream,
+        'ok': ok,
+        'ttft_ms': round((first_token_at - started) * 1000, 1) if first_token_at else None,
+        'total_ms': round((finished - started) * 1000, 1),
+    }
+    LLM_METRICS.append(metric)
+    return metric
+
+
+def llm_metrics_summary() -> Dict[str, Dict]:
+    """Сводка по вызовам LLM: число, ошибки, медиана и 95-й перцентиль TTFT и полного времени"""
+    summary = {}
+    for name in {metric['call'] for metric in LLM_METRICS}:
+        calls = [metric for metric in LLM_METRICS if metric['call'] == name]
+        ttft = [metric['ttft_ms'] for metric in calls if metric['ttft_ms'] is not None]
+        total = [metric['total_ms'] for metric in calls if metric['ok']]
+        summary[name] = {
+            'calls': len(calls),
+            'errors': sum(not metric['ok'] for metric in calls),
+            'ttft_p50_ms': round(float(np.percentile(ttft, 50)), 1) if ttft else None,
+            'ttft_p95_ms': round(float(np.percentile(ttft, 95)), 1) if ttft else None,
+            'total_p50_ms': round(float(np.percentile(total, 50)), 1) if total else None,
+            'total_p95_ms': round(float(np.percentile(total, 95)), 1) if total else None,
+        }
+    return summary
+
+
+def llm_stats() -> Dict[str, Dict]:
+    """Статистика LLM для мониторинга: время вызовов, кэши ответов, загрузка клиента"""
+    return {'calls': llm_metrics_summary(), 'cache': llm_cache_stats(), 'client': client.stats()}
+
+
+async def _acompletion(name: str, messages, max_tokens: int, timeout: Optional[float] = None) -> str:
+    """Вызов LLM с записью времени в LLM_METRICS, ошибки пробрасываются"""
+    started = time.perf_counter()
+    try:
+        answer = await client.acomplete(messages, max_tokens=max_tokens, timeout=timeout)
+    except Exception:
+        _record_llm_call(name, False, started, None, False)
+        raise
+    _record_llm_call(name, False, started, time.perf_counter(), True)
+    return answer
+
+
+def _stream_completion(name: str, messages, max_tokens: int, timeout: Optional[float] = None) -> Iterator[str]:
+    """Потоковый вызов LLM: части ответа отдаются по мере генерации, ошибки пробрасываются"""
+    started = time.perf_counter()
+    first_token_at = None
+    ok = False
     try:
-        response = client.chat.completions.create(
-            model=f"gpt://{YANDEX_CLOUD_FOLDER}/qwen3-235b-a22b-fp8/latest",
-            messages=messages,
-            max_tokens=150,
-            temperature=0.3,
-            stream=False
-        )
-        return response.choices[0].message.content
+        for text in client.stream(messages, max_tokens, timeout):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield text
+        ok = True
+    except GeneratorExit:
+        ok = True  # Вывод прерван получателем, а не ошибкой LLM
+        raise
+    finally:
+        _record_llm_call(name, True, started, first_token_at, ok)
+
+
+def _normalize_messages(messages) -> List[List[str]]:
+    """Сообщения без различий в регистре, пробелах и разметке (для ключа кэша)"""
+    return [[message['role'], normalize_text(message['content'])] for message in messages]
+
+
+def ask_cache_key(messages, max_tokens: int = 150) -> str:
+    """Ключ кэша ask_question: модель, температура, лимит ответа и нормализованные сообщения"""
+    return canonical_key(client.model, client.temperature, max_tokens, _normalize_messages(messages))
+
+
+def _cache_answer(key: str, answer: str, prompt_type: str):
+    if answer and answer.strip():
+        ASK_CACHE.set(key, answer, ttl_seconds=ASK_CACHE_TTL.get(prompt_type))
+
+
+def llm_cache_stats() -> Dict[str, Dict]:
+    """Статистика кэшей ответов LLM"""
+    return {'ask_question': ASK_CACHE.stats(), 'select_top_doctors': SELECTION_CACHE.stats()}
+
+
+async def _ask_question(messages, prompt_type: str) -> str:
+    """Ответ AI из кэша или от LLM (ошибки LLM пробрасываются)"""
+    key = ask_cache_key(messages)
+    cached = ASK_CACHE.get(key)
+    if cached is not None:
+        return cached
+    answer = await _acompletion('ask_question', messages, 150)
+    _cache_answer(key, answer, prompt_type)
+    return answer
+
+
+def _run_answer(coro) -> str:
+    """Синхронное ожидание ответа AI в цикле клиента; ошибка показывается пользователю"""
+    try:
+        return client.run(coro)
     except Exception as e:
         st.error(f"Ошибка при обращении к AI: {str(e)}")
-        return "Пожалуйста, опишите ваши симптомы подробнее."
+        return ASK_QUESTION_FALLBACK
 
 
-def get_ai_recommendation(patient_info):
-    """Получение итоговой рекомендации от AI"""
-    analysis_messages = [
+async def _await_answer(coro) -> str:
+    """Ожидание ответа AI в фоновой задаче; ошибка пишется в лог"""
+    try:
+        return await coro
+    except Exception as e:
+        print(f"Ошибка при обращении к AI: {str(e)}")
+        return ASK_QUESTION_FALLBACK
+
+
+def ask_question(messages, prompt_type: str = 'question'):
+    """Функция для взаимодействия с AI (повторный такой же запрос берется из кэша)"""
+    return _run_answer(_ask_question(messages, prompt_type))
+
+
+async def ask_question_async(messages, prompt_type: str = 'question'):
+    """Асинхронный вариант ask_question (не занимает поток на время ожидания ответа)"""
+    return await _await_answer(_ask_question(messages, prompt_type))
+
+
+def ask_question_stream(messages, prompt_type: str = 'question') -> Iterator[str]:
+    """Потоковый вариант ask_question для постепенного вывода (st.write_stream)"""
+    key = ask_cache_key(messages)
+    cached = ASK_CACHE.get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    try:
+        for text in _stream_completion('ask_question', messages, 150):
+            parts.append(text)
+            yield text
+        _cache_answer(key, "".join(parts), prompt_type)
+    except Exception as e:
+        st.error(f"Ошибка при обращении к AI: {str(e)}")
+        if not parts:
+            yield ASK_QUESTION_FALLBACK
+
+
+def _recommendation_messages(patient_info):
+    """Промпт итоговой рекомендации специалиста"""
+    return [
         {"role": "system", "content": """Ты мед консультант диспетчер врач 1 линии. 
         Тебе нужно определить к какому врачу специалисту направить пациента.
         Назови только название специалиста.
@@ -39,7 +253,30 @@ def get_ai_recommendation(patient_info):
         {"role": "user", "content": patient_info}
     ]
 
-    return ask_question(analysis_messages)
+
+async def _ai_recommendation(patient_info) -> str:
+    """Специалист от локального классификатора или AI; ответ AI пишется в журнал консультаций
+    (обучающие данные классификатора), ошибки LLM пробрасываются"""
+    specialty = predict_specialty(patient_info)
+    if specialty:
+        return specialty
+    messages = _recommendation_messages(patient_info)
+    cached = ask_cache_key(messages) in ASK_CACHE
+    started = time.perf_counter()
+    answer = await _ask_question(messages, 'recommendation')
+    if not cached:
+        log_consultation(patient_info, answer, round((time.perf_counter() - started) * 1000, 1))
+    return answer
+
+
+def get_ai_recommendation(patient_info):
+    """Получение итоговой рекомендации: уверенный ответ локального классификатора или AI"""
+    return _run_answer(_ai_recommendation(patient_info))
+
+
+async def get_ai_recommendation_async(patient_info):
+    """Асинхронный вариант get_ai_recommendation"""
+    return await _await_answer(_ai_recommendation(patient_info))
 
 
 # АЛИАС для обратной совместимости - если где-то используется get_final_recommendation
@@ -50,40 +287,131 @@ def get_final_recommendation(consultation):
 
 def initialize_ai_consultation(symptoms):
     """Инициализация AI консультации"""
-    return {
+    consultation = {
+        'symptoms': symptoms,
+        'turns': [],
         'patient_info': symptoms,
         'questions_asked': 0,
         'answers': [],
         'messages': [
-            {"role": "system", "content": """Ты мед консультант диспетчер врач 1 линии. 
+            {"role": "system", "content": f"""Ты мед консультант диспетчер врач 1 линии. 
             Тебе нужно определить к какому врачу специалисту направить пациента.
             не здоровайся.
             Задай уточняющий вопрос. Один вопрос. 
             Вопросы понятным языком без спец.терминов.
             Задавай только те вопросы, которые помогают в выборе специалиста.
-            Не озвучивай диагноз."""},
+            Не озвучивай диагноз.
+            Если состояние критичное, специалист - вызов скорой помощи по номеру 103, уверенность 100.
+            Ответь строго в формате из трех строк:
+            Специалист: название специалиста, к которому сейчас направил бы пациента
+            Уверенность: число от 0 до 100
+            Вопрос: уточняющий вопрос (или "-", если уверенность {EARLY_STOP_CONFIDENCE * 100:.0f} и выше)"""},
             {"role": "user", "content": symptoms}
         ],
         'current_question': None,
-        'waiting_for_answer': False
+        'waiting_for_answer': False,
+        'provisional_specialty': None,
+        'confidence': 0.0
     }
+    return update_context(consultation)
+
+
+def parse_triage_header(text: str) -> Tuple[Optional[str], float]:
+    """Предварительный специалист и уверенность (0..1) из ответа консультации"""
+    text = TRIAGE_MARKDOWN_RE.sub('', text)
+    specialty = TRIAGE_SPECIALTY_RE.search(text)
+    confidence = TRIAGE_CONFIDENCE_RE.search(text)
+    value = float(confidence.group(1).replace(',', '.')) if confidence else 0.0
+    if value > 1:
+        value /= 100
+    return (specialty.group(1) if specialty else None), min(max(value, 0.0), 1.0)
+
+
+def parse_triage_response(text: str) -> Tuple[Optional[str], Optional[str], float]:
+    """Вопрос, предварительный специалист и уверенность из ответа консультации.
+
+    Ответ не в формате целиком считается вопросом (с нулевой уверенностью).
+    """
+    text = TRIAGE_MARKDOWN_RE.sub('', text)
+    specialty, confidence = parse_triage_header(text)
+    match = TRIAGE_QUESTION_RE.search(text)
+    if match:
+        question = text[match.end():].strip()
+    elif specialty is None:
+        question = text.strip()
+    else:
+        question = ''
+    return (None if question in TRIAGE_NO_QUESTION else question), specialty, confidence
+
+
+def _apply_triage(consultation, question: Optional[str], specialty: Optional[str], confidence: float) -> bool:
+    """Сохранение хода консультации; True - задан вопрос, False - сбор жалоб можно завершать"""
+    if specialty:
+        consultation['provisional_specialty'] = specialty
+        consultation['confidence'] = confidence
+    if is_consultation_complete(consultation) or not question:
+        consultation['current_question'] = None
+        return False
+    consultation['current_question'] = question
+    consultation['waiting_for_answer'] = True
+    return True
+
+
+def _can_ask_question(consultation) -> bool:
+    return not consultation['waiting_for_answer'] and not is_consultation_complete(consultation)
 
 
 def generate_next_question(consultation):
-    """Генерация следующего вопроса от AI"""
-    if consultation['questions_asked'] < 4 and not consultation['waiting_for_answer']:
-        question = ask_question(consultation['messages'])
-        consultation['current_question'] = question
-        consultation['waiting_for_answer'] = True
-        return True
+    """Генерация следующего вопроса от AI вместе с предварительным специалистом"""
+    if _can_ask_question(consultation):
+        return _apply_triage(consultation, *parse_triage_response(ask_question(consultation['messages'])))
     return False
 
 
+def generate_next_question_stream(consultation) -> Iterator[str]:
+    """Потоковая генерация следующего вопроса; по окончании вопрос сохраняется в consultation.
+
+    Строки со специалистом и уверенностью не выводятся; если уверенность уже достаточна,
+    генерация прерывается, не дожидаясь вопроса.
+    """
+    if not _can_ask_question(consultation):
+        return
+    buffer = ""
+    question_started = False
+    question_yielded = False
+    for text in ask_question_stream(consultation['messages']):
+        text = TRIAGE_MARKDOWN_RE.sub('', text)
+        buffer += text
+        if question_started:
+            text = text if question_yielded else text.lstrip()
+            if text and buffer[question_start:].strip() not in TRIAGE_NO_QUESTION:
+                question_yielded = True
+                yield text
+            continue
+        specialty, confidence = parse_triage_header(buffer)
+        confidence_match = TRIAGE_CONFIDENCE_RE.search(buffer)
+        if specialty and confidence_match and '\n' in buffer[confidence_match.end():] and \
+                confidence >= EARLY_STOP_CONFIDENCE:
+            break
+        match = TRIAGE_QUESTION_RE.search(buffer)
+        if match:
+            question_started = True
+            question_start = match.end()
+            rest = buffer[question_start:].lstrip()
+            if rest and rest.strip() not in TRIAGE_NO_QUESTION:
+                question_yielded = True
+                yield rest
+    question, specialty, confidence = parse_triage_response(buffer)
+    if not question_started and question and specialty is None:
+        yield question  # Ответ не в формате: выводим его целиком как вопрос
+    _apply_triage(consultation, question, specialty, confidence)
+
+
 def process_user_answer(consultation, user_answer):
-    """Обработка ответа пользователя"""
+    """Обработка ответа пользователя (история в промпте ограничена, см. update_context)"""
     consultation['answers'].append(user_answer)
-    consultation['patient_info'] += f". {user_answer}"
-    consultation['messages'].append({"role": "user", "content": user_answer})
+    consultation['turns'].append({'question': consultation['current_question'], 'answer': user_answer})
+    update_context(consultation)
     consultation['current_question'] = None
     consultation['waiting_for_answer'] = False
     consultation['questions_asked'] += 1
@@ -91,8 +419,23 @@ def process_user_answer(consultation, user_answer):
 
 
 def is_consultation_complete(consultation):
-    """Проверка завершения консультации"""
-    return consultation['questions_asked'] >= 4
+    """Проверка завершения консультации: заданы все вопросы или специалист уже ясен"""
+    return (consultation['questions_asked'] >= MAX_CONSULTATION_QUESTIONS or
+            (bool(consultation.get('provisional_specialty')) and
+             consultation.get('confidence', 0.0) >= EARLY_STOP_CONFIDENCE))
+
+
+def get_consultation_recommendation(consultation):
+    """Итоговый специалист: уверенный предварительный ответ консультации без отдельного вызова LLM.
+
+    Ответ LLM с вызовом скорой (номер 103) заменяется на EMERGENCY_RECOMMENDATION: это не специальность
+    для поиска врача.
+    """
+    if consultation.get('provisional_specialty') and consultation.get('confidence', 0.0) >= EARLY_STOP_CONFIDENCE:
+        recommendation = consultation['provisional_specialty']
+    else:
+        recommendation = get_ai_recommendation(consultation['patient_info'])
+    return EMERGENCY_RECOMMENDATION if is_emergency_answer(recommendation) else recommendation
 
 
 def get_doctor_search_criteria(preliminary_specialty, additional_answers):
@@ -156,13 +499,12 @@ def get_final_doctor_recommendation(criteria_text):
         {"role": "user", "content": criteria_text}
     ]
 
-    return ask_question(final_messages)
-
+    return ask_question(final_messages, prompt_type='final_recommendation')
 
-def select_top_doctors(candidates_profiles: str, user_criteria: str, target_specialty: str,
-                       num_doctors: int = 5) -> str:
-    """Выбор топ врачей с помощью LLM на основе критериев пользователя"""
 
+def _select_top_doctors_messages(candidates_profiles: str, user_criteria: str, target_specialty: str,
+                                 num_doctors: int):
+    """Промпт выбора топ врачей"""
     system_prompt = f"""Ты - опытный медицинский консультант. Тебе нужно выбрать {num_doctors} лучших врачей из предложенных кандидатов.
 
 ЗАДАЧА:
@@ -196,19 +538,350 @@ def select_top_doctors(candidates_profiles: str, user_criteria: str, target_spec
 
 Выбери {num_doctors} лучших врачей и объясни свой выбор."""
 
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_content}
     ]
 
+
+def _numbered_profiles(shared: str, profiles: Sequence[str], indices: Sequence[int]) -> str:
+    return shared + "".join(f"[{number}] {profiles[i]}" for number, i in enumerate(indices, start=1))
+
+
+def _selection_messages(numbered_profiles: str, user_criteria: str, target_specialty: str, num_doctors: int):
+    """Промпт структурированного подбора: номера кандидатов и короткие причины в JSON"""
+    return [
+        {"role": "system", "content": f"""Ты - опытный медицинский консультант. Выбери из пронумерованных кандидатов {num_doctors} врачей, которые лучше всего подходят пациенту, и ранжируй их по релевантности.
+Учитывай специализацию, квалификацию, опыт, образование и отзывы, бери только предоставленную информацию, игнорируй орфографические ошибки.
+Ответь только JSON-массивом от лучшего к худшему, без текста вокруг:
+[{{"n": номер кандидата, "reason": "почему подходит, не больше 20 слов"}}]
+
+КРИТЕРИИ ПАЦИЕНТА:
+{user_criteria}"""},
+        {"role": "user", "content": f"Целевая специальность: {target_specialty}\n\nКандидаты:\n{numbered_profiles}"}
+    ]
+
+
+def parse_doctor_selection(answer: str, size: int, num_doctors: int) -> List[Dict]:
+    """Проверенный выбор из JSON-ответа: позиции кандидатов (с 0) и причины.
+
+    Номера вне списка кандидатов и повторы отбрасываются; пустой список - ответ не распознан.
+    """
+    match = JSON_ARRAY_RE.search(answer or '')
+    try:
+        items = json.loads(match.group(0)) if match else []
+    except ValueError:
+        items = []
+    selection, positions = [], set()
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            position = int(item.get('n')) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= position < size and position not in positions:
+            positions.add(position)
+            selection.append({'index': position, 'reason': str(item.get('reason') or '').strip()})
+    return selection[:num_doctors]
+
+
+def _selection_result(answer: str, indices: Sequence[int], num_doctors: int) -> Optional[List[Dict]]:
+    selection = parse_doctor_selection(answer, len(indices), num_doctors)
+    if not selection:
+        print(f"Не удалось разобрать выбор врачей: {answer!r}")
+        return None
+    return [{'index': indices[item['index']], 'reason': item['reason']} for item in selection]
+
+
+def needs_map_reduce(profiles: Sequence[str], shared: str = "") -> bool:
+    """Профили кандидатов длиннее порога выбора одним запросом"""
+    return estimate_tokens(shared) + sum(estimate_tokens(profile) for profile in profiles) > \
+        SELECTION_MAP_REDUCE_TOKENS
+
+
+def selection_chunks(profiles: Sequence[str], max_tokens: Optional[int] = None) -> List[List[int]]:
+    """Номера профилей, разделенные по порядку предранжирования на части не длиннее max_tokens
+    (по умолчанию SELECTION_CHUNK_TOKENS)"""
+    max_tokens = max_tokens or SELECTION_CHUNK_TOKENS
+    chunks, chunk, chunk_tokens = [], [], 0
+    for i, profile in enumerate(profiles):
+        tokens = estimate_tokens(profile)
+        if chunk and chunk_tokens + tokens > max_tokens:
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(i)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def _select_from(profiles: Sequence[str], indices: Sequence[int], shared: str, user_criteria: str,
+                       target_specialty: str, num_doctors: int, timeout: float, call: str) -> Optional[List[Dict]]:
+    """Выбор LLM среди профилей indices: [{'index': номер профиля, 'reason': ...}] (None - ошибка или ответ
+    не разобран)"""
+    messages = _selection_messages(_numbered_profiles(shared, profiles, indices), user_criteria, target_specialty,
+                                   num_doctors)
+    try:
+        answer = await _acompletion(call, messages, SELECTION_JSON_TOKENS_PER_DOCTOR * num_doctors + 20, timeout)
+    except Exception as e:
+        print(f"Ошибка при подборе врачей: {str(e)}")
+        return None
+    return _selection_result(answer, indices, num_doctors)
+
+
+async def _map_candidates(profiles: Sequence[str], shared: str, user_criteria: str, target_specialty: str,
+                          num_doctors: int, timeout: float) -> List[int]:
+    """Этап map: лучшие num_doctors из каждой части (часть без ответа LLM - первые по предранжированию)"""
+
+    async def shortlist(chunk: List[int]) -> List[int]:
+        if len(chunk) <= num_doctors:
+            return chunk
+        selection = await _select_from(profiles, chunk, shared, user_criteria, target_specialty, num_doctors,
+                                       timeout, 'select_top_doctors_map')
+        return [item['index'] for item in selection] if selection else chunk[:num_doctors]
+
+    shortlists = await asyncio.gather(*(shortlist(chunk) for chunk in selection_chunks(profiles)))
+    return sorted(i for chunk in shortlists for i in chunk)
+
+
+async def select_top_doctors_structured_async(profiles: Sequence[str], user_criteria: str, target_specialty: str,
+                                              num_doctors: int = 5, timeout: float = SELECT_TOP_DOCTORS_TIMEOUT,
+                                              shared: str = "",
+                                              map_reduce: Optional[bool] = None) -> Optional[List[Dict]]:
+    """Выбор топ врачей в виде [{'index': номер профиля в profiles, 'reason': ...}].
+
+    profiles и shared - профили кандидатов по отдельности и их общая строка (pack_profiles).
+    Карточки врачей строятся из каталога (doctor_scoring.selected_doctors), от LLM нужны только
+    номера и причины. None - LLM недоступна, не ответила за timeout секунд или ответ не разобран.
+    map_reduce: None - выбор в два этапа, если профили длиннее SELECTION_MAP_REDUCE_TOKENS,
+    True/False - принудительно (для замеров).
+    """
+    if map_reduce is None:
+        map_reduce = needs_map_reduce(profiles, shared)
+    indices = list(range(len(profiles)))
+    if map_reduce:
+        indices = await _map_candidates(profiles, shared, user_criteria, target_specialty, num_doctors, timeout)
+    return await _select_from(profiles, indices, shared, user_criteria, target_specialty, num_doctors, timeout,
+                              'select_top_doctors_structured')
+
+
+def select_top_doctors_structured(profiles: Sequence[str], user_criteria: str, target_specialty: str,
+                                  num_doctors: int = 5, timeout: float = SELECT_TOP_DOCTORS_TIMEOUT,
+                                  shared: str = "", map_reduce: Optional[bool] = None) -> Optional[List[Dict]]:
+    """Синхронный вариант select_top_doctors_structured_async"""
+    return client.run(select_top_doctors_structured_async(profiles, user_criteria, target_specialty, num_doctors,
+                                                          timeout, shared, map_reduce))
+
+
+async def select_top_doctors_async(candidates_profiles: str, user_criteria: str, target_specialty: str,
+                                   num_doctors: int = 5,
+                                   timeout: float = SELECT_TOP_DOCTORS_TIMEOUT) -> Optional[str]:
+    """Выбор топ врачей с помощью LLM на основе критериев пользователя.
+
+    Возвращает None, если LLM недоступна или не ответила за timeout секунд
+    (тогда показывается локальный рейтинг doctor_scoring.local_top_doctors).
+    """
+    messages = _select_top_doctors_messages(candidates_profiles, user_criteria, target_specialty, num_doctors)
+    try:
+        return await _acompletion('select_top_doctors', messages, 1500, timeout)  # 1500 - для подробного анализа
+    except Exception as e:
+        print(f"Ошибка при подборе врачей: {str(e)}")
+        return None
+
+
+def select_top_doctors(candidates_profiles: str, user_criteria: str, target_specialty: str,
+                       num_doctors: int = 5, timeout: float = SELECT_TOP_DOCTORS_TIMEOUT) -> Optional[str]:
+    """Синхронный вариант select_top_doctors_async"""
+    return client.run(select_top_doctors_async(candidates_profiles, user_criteria, target_specialty, num_doctors,
+                                               timeout))
+
+
+def select_top_doctors_stream(candidates_profiles: str, user_criteria: str, target_specialty: str,
+                              num_doctors: int = 5, timeout: float = SELECT_TOP_DOCTORS_TIMEOUT):
+    """Потоковый вариант select_top_doctors; возвращает (через StopIteration) True, если ответ получен целиком"""
+    messages = _select_top_doctors_messages(candidates_profiles, user_criteria, target_specialty, num_doctors)
+    try:
+        yield from _stream_completion('select_top_doctors', messages, 1500, timeout)
+        return True
+    except Exception as e:
+        print(f"Ошибка при подборе врачей: {str(e)}")
+        return False
+
+
+def _explanation_messages(profile: str, user_criteria: str, target_specialty: str):
+    """Промпт объяснения выбора одного врача"""
+    return [
+        {"role": "system", "content": f"""Ты - опытный медицинский консультант. Врач уже выбран для пациента, кратко объясни выбор.
+Бери только предоставленную информацию, не больше 60 слов.
+
+ФОРМАТ ОТВЕТА:
+Почему подходит: ...
+⭐ Ключевые преимущества: ...
+* отзывы пациентов: ... (если есть)
+
+КРИТЕРИИ ПАЦИЕНТА:
+{user_criteria}"""},
+        {"role": "user", "content": f"Целевая специальность: {target_specialty}\n\nПрофиль врача:\n{profile}"}
+    ]
+
+
+async def explain_doctor_async(profile: str, user_criteria: str, target_specialty: str,
+                               timeout: float = EXPLANATION_TIMEOUT) -> Optional[str]:
+    """Почему врач подходит пациенту (None - LLM недоступна, в карточке остается краткая причина)"""
+    messages = _explanation_messages(profile, user_criteria, target_specialty)
+    key = ask_cache_key(messages, EXPLANATION_MAX_TOKENS)
+    cached = ASK_CACHE.get(key)
+    if cached is not None:
+        return cached
     try:
-        response = client.chat.completions.create(
-            model=f"gpt://{YANDEX_CLOUD_FOLDER}/qwen3-235b-a22b-fp8/latest",
-            messages=messages,
-            max_tokens=1500,  # Увеличиваем для подробного анализа
-            temperature=0.3,
-            stream=False
-        )
-        return response.choices[0].message.content
+        answer = await _acompletion('explain_doctor', messages, EXPLANATION_MAX_TOKENS, timeout)
     except Exception as e:
-        return f"Ошибка при подборе врачей: {str(e)}"
+        print(f"Ошибка при объяснении выбора врача: {str(e)}")
+        return None
+    _cache_answer(key, answer, 'doctor_explanation')
+    return answer
+
+
+def explain_doctors(profiles: Sequence[str], user_criteria: str, target_specialty: str,
+                    timeout: float = EXPLANATION_TIMEOUT) -> Iterator[Tuple[int, Optional[str]]]:
+    """Объяснения для нескольких врачей параллельно: (номер профиля, текст) в порядке готовности.
+
+    Первое объяснение приходит через время одного короткого ответа, а не всего разбора топ врачей.
+    """
+    futures = {client.submit(explain_doctor_async(profile, user_criteria, target_specialty, timeout)): position
+               for position, profile in enumerate(profiles)}
+    for future in concurrent.futures.as_completed(futures):
+        yield futures[future], future.result()
+
+
+def _normalize_criteria(criteria: Optional[Dict]) -> Dict[str, str]:
+    """Критерии без пустых и 'не указано', в нижнем регистре и без лишних пробелов"""
+    normalized = {}
+    for key, value in (criteria or {}).items():
+        value = normalize_text(value or '').strip(' .,;!')
+        if value and value != 'не указано':
+            normalized[key] = value
+    return normalized
+
+
+def selection_cache_key(target_specialty: str, criteria: Optional[Dict], user_criteria: str, catalog_version,
+                        candidate_ids: Sequence[int], num_doctors: int, structured: bool = False) -> str:
+    """Ключ кэша подбора: специальность, критерии, текст критериев из промпта, версия каталога и набор кандидатов.
+
+    Текст критериев (user_criteria) входит в ключ целиком: в нем диагнозы и хронические заболевания,
+    по которым LLM пишет причины выбора, и ответ для одного пациента не должен достаться другому.
+    Кандидаты входят в ключ, потому что их отбор зависит и от жалоб (BM25, семантический поиск).
+    structured - ключ структурированного подбора (другой формат ответа).
+    """
+    parts = [normalize_text(target_specialty), _normalize_criteria(criteria), normalize_text(user_criteria),
+             catalog_version, sorted(int(row_id) for row_id in candidate_ids), num_doctors]
+    return canonical_key(*parts, 'structured') if structured else canonical_key(*parts)
+
+
+def _cached_selection(target_specialty: str, criteria: Optional[Dict], user_criteria: str, catalog_version,
+                      candidate_ids: Sequence[int], num_doctors: int, structured: bool = False) -> Tuple[str, object]:
+    """Ключ подбора в SELECTION_CACHE и готовый результат (None - в кэше нет)"""
+    SELECTION_CACHE.bind_version(catalog_version)
+    key = selection_cache_key(target_specialty, criteria, user_criteria, catalog_version, candidate_ids, num_doctors,
+                              structured)
+    return key, SELECTION_CACHE.get(key)
+
+
+def _store_selection(key: str, answer: Optional[str]) -> Optional[str]:
+    # Ошибки и таймауты не кэшируем, следующий пациент попробует снова
+    if answer:
+        SELECTION_CACHE.set(key, answer)
+    return answer
+
+
+def _check_profiles(profiles: Sequence[str], candidate_ids: Sequence[int]):
+    if len(profiles) != len(candidate_ids):
+        raise ValueError(f"Профилей {len(profiles)}, а кандидатов {len(candidate_ids)}: номера выбора не совпадут")
+
+
+def _store_structured_selection(key: str, selection: Optional[List[Dict]],
+                                candidate_ids: Sequence[int]) -> Optional[List[Dict]]:
+    if not selection:
+        return None
+    result = [{'row_id': int(candidate_ids[item['index']]), 'reason': item['reason']} for item in selection]
+    SELECTION_CACHE.set(key, result)
+    return result
+
+
+async def select_top_doctors_cached_async(candidates_profiles: str, user_criteria: str, target_specialty: str,
+                                          num_doctors: int, criteria: Optional[Dict], catalog_version,
+                                          candidate_ids: Sequence[int]) -> Optional[str]:
+    """select_top_doctors с общим кэшем: одинаковый подбор для разных пациентов не вызывает LLM повторно.
+
+    Отмена задачи прерывает запрос к LLM.
+    """
+    key, result = _cached_selection(target_specialty, criteria, user_criteria, catalog_version, candidate_ids,
+                                    num_doctors)
+    if result is not None:
+        return result
+    return _store_selection(key, await select_top_doctors_async(candidates_profiles, user_criteria,
+                                                                target_specialty, num_doctors))
+
+
+def select_top_doctors_cached(candidates_profiles: str, user_criteria: str, target_specialty: str,
+                              num_doctors: int, criteria: Optional[Dict], catalog_version,
+                              candidate_ids: Sequence[int]) -> Optional[str]:
+    """Синхронный вариант select_top_doctors_cached_async"""
+    return client.run(select_top_doctors_cached_async(candidates_profiles, user_criteria, target_specialty,
+                                                      num_doctors, criteria, catalog_version, candidate_ids))
+
+
+async def select_top_doctors_structured_cached_async(profiles: Sequence[str], user_criteria: str,
+                                                     target_specialty: str, num_doctors: int,
+                                                     criteria: Optional[Dict], catalog_version,
+                                                     candidate_ids: Sequence[int],
+                                                     shared: str = "") -> Optional[List[Dict]]:
+    """select_top_doctors_structured с общим кэшем: [{'row_id': номер строки каталога, 'reason': ...}].
+
+    Номера профилей переводятся в номера строк каталога (candidate_ids в порядке profiles),
+    поэтому выбор из кэша проверяется и отображается без повторного подбора кандидатов.
+    Отмена задачи прерывает запрос к LLM.
+    """
+    _check_profiles(profiles, candidate_ids)
+    key, result = _cached_selection(target_specialty, criteria, user_criteria, catalog_version, candidate_ids,
+                                    num_doctors, structured=True)
+    if result is not None:
+        return result
+    selection = await select_top_doctors_structured_async(profiles, user_criteria, target_specialty, num_doctors,
+                                                          shared=shared)
+    return _store_structured_selection(key, selection, candidate_ids)
+
+
+def select_top_doctors_structured_cached(profiles: Sequence[str], user_criteria: str, target_specialty: str,
+                                         num_doctors: int, criteria: Optional[Dict], catalog_version,
+                                         candidate_ids: Sequence[int], shared: str = "") -> Optional[List[Dict]]:
+    """Синхронный вариант select_top_doctors_structured_cached_async"""
+    return client.run(select_top_doctors_structured_cached_async(profiles, user_criteria, target_specialty,
+                                                                 num_doctors, criteria, catalog_version,
+                                                                 candidate_ids, shared))
+
+
+def stream_top_doctors_cached(candidates_profiles: str, user_criteria: str, target_specialty: str,
+                              num_doctors: int, criteria: Optional[Dict], catalog_version,
+                              candidate_ids: Sequence[int]) -> Iterator[str]:
+    """Потоковый select_top_doctors_cached: из кэша ответ отдается сразу целиком"""
+    key, result = _cached_selection(target_specialty, criteria, user_criteria, catalog_version, candidate_ids,
+                                    num_doctors)
+    if result is not None:
+        yield result
+        return
+
+    parts = []
+    stream = select_top_doctors_stream(candidates_profiles, user_criteria, target_specialty, num_doctors)
+    while True:
+        try:
+            text = next(stream)
+        except StopIteration as finished:
+            # Оборванный ответ не кэшируем
+            if finished.value and parts:
+                SELECTION_CACHE.set(key, "".join(parts))
+            return
+        parts.append(text)
+        yield text
@@ -1,19 +1,25 @@
 import streamlit as st
 from datetime import datetime
 from doctors import DoctorMatcher
-from ai_helper import select_top_doctors
+from doctor_scoring import format_doctor_card, format_local_recommendation
+from emergency_detector import EMERGENCY_RECOMMENDATION, EMERGENCY_WARNING, is_emergency_answer
+from specialty_resolver import SELECTABLE_SPECIALTIES, display_name
+from ai_helper import MAX_CONSULTATION_QUESTIONS, SELECT_TOP_DOCTORS_TIMEOUT
+from search_prefetch import (STRUCTURED_SELECTION, SearchPrefetcher, compute_search_results, final_top_doctors,
+                             refine_with_llm, search_results_key, stream_explanations, stream_refine_with_llm)
 import time
 from ai_helper import (
-    get_ai_recommendation,
+    get_consultation_recommendation,
     get_doctor_search_criteria,
     initialize_ai_consultation,
-    generate_next_question,
+    generate_next_question_stream,
     process_user_answer,
     is_consultation_complete
 )
 from voce_dialog import VoiceDialog
 from voice_additional_questions import VoiceAdditionalQuestions
 from complaints_collector import ComplaintsCollector
+from warmup import start_warmup
 
 # Настройки страницы
 st.set_page_config(
@@ -67,7 +73,16 @@ def reset_session():
         st.session_state.user_data = {}
 
 
+@st.cache_resource
+def start_server_warmup() -> bool:
+    """Прогрев процесса один раз на сервер, в фоне: каталог, соединения с LLM и SpeechKit,
+    озвучка постоянных фраз (при импорте модуля не запускается)"""
+    return start_warmup()
+
+
 def main():
+    start_server_warmup()
+
     # Заголовок приложения
     st.title("🏥 Медицинский консультант Лилу")
     st.markdown("---")
@@ -284,13 +299,8 @@ def show_doctor_name_input():
 def show_specialty_selection():
     """Выбор специализации врача"""
 
-    # Популярные медицинские специализации
-    specialties = [
-        "Терапевт", "Кардиолог", "Невролог", "Гастроэнтеролог", "Эндокринолог",
-        "Офтальмолог", "ЛОР", "Дерматолог", "Гинеколог", "Уролог",
-        "Травматолог", "Хирург", "Педиатр", "Психиатр", "Психолог",
-        "Стоматолог", "Онколог", "Аллерголог", "Ревматолог"
-    ]
+    # Популярные медицинские специализации (тот же словарь, по которому ищутся врачи)
+    specialties = [display_name(specialty_id) for specialty_id in SELECTABLE_SPECIALTIES]
 
     selected_specialty = st.selectbox(
         "Выберите специализацию врача:",
@@ -345,7 +355,7 @@ def show_symptoms_input():
                 voice_dialog.stop_dialog()
             # Запускаем текстовый сбор БЕЗ начальных данных
             if not text_collector.is_active:
-                text_collector.start_collection({})
+                text_collector.start_collection({}, generate_question=False)
             st.rerun()
 
     # ДОПОЛНИТЕЛЬНЫЕ ПОЛЯ (не обязательные)
@@ -393,7 +403,9 @@ def show_symptoms_input():
                         'age_gender': age_gender,
                         'main_symptoms': main_symptoms,
                     }
-                    text_collector.start_collection(initial_data)
+                    text_collector.start_collection(initial_data, generate_question=False)
+                    if text_collector.completed:  # Экстренный случай: вопросы не нужны
+                        save_text_collection_results(text_collector)
                 st.rerun()
 
     st.markdown("---")
@@ -412,7 +424,13 @@ def show_symptoms_input():
     elif voice_dialog.get_status() == "completed":
         st.success("✅ Голосовая консультация завершена!")
 
-        if voice_dialog.recommendation:
+        if is_emergency_answer(voice_dialog.recommendation):
+            # Вызов скорой - не специальность: подбор врача и уточняющие вопросы не нужны
+            st.error(f"🚨 **{EMERGENCY_RECOMMENDATION}**")
+            st.warning(EMERGENCY_WARNING)
+            st.session_state.user_data['recommendation'] = EMERGENCY_RECOMMENDATION
+            return
+        elif voice_dialog.recommendation:
             st.info(f"**Рекомендация:** {voice_dialog.recommendation}")
 
         # Сохраняем результаты
@@ -431,6 +449,18 @@ def show_symptoms_input():
         st.markdown("---")
 
 
+def save_text_collection_results(collector):
+    """Сохранение результатов текстового сбора жалоб и переход к уточняющим вопросам"""
+    try:
+        results = collector.get_results()
+        st.session_state.user_data['symptoms'] = results.get('symptoms_text', '')
+        st.session_state.user_data['recommendation'] = results.get('recommendation', 'Терапевт')
+        st.session_state.user_data['consultation_type'] = 'Текстовая консультация'
+        st.session_state.current_step = 6
+    except Exception as e:
+        st.error(f"Ошибка сохранения результатов: {e}")
+
+
 def show_text_complaints_collection(collector):
     """Отображение текстового сбора жалоб через LLM"""
     st.markdown("### 📝 Текстовая консультация с Лилу")
@@ -445,27 +475,28 @@ def show_text_complaints_collection(collector):
     # st.progress(progress)
     # st.write(f"Вопрос {collector.consultation['questions_asked'] + 1} из 2")
 
-    # Текущий вопрос
+    # Текущий вопрос (новый выводится по мере генерации)
     current_question = collector.get_current_question()
-    if current_question:
+    if current_question is None:
+        st.markdown("**Лилу:**")
+        st.write_stream(collector.stream_next_question())
+        current_question = collector.get_current_question()
+        if collector.completed:  # Специалист ясен, вопросов больше не нужно
+            save_text_collection_results(collector)
+            st.rerun()
+    else:
         st.info(f"**Лилу:** {current_question}")
 
+    if current_question:
+
         # Поле для ответа
         answer = st.text_input("Ваш ответ:", key=f"text_answer_{collector.consultation['questions_asked']}")
 
         if answer:
             if st.button("➡️ Ответить", type="primary"):
-                has_more = collector.process_answer(answer)
+                has_more = collector.process_answer(answer, generate_question=False)
                 if not has_more:  # Консультация завершена
-                    # Сохраняем результаты
-                    try:
-                        results = collector.get_results()
-                        st.session_state.user_data['symptoms'] = results.get('symptoms_text', '')
-                        st.session_state.user_data['recommendation'] = results.get('recommendation', 'Терапевт')
-                        st.session_state.user_data['consultation_type'] = 'Текстовая консультация'
-                        st.session_state.current_step = 6
-                    except Exception as e:
-                        st.error(f"Ошибка сохранения результатов: {e}")
+                    save_text_collection_results(collector)
                 st.rerun()
 
     # Кнопка остановки
@@ -524,26 +555,30 @@ def show_ai_consultation():
     consultation = st.session_state.ai_consultation
 
     # Прогресс бар
-    progress = consultation['questions_asked'] / 4
-    st.progress(progress)
-    st.write(f"Вопрос {consultation['questions_asked'] + 1} из 4")
+    if is_consultation_complete(consultation):
+        st.progress(1.0)
+    else:
+        st.progress(consultation['questions_asked'] / MAX_CONSULTATION_QUESTIONS)
+        st.write(f"Вопрос {consultation['questions_asked'] + 1} из {MAX_CONSULTATION_QUESTIONS}")
 
     # Если консультация не завершена
     if not is_consultation_complete(consultation):
 
-        # Генерируем вопрос, если его еще нет
+        # Генерируем вопрос, если его еще нет (текст выводится по мере генерации)
         if consultation['current_question'] is None:
-            with st.spinner("Лилу думает над вопросом..."):
-                if generate_next_question(consultation):
-                    st.rerun()
-                else:
-                    st.error("Не удалось сгенерировать вопрос")
-                    return
+            st.markdown("**Лилу:**")
+            st.write_stream(generate_next_question_stream(consultation))
+            if is_consultation_complete(consultation):  # Специалист ясен раньше
+                st.rerun()
+            if not consultation['current_question']:
+                st.error("Не удалось сгенерировать вопрос")
+                return
 
         # Показываем текущий вопрос
-        if consultation['current_question']:
+        elif consultation['current_question']:
             st.markdown(f"**Лилу:** {consultation['current_question']}")
 
+        if consultation['current_question']:
             # Поле для ответа
             answer = st.text_input("Ваш ответ:", key=f"answer_{consultation['questions_asked']}")
 
@@ -555,10 +590,10 @@ def show_ai_consultation():
                     st.rerun()
 
     else:
-        # Все вопросы заданы, получаем рекомендацию
+        # Все вопросы заданы (или специалист ясен раньше), получаем рекомендацию
         if 'final_recommendation' not in st.session_state:
             with st.spinner("Лилу анализирует ваши ответы..."):
-                recommendation = get_ai_recommendation(consultation['patient_info'])
+                recommendation = get_consultation_recommendation(consultation)
                 st.session_state.final_recommendation = recommendation
                 st.session_state.user_data['recommendation'] = recommendation
                 st.rerun()
@@ -582,15 +617,25 @@ def show_recommendation():
             'recommendation' not in st.session_state.user_data):
         consultation = st.session_state.ai_consultation
         with st.spinner("Лилу анализирует ваши симптомы..."):
-            recommendation = get_ai_recommendation(consultation['patient_info'])
+            recommendation = get_consultation_recommendation(consultation)
             st.session_state.user_data['recommendation'] = recommendation
             st.session_state.user_data['doctor_specialty'] = recommendation
             st.session_state.user_data['consultation_type'] = 'AI консультация'
 
+    # Угрожающие жизни симптомы: вместо подбора врача - вызов скорой
+    if is_emergency_answer(st.session_state.user_data.get('recommendation')):
+        st.session_state.user_data['recommendation'] = EMERGENCY_RECOMMENDATION
+        st.error(f"🚨 **{EMERGENCY_RECOMMENDATION}**")
+        st.warning(EMERGENCY_WARNING)
+        # Подбор врача не продолжается: уточняющие вопросы и поиск по тексту рекомендации не нужны
+        return
+
     # Показываем предварительную рекомендацию
     if st.session_state.user_data.get('recommendation'):
         st.success("✅ Предварительная диагностика завершена!")
         st.info(f"**Рекомендуемый специалист:** {st.session_state.user_data['recommendation']}")
+        # Специальность известна: кандидаты подбираются в фоне, пока пациент отвечает на вопросы
+        prefetch_search_results(with_llm=False)
 
     st.markdown("---")
     st.markdown("### 🎯 Уточнение критериев")
@@ -776,6 +821,9 @@ def show_additional_questions(voice=None):
             st.session_state.additional_answers.get('appointment_type')
     )
 
+    # Подбор в фоне уточняется с каждым ответом; разбор от LLM - когда заполнены основные поля
+    prefetch_search_results(with_llm=bool(required_fields_filled))
+
     # Кнопка продолжения
     st.markdown("---")
 
@@ -850,24 +898,68 @@ if 'doctor_matcher' not in st.session_state:
     st.session_state.doctor_matcher = DoctorMatcher('all_doctors.csv')  # укажите путь к вашему CSV
 
 
-def show_doctor_search_results():
-    """Показ результатов поиска врача с реальными кандидатами"""
-    st.subheader("Результаты подбора врача")
-
-    # Определяем специализацию
+def get_search_inputs():
+    """Специальность, критерии и текст запроса для подбора врача из текущей сессии"""
     if st.session_state.user_data.get('knows_doctor') == 'dont_know':
         target_specialty = st.session_state.user_data.get('recommendation', 'Терапевт')
     else:
         target_specialty = st.session_state.user_data.get('doctor_specialty', 'Терапевт')
 
-    # Получаем критерии пользователя
     additional_answers = st.session_state.get('additional_answers', {})
     criteria, criteria_text = get_doctor_search_criteria(target_specialty, additional_answers)
+    query_text = f"{st.session_state.user_data.get('symptoms', '')}\n{criteria_text}"
+    return target_specialty, criteria, criteria_text, query_text
+
+
+def get_search_prefetcher() -> SearchPrefetcher:
+    """Фоновый подбор врачей текущей сессии"""
+    if 'search_prefetcher' not in st.session_state:
+        st.session_state.search_prefetcher = SearchPrefetcher(st.session_state.doctor_matcher)
+    return st.session_state.search_prefetcher
+
 
-    # Шаг 1: Фильтруем врачей по специальности
-    with st.spinner("🔍 Лилу ищет подходящих врачей ..."):
-        filtered_df, candidates_profiles = st.session_state.doctor_matcher.get_filtered_candidates(target_specialty)
+def prefetch_search_results(with_llm: bool):
+    """Запуск подбора врачей в фоне по уже известным данным"""
+    get_search_prefetcher().submit(*get_search_inputs(), with_llm=with_llm)
 
+
+def show_doctor_cards(results, target_specialty, criteria_text):
+    """Карточки итоговых врачей: сразу с краткими причинами, подробные объяснения - по мере готовности"""
+    top = final_top_doctors(results)
+    doctors = top.to_dict('records')
+    explanations = results.get('explanations', {})
+    placeholders = []
+    for position, (row_id, doctor) in enumerate(zip(top.index, doctors), 1):
+        placeholder = st.empty()
+        placeholder.markdown(format_doctor_card(doctor, position, explanations.get(row_id)))
+        placeholders.append(placeholder)
+    for position, explanation in stream_explanations(results, target_specialty, criteria_text):
+        placeholders[position].markdown(format_doctor_card(doctors[position], position + 1, explanation))
+
+
+def show_doctor_search_results():
+    """Показ результатов поиска врача с реальными кандидатами"""
+    st.subheader("Результаты подбора врача")
+
+    target_specialty, criteria, criteria_text, query_text = get_search_inputs()
+
+    # Шаг 1: Фильтруем врачей по специальности и отбираем самых релевантных жалобам и критериям.
+    # Результаты хранятся в сессии: перерисовка страницы (нажатие кнопки) не повторяет поиск и вызов LLM.
+    # Если фоновый подбор уже посчитал результат для этих же ответов, страница открывается сразу
+    results_key = search_results_key(target_specialty, criteria, query_text,
+                                     st.session_state.doctor_matcher.catalog.version)
+    results = st.session_state.get('search_results')
+    if results is None or results['key'] != results_key:
+        results = get_search_prefetcher().result_for(results_key)
+        if results is not None:
+            results = dict(results)
+        else:
+            with st.spinner("🔍 Лилу ищет подходящих врачей ..."):
+                results = compute_search_results(st.session_state.doctor_matcher, target_specialty, criteria,
+                                                 criteria_text, query_text, with_llm=False)
+        st.session_state.search_results = results
+
+    filtered_df = results['filtered_df']
     if filtered_df.empty:
         st.error("❌ Не найдено врачей по указанной специальности")
         st.info("Попробуйте изменить критерии поиска или обратитесь к администратору")
@@ -884,19 +976,42 @@ def show_doctor_search_results():
         degrees = filtered_df['degree'].value_counts()
         st.metric("С ученой степенью", len(filtered_df[filtered_df['degree'] != 'none']))
 
-    # Шаг 3: Используем LLM для выбора лучших кандидатов
-    with st.spinner(" Лилу анализирует кандидатов и выбирает лучших..."):
-        top_doctors_recommendation = select_top_doctors(
-            candidates_profiles,
-            criteria_text,
-            target_specialty,
-            num_doctors=min(5, len(filtered_df))  # Не больше чем есть кандидатов
-        )
-
-    # Шаг 4: Показываем рекомендации AI
+    # Шаг 3: Мгновенный локальный рейтинг (без LLM), показываем сразу
+    local_top = results['local_top']
     st.markdown("---")
     st.markdown("### 🏆 Рекомендованные врачи")
-    st.success(top_doctors_recommendation)
+    # Локальный рейтинг виден, пока LLM выбирает; выбор LLM показывается вместо него, а не вторым списком
+    doctors_list = st.empty()
+    doctors_list.markdown(format_local_recommendation(local_top))
+
+    # Шаг 4: Подробный разбор от LLM поверх локального рейтинга (один раз на набор входных данных)
+    streamed = False
+    if not results['llm_done']:
+        with st.spinner(" Лилу анализирует кандидатов и готовит подробные объяснения..."):
+            # Разбор для этих ответов мог уже начаться в фоне - дожидаемся его вместо повторного вызова
+            prefetched = get_search_prefetcher().result_for(results_key, wait=SELECT_TOP_DOCTORS_TIMEOUT)
+        if prefetched is not None and prefetched['llm_done']:
+            results.update(recommendation=prefetched['recommendation'], selection=prefetched.get('selection'),
+                           llm_done=True)
+        elif STRUCTURED_SELECTION:
+            # Короткий JSON-ответ: ждать потока нечего, карточки строятся из каталога
+            with st.spinner(" Лилу сравнивает кандидатов..."):
+                refine_with_llm(results, target_specialty, criteria, criteria_text)
+        else:
+            # Разбор выводится по мере генерации
+            with st.expander("💬 Подробный разбор от Лилу", expanded=True):
+                st.write_stream(stream_refine_with_llm(results, target_specialty, criteria, criteria_text))
+            streamed = True
+
+    top_doctors_recommendation = results['recommendation']
+    if results.get('selection'):
+        with doctors_list.container():
+            show_doctor_cards(results, target_specialty, criteria_text)
+    elif top_doctors_recommendation and not streamed:
+        with st.expander("💬 Подробный разбор от Лилу", expanded=True):
+            st.success(top_doctors_recommendation)
+    elif not top_doctors_recommendation:
+        st.info("Подробные объяснения сейчас недоступны, показан рейтинг по квалификации, отзывам и вашим критериям")
 
     st.subheader("✅ Консультация завершена!")
 
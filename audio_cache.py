@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from result_cache import canonical_key
+
+
+class AudioCache:
+    """Файлы синтезированной речи на диске с адресацией по содержимому запроса.
+
+    Имя файла - SHA256 от всех параметров синтеза (текст, голос, скорость, формат), поэтому одна и та же
+    фраза синтезируется один раз на сервер и переживает перезапуск. Суммарный размер ограничен
+    max_bytes: при переполнении удаляются файлы, которые дольше всех не воспроизводились.
+    Каталог читается один раз при создании, дальше размеры и порядок использования файлов ведутся в памяти.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._files: 'OrderedDict[str, int]' = OrderedDict()  # Путь -> размер, от давно воспроизведенных
+        self._bytes = 0
+        self._creating: Dict[str, threading.Event] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key(*parts) -> str:
+        return canonical_key(*parts)
+
+    def path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, key: str, extension: str) -> Optional[str]:
+        """Путь к готовому файлу (None - фразы еще нет в кэше)"""
+        path = self.path(key, extension)
+        with self._lock:
+            if path in self._files:
+                try:
+                    os.utime(path)  # Время изменения - время последнего воспроизведения (порядок после перезапуска)
+                except OSError:
+                    self._bytes -= self._files.pop(path)  # Файл удален вне кэша
+                else:
+                    self._files.move_to_end(path)
+                    self.hits += 1
+                    return path
+            self.misses += 1
+            return None
+
+    def put(self, key: str, extension: str, data: bytes) -> str:
+        """Сохранение файла (атомарно: параллельный читатель не увидит недописанный файл)"""
+        path = self.path(key, extension)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes -= self._files.pop(path, 0)
+            self._files[path] = len(data)
+            self._bytes += len(data)
+            self._evict(keep=path)
+        return path
+
+    def get_or_create(self, key: str, extension: str, create: Callable[[], Optional[bytes]]) -> Optional[str]:
+        """Путь к файлу; при промахе содержимое получается из create (None - не удалось).
+
+        Одновременные промахи по одному ключу вызывают create один раз, остальные ждут его результата.
+        """
+        path = self.get(key, extension)
+        if path is not None:
+            return path
+        with self._lock:
+            if self.path(key, extension) in self._files:
+                return self.path(key, extension)  # Файл появился, пока проверяли кэш
+            event = self._creating.get(key)
+            leader = event is None
+            if leader:
+                event = self._creating[key] = threading.Event()
+        if not leader:
+            event.wait()
+            return self.get(key, extension)
+        try:
+            data = create()
+            return self.put(key, extension, data) if data else None
+        finally:
+            with self._lock:
+                self._creating.pop(key, None)
+            event.set()
+
+    def _scan(self):
+        """Файлы кэша с прошлых запусков, от давно воспроизведенных к недавним"""
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        for _, size, path in sorted(files):
+            self._files[path] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self, keep: Optional[str] = None):
+        """Удаление давно воспроизведенных файлов сверх max_bytes (вызывается под блокировкой)"""
+        for path in list(self._files):
+            if self._bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self._bytes -= self._files.pop(path)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий и промахов, размер кэша на диске"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._files),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
@@ -1,43 +1,128 @@
 from config import YANDEX_API_KEY, YANDEX_FOLDER_ID
 import os
+import tempfile
+import threading
+from typing import Dict, Optional, Sequence
+
 import requests
 from playsound import playsound
+from requests.adapters import HTTPAdapter
+
+from audio_cache import AudioCache
 
 # Данные для Яндекс SpeechKit
 API_KEY = YANDEX_API_KEY
 FOLDER_ID = YANDEX_FOLDER_ID
 
-
-def text_to_ogg(text: str, folder: str = "audio/questions") -> str:
-    os.makedirs(folder, exist_ok=True)
-
-    existing = [f for f in os.listdir(folder) if f.startswith("question_") and f.endswith(".ogg")]
-    next_index = len(existing) + 1
-
-    filename = os.path.join(folder, f"question_{next_index}.ogg")
-    url = 'https://tts.api.cloud.yandex.net/speech/v1/tts:synthesize'
+# Параметры синтеза речи (входят в ключ кэша фраз)
+TTS_URL = 'https://tts.api.cloud.yandex.net/speech/v1/tts:synthesize'
+TTS_LANG = 'ru-RU'
+TTS_VOICE = 'oksana'
+TTS_SPEED = '1.25'
+TTS_FORMAT = 'oggopus'  # Формат OGG Opus
+TTS_SAMPLE_RATE = 48000
+TTS_TIMEOUT = 30
+STT_URL = 'https://stt.api.cloud.yandex.net/speech/v1/stt:recognize'
+
+# Общая сессия SpeechKit: соединения (TCP и TLS) переиспользуются между запросами и потоками
+SPEECHKIT_POOL_SIZE = 8
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=SPEECHKIT_POOL_SIZE))
+
+# Кэш синтезированных фраз: постоянные фразы диалогов озвучиваются без обращения к SpeechKit.
+# В кэш попадают только постоянные фразы (FIXED_PHRASES диалогов): вопросы и рекомендации LLM
+# относятся к жалобам конкретного пациента и на диске не остаются
+TTS_CACHE_DIR = "audio/tts_cache"
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+TTS_EXTENSIONS = {'oggopus': 'ogg', 'mp3': 'mp3', 'lpcm': 'raw'}
+TTS_CACHE = AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+
+
+def synthesize(text: str, voice: str = TTS_VOICE, speed: str = TTS_SPEED,
+               audio_format: str = TTS_FORMAT) -> Optional[bytes]:
+    """Синтез речи в SpeechKit (None - ошибка API)"""
     headers = {'Authorization': f'Api-Key {API_KEY}'}
-
     data = {
         'folderId': FOLDER_ID,
         'text': text,
-        'lang': 'ru-RU',
-        'voice': 'oksana',
-        'speed': '1.25',
-        'format': 'oggopus',  # Формат OGG Opus
-        'sampleRateHertz': 48000,
+        'lang': TTS_LANG,
+        'voice': voice,
+        'speed': speed,
+        'format': audio_format,
+        'sampleRateHertz': TTS_SAMPLE_RATE,
     }
-
-    # Отправляем запрос и сохраняем аудио
-    response = requests.post(url, headers=headers, data=data)
-
-    if response.status_code == 200:
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-            playsound(filename)
+    response = SESSION.post(TTS_URL, headers=headers, data=data, timeout=TTS_TIMEOUT)
+    if response.status_code != 200:
+        print(f"Ошибка синтеза речи: {response.status_code} {response.text[:200]}")
+        return None
+    return response.content
+
+
+def speech_file(text: str, voice: str = TTS_VOICE, speed: str = TTS_SPEED,
+                audio_format: str = TTS_FORMAT) -> Optional[str]:
+    """Путь к аудио постоянной фразы: из кэша или после синтеза (None - синтез не удался)"""
+    key = AudioCache.key(text, voice, speed, audio_format, TTS_SAMPLE_RATE, TTS_LANG)
+    return TTS_CACHE.get_or_create(key, TTS_EXTENSIONS.get(audio_format, audio_format),
+                                   lambda: synthesize(text, voice, speed, audio_format))
+
+
+def presynthesize(texts: Sequence[str]) -> int:
+    """Синтез фраз, которых еще нет в кэше; возвращает число готовых фраз"""
+    ready = 0
+    for text in texts:
+        try:
+            ready += speech_file(text) is not None
+        except Exception as e:
+            print(f"Не удалось заранее синтезировать фразу: {e}")
+    return ready
+
+
+def presynthesize_in_background(texts: Sequence[str]) -> threading.Thread:
+    """presynthesize в фоновом потоке (следующие фразы готовы, пока звучит текущая)"""
+    thread = threading.Thread(target=presynthesize, args=(list(texts),), name='lilu-tts', daemon=True)
+    thread.start()
+    return thread
+
+
+def connect_speechkit() -> int:
+    """Открытие соединений с синтезом и распознаванием заранее; возвращает число доступных сервисов"""
+    connected = 0
+    for url in (TTS_URL, STT_URL):
+        try:
+            SESSION.head(url, timeout=TTS_TIMEOUT)  # Код ответа не важен, соединение остается в пуле
+            connected += 1
+        except requests.RequestException as e:
+            print(f"Нет соединения с SpeechKit {url}: {e}")
+    return connected
+
+
+def tts_cache_stats() -> Dict:
+    """Статистика кэша синтезированных фраз"""
+    return TTS_CACHE.stats()
+
+
+def text_to_ogg(text: str, cacheable: bool = False) -> bool:
+    """Озвучивание текста.
+
+    cacheable - постоянная фраза: берется из кэша без обращения к SpeechKit. Остальной текст
+    синтезируется во временный файл, который удаляется после воспроизведения.
+    """
+    if cacheable:
+        filename = speech_file(text)
+        if filename is None:
+            return False
+        playsound(filename)
         return True
-    else:
+    data = synthesize(text)
+    if data is None:
         return False
+    with tempfile.NamedTemporaryFile(suffix=f".{TTS_EXTENSIONS[TTS_FORMAT]}", delete=False) as f:
+        f.write(data)
+    try:
+        playsound(f.name)
+    finally:
+        os.remove(f.name)
+    return True
 
 
 def recognize_audio(audio_file, language='ru-RU'):
@@ -87,7 +172,7 @@ def recognize_audio(audio_file, language='ru-RU'):
     API_KEY = YANDEX_API_KEY
     FOLDER_ID = YANDEX_FOLDER_ID
 
-    url = 'https://stt.api.cloud.yandex.net/speech/v1/stt:recognize'
+    url = STT_URL
     headers = {'Authorization': f'Api-Key {API_KEY}'}
 
     print(f"🔍 Распознаю аудио: {audio_file}")
@@ -112,7 +197,7 @@ def recognize_audio(audio_file, language='ru-RU'):
             # В реальном приложении нужно обрезать аудио
             return "аудио слишком длинное"
 
-        response = requests.post(
+        response = SESSION.post(
             url,
             headers=headers,
             data=audio_data,
@@ -0,0 +1,188 @@
+"""Замеры производительности подбора врачей.
+
+Запуск:
+    python benchmark.py normalization [--catalog all_doctors.csv] [--repeat 20]
+    python benchmark.py prerank [--top-n 30] [--llm]
+    python benchmark.py semantic [--rows 100000]
+    python benchmark.py selection [--llm]
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from doctor_catalog import DEFAULT_CATALOG_PATH, normalize_catalog
+from doctor_embeddings import DoctorEmbeddings
+from doctors import PRERANK_TOP_N, DoctorMatcher
+from text_utils import estimate_tokens
+
+BENCH_SPECIALTIES = ['терапевт', 'хирург', 'невролог', 'гинеколог', 'педиатр']
+
+# Типовые жалобы и критерии для замеров ранжирования
+BENCH_QUERIES = {
+    'терапевт': "Основные жалобы: кашель и температура неделю, слабость\nТип пациента: взрослый",
+    'хирург': "Основные жалобы: боль в животе справа, грыжа\nТип пациента: взрослый мужчина 40 лет",
+    'невролог': "Основные жалобы: болит спина и немеет нога, головные боли\nТип пациента: взрослый",
+    'гинеколог': "Основные жалобы: планирование беременности, УЗИ\nТип пациента: женщина 30 лет",
+    'педиатр': "Основные жалобы: ребенок часто болеет, насморк\nТип пациента: ребенок 5 лет",
+}
+
+
+def _timed(func, repeat):
+    """Среднее время вызова в миллисекундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def _legacy_profile(doctor):
+    """Профиль врача в прежнем виде: очистка HTML и разбиение специализаций на каждый запрос"""
+    profile = f"Врач: {doctor.get('name', 'Не указано')}\n"
+    for field, label in (('spec', 'Специальность'), ('doctor_specialization', 'Ключевая специализация')):
+        if not pd.isna(doctor.get(field)):
+            profile += f"{label}: {doctor[field]}\n"
+    if not pd.isna(doctor.get('specialities')):
+        clean_text = re.sub('<[^<]+?>', '', str(doctor['specialities']))
+        specialties = [spec.strip().lower() for spec in re.split(',|;|и', clean_text) if spec.strip()]
+        profile += f"Дополнительные специализации: {', '.join(specialties)}\n"
+    for field, label in (('doctor_category', 'Категория'), ('degree', 'Ученая степень'), ('gender', 'Пол'),
+                         ('education', 'Образование')):
+        if not pd.isna(doctor.get(field)):
+            profile += f"{label}: {doctor[field]}\n"
+    for field, label, limit in (('education_add', 'Дополнительное образование', 200),
+                                ('detail_text', 'Описание', 300), ('Обобщенный_отзыв', 'Отзывы', 250)):
+        if not pd.isna(doctor.get(field)):
+            profile += f"{label}: {re.sub('<[^<]+?>', '', str(doctor[field]))[:limit]}...\n"
+    return profile + "---\n"
+
+
+def bench_normalization(args):
+    """Предрасчет нормализованных колонок против очистки на каждый запрос"""
+    raw_df = pd.read_csv(args.catalog)
+    started = time.perf_counter()
+    normalize_catalog(raw_df.copy())
+    normalize_ms = (time.perf_counter() - started) * 1000
+
+    matcher = DoctorMatcher(args.catalog)
+    print(f"Нормализация каталога ({len(raw_df)} врачей) при загрузке: {normalize_ms:.1f} мс, один раз")
+    print(f"{'специальность':<15}{'кандидатов':>12}{'до, мс':>10}{'после, мс':>12}")
+    for specialty in BENCH_SPECIALTIES:
+        candidates = matcher.filter_by_specialty(specialty)
+        raw_candidates = raw_df.loc[candidates.index]
+        legacy_ms = _timed(
+            lambda: "".join(_legacy_profile(doctor) for _, doctor in raw_candidates.iterrows()), args.repeat)
+        current_ms = _timed(lambda: matcher.get_filtered_candidates(specialty), args.repeat)
+        print(f"{specialty:<15}{len(candidates):>12}{legacy_ms:>10.2f}{current_ms:>12.2f}")
+
+
+def _timed_once(func):
+    """Результат и время одного вызова в миллисекундах"""
+    started = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def bench_prerank(args):
+    """Размер промпта и время подготовки кандидатов без BM25 и с отбором top-N"""
+    matcher = DoctorMatcher(args.catalog)
+    print(f"{'специальность':<15}{'кандидатов':>12}{'токенов до':>12}{'после':>8}"
+          f"{'мс до':>8}{'после':>8}{'LLM до, с':>11}{'после':>8}")
+    for specialty, query in BENCH_QUERIES.items():
+        full = lambda: matcher.get_filtered_candidates(specialty, query_text=query, top_n=None, token_budget=None)
+        ranked = lambda: matcher.get_filtered_candidates(specialty, query_text=query, top_n=args.top_n)
+        full_ms = _timed(full, args.repeat)
+        ranked_ms = _timed(ranked, args.repeat)
+        (full_df, full_profiles), (ranked_df, ranked_profiles) = full(), ranked()
+
+        llm_full = llm_ranked = ''
+        if args.llm:
+            from ai_helper import select_top_doctors
+            _, llm_full_ms = _timed_once(lambda: select_top_doctors(full_profiles, query, specialty))
+            _, llm_ranked_ms = _timed_once(lambda: select_top_doctors(ranked_profiles, query, specialty))
+            llm_full, llm_ranked = f"{llm_full_ms / 1000:.1f}", f"{llm_ranked_ms / 1000:.1f}"
+
+        print(f"{specialty:<15}{len(full_df):>12}{estimate_tokens(full_profiles):>12}"
+              f"{estimate_tokens(ranked_profiles):>8}{full_ms:>8.1f}{ranked_ms:>8.1f}{llm_full:>11}{llm_ranked:>8}")
+
+
+def bench_semantic(args):
+    """Задержка семантического поиска на текущем каталоге и на каталоге размера --rows"""
+    matcher = DoctorMatcher(args.catalog)
+    embeddings, build_ms = _timed_once(lambda: matcher.catalog.embeddings)
+    print(f"Эмбеддинги {embeddings.matrix.shape} {embeddings.matrix.dtype}: {build_ms:.1f} мс "
+          f"(0, если взяты из скомпилированного каталога)")
+
+    # Каталог размера --rows: строки текущей матрицы повторяются (важны только размеры)
+    repeats = -(-args.rows // len(embeddings.matrix))
+    large = DoctorEmbeddings(np.tile(embeddings.matrix, (repeats, 1))[:args.rows], embeddings.idf)
+    print(f"Матрица на {args.rows} врачей: {large.matrix.nbytes / 2 ** 20:.1f} МБ")
+    print(f"{'запрос':<45}{'мс':>8}{f'мс на {args.rows}':>16}  лучшие специальности")
+    for query in BENCH_QUERIES.values():
+        query = query.split('\n')[0]
+        ms = _timed(lambda: matcher.semantic_candidates(query, 5), args.repeat)
+        large_ms = _timed(lambda: large.search(query, 5), args.repeat)
+        specs = ', '.join(matcher.semantic_candidates(query, 5)['spec'].astype(str))
+        print(f"{query[:44]:<45}{ms:>8.2f}{large_ms:>16.2f}  {specs}")
+
+
+def _late_share(selection, size):
+    """Доля выбранных врачей из второй половины списка кандидатов (кандидаты в конце длинного промпта
+    чаще теряются)"""
+    return f"{sum(item['index'] >= size / 2 for item in selection)}/{len(selection)}" if selection else '-'
+
+
+def bench_selection(args):
+    """Структурированный выбор одним запросом против выбора в два этапа (map-reduce): размер промптов,
+    с --llm - задержка, совпадение выбранных врачей и доля выбранных из второй половины списка"""
+    from ai_helper import needs_map_reduce, select_top_doctors_structured, selection_chunks
+    matcher = DoctorMatcher(args.catalog)
+    print(f"{'специальность':<15}{'кандидатов':>12}{'токенов':>9}{'авто':>12}{'частей':>8}"
+          f"{'1 запрос, с':>13}{'2 этапа, с':>12}{'совпадение':>12}{'2-я пол. 1/2':>14}")
+    for specialty, query in BENCH_QUERIES.items():
+        filtered_df, _ = matcher.get_filtered_candidates(specialty, query_text=query, verbose=False)
+        blocks = filtered_df.attrs['profile_blocks']
+        profiles, shared = blocks['profiles'], blocks['shared']
+        tokens = filtered_df.attrs['profiles']['tokens']
+        mode = 'map-reduce' if needs_map_reduce(profiles, shared) else '1 запрос'
+
+        single_s = map_reduce_s = overlap = late = ''
+        if args.llm:
+            num_doctors = min(5, len(profiles))
+            single, single_ms = _timed_once(lambda: select_top_doctors_structured(
+                profiles, query, specialty, num_doctors, shared=shared, map_reduce=False))
+            reduced, map_reduce_ms = _timed_once(lambda: select_top_doctors_structured(
+                profiles, query, specialty, num_doctors, shared=shared, map_reduce=True))
+            single_s, map_reduce_s = f"{single_ms / 1000:.1f}", f"{map_reduce_ms / 1000:.1f}"
+            picked = [{item['index'] for item in selection or []} for selection in (single, reduced)]
+            overlap = f"{len(picked[0] & picked[1])}/{num_doctors}"
+            late = f"{_late_share(single, len(profiles))} {_late_share(reduced, len(profiles))}"
+
+        print(f"{specialty:<15}{len(profiles):>12}{tokens:>9}{mode:>12}{len(selection_chunks(profiles)):>8}"
+              f"{single_s:>13}{map_reduce_s:>12}{overlap:>12}{late:>14}")
+
+
+BENCHMARKS = {
+    'normalization': bench_normalization,
+    'prerank': bench_prerank,
+    'semantic': bench_semantic,
+    'selection': bench_selection,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности подбора врачей")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--top-n', type=int, default=PRERANK_TOP_N)
+    parser.add_argument('--llm', action='store_true', help="дополнительно замерить вызовы LLM")
+    parser.add_argument('--rows', type=int, default=100000, help="размер каталога для замера семантического поиска")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Компиляция каталога врачей в бинарный файл для быстрого старта через mmap.
+
+Запуск:
+    python catalog_compiler.py [--doctors all_doctors.csv] [--reviews "отзывы - Лист1.csv"] [--output all_doctors.lilu]
+
+Приложение само открывает all_doctors.lilu, если он собран из текущих версий CSV,
+иначе читает CSV как раньше.
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from compiled_catalog import compiled_path_for, write_compiled_catalog
+from doctor_catalog import (
+    DEFAULT_CATALOG_PATH,
+    catalog_sources,
+    merge_reviews,
+    normalize_catalog,
+    reviews_path_for,
+)
+from doctor_embeddings import embed_catalog
+from doctor_index import SpecialtyIndex
+
+
+def compile_catalog(doctors_path: str, reviews_path: str, output_path: str) -> dict:
+    """Нормализация CSV, построение индекса и эмбеддингов, запись бинарного каталога"""
+    started = time.perf_counter()
+    df = normalize_catalog(merge_reviews(pd.read_csv(doctors_path), reviews_path))
+    index = SpecialtyIndex.from_dataframe(df)
+    embeddings = embed_catalog(df)
+    size = write_compiled_catalog(df, index, output_path, catalog_sources(doctors_path, reviews_path), embeddings)
+    return {
+        'output': output_path,
+        'rows': len(df),
+        'terms': len(index.postings),
+        'embedding_dim': embeddings.dim,
+        'bytes': size,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Компиляция каталога врачей в бинарный формат")
+    parser.add_argument('--doctors', default=DEFAULT_CATALOG_PATH)
+    parser.add_argument('--reviews', default=None, help="по умолчанию таблица отзывов рядом с каталогом")
+    parser.add_argument('--output', default=None, help="по умолчанию <каталог>.lilu")
+    args = parser.parse_args()
+
+    reviews_path = args.reviews or reviews_path_for(args.doctors)
+    output_path = args.output or compiled_path_for(args.doctors)
+    print(f"Каталог скомпилирован: {compile_catalog(args.doctors, reviews_path, output_path)}")
+
+
+if __name__ == "__main__":
+    main()
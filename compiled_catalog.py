@@ -0,0 +1,341 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+import pandas as pd
+
+from doctor_embeddings import DoctorEmbeddings, embed_catalog
+from doctor_index import INDEX_FIELDS, BaseSpecialtyIndex, SpecialtyIndex, trigrams
+
+# Формат файла: MAGIC, длина заголовка (uint64), JSON-заголовок, блоки данных с выравниванием 8 байт
+MAGIC = b'LILUCAT1'
+FORMAT_VERSION = 2
+COMPILED_SUFFIX = '.lilu'
+ALIGNMENT = 8
+
+# Колонки-списки хранятся строкой с разделителем
+LIST_COLUMNS = ('specialities_list', 'tokens')
+LIST_SEPARATOR = '\x1f'
+
+# Числовые колонки хранятся массивами numpy (вид колонки -> dtype), пропуски в float64 - NaN
+NUMERIC_KINDS = {'int64': np.int64, 'float64': np.float64, 'bool': np.bool_}
+
+
+def compiled_path_for(csv_path: str) -> str:
+    """Путь к скомпилированному каталогу рядом с CSV"""
+    return os.path.splitext(csv_path)[0] + COMPILED_SUFFIX
+
+
+def file_digest(path: str) -> Optional[str]:
+    """SHA1 содержимого файла (None, если файла нет)"""
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _BlockWriter:
+    """Накопление бинарных блоков; в заголовок попадают их смещения"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, data: bytes) -> List[int]:
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        padding = -self.size % ALIGNMENT
+        if padding:
+            self.chunks.append(b'\0' * padding)
+            self.size += padding
+        return [offset, len(data)]
+
+    def add_array(self, array: np.ndarray) -> Dict:
+        array = np.ascontiguousarray(array)
+        return {'dtype': array.dtype.str, 'count': len(array), 'block': self.add(array.tobytes())}
+
+    def add_matrix(self, matrix: np.ndarray) -> Dict:
+        matrix = np.ascontiguousarray(matrix)
+        return {'dtype': matrix.dtype.str, 'shape': list(matrix.shape), 'block': self.add(matrix.tobytes())}
+
+    def add_strings(self, values: Sequence[Optional[str]]) -> Dict:
+        encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        if encoded:
+            np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        spec = {'offsets': self.add_array(offsets), 'data': self.add(b''.join(encoded))}
+        nulls = np.array([value is None for value in values], dtype=np.uint8)
+        if nulls.any():
+            spec['nulls'] = self.add_array(nulls)
+        return spec
+
+    def add_postings(self, postings: Dict[str, Iterable[int]]) -> Dict:
+        keys = sorted(postings)
+        lists = [np.array(sorted(postings[key]), dtype=np.int32) for key in keys]
+        offsets = np.zeros(len(keys) + 1, dtype=np.uint64)
+        if lists:
+            np.cumsum([len(rows) for rows in lists], out=offsets[1:])
+        rows = np.concatenate(lists) if lists else np.zeros(0, dtype=np.int32)
+        return {'keys': self.add_strings(keys), 'offsets': self.add_array(offsets), 'rows': self.add_array(rows)}
+
+
+def _numeric_kind(values: pd.Series) -> Optional[str]:
+    """Вид числовой колонки (None - колонка хранится строками)"""
+    if pd.api.types.is_bool_dtype(values):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(values) and not values.isna().any():
+        return 'int64'
+    if pd.api.types.is_numeric_dtype(values):
+        return 'float64'  # Дробные и целые с пропусками (nullable Int64)
+    return None
+
+
+def write_compiled_catalog(df: pd.DataFrame, index: SpecialtyIndex, output_path: str,
+                           sources: Dict[str, Optional[str]], embeddings: Optional[DoctorEmbeddings] = None) -> int:
+    """Запись нормализованного каталога, индекса и эмбеддингов в колоночный бинарный файл; возвращает размер"""
+    writer = _BlockWriter()
+    columns = {}
+    for column in df.columns:
+        if str(column).startswith('Unnamed'):
+            continue
+        kind = _numeric_kind(df[column])
+        if column in LIST_COLUMNS:
+            values = [LIST_SEPARATOR.join(items) for items in df[column]]
+            columns[column] = {'kind': 'str_list', **writer.add_strings(values)}
+        elif kind == 'float64':
+            columns[column] = {'kind': kind, **writer.add_array(df[column].to_numpy(np.float64, na_value=np.nan))}
+        elif kind:
+            columns[column] = {'kind': kind, **writer.add_array(df[column].to_numpy(NUMERIC_KINDS[kind]))}
+        else:
+            values = [None if pd.isna(value) else str(value) for value in df[column]]
+            columns[column] = {'kind': 'str', **writer.add_strings(values)}
+
+    # Триграммы ссылаются на номера слов в отсортированном словаре
+    term_ids = {term: term_id for term_id, term in enumerate(sorted(index.postings))}
+    trigram_terms = {trigram: [term_ids[term] for term in terms] for trigram, terms in index.trigram_terms.items()}
+    header = {
+        'format': FORMAT_VERSION,
+        'rows': len(df),
+        'sources': sources,
+        'columns': columns,
+        'index': {
+            'fields': list(INDEX_FIELDS),
+            'postings': writer.add_postings(index.postings),
+            'phrases': writer.add_postings(index.phrases),
+            'trigrams': writer.add_postings(trigram_terms),
+        },
+    }
+    if embeddings is not None:
+        header['embeddings'] = {'matrix': writer.add_matrix(embeddings.matrix), 'idf': writer.add_array(embeddings.idf)}
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (-(len(MAGIC) + 8 + len(header_bytes)) % ALIGNMENT)
+
+    # Пишем во временный файл и подменяем: процессы со старым mmap дочитывают прежнюю версию
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for chunk in writer.chunks:
+            f.write(chunk)
+    os.replace(tmp_path, output_path)
+    return os.path.getsize(output_path)
+
+
+def _mapped_array(buffer, base: int, spec: Dict) -> np.ndarray:
+    """Массив numpy поверх mmap без копирования"""
+    return np.frombuffer(buffer, dtype=np.dtype(spec['dtype']), count=spec['count'], offset=base + spec['block'][0])
+
+
+class _MappedStrings(Sequence):
+    """Строковая колонка в mmap: строки декодируются только при обращении"""
+
+    def __init__(self, buffer, base: int, spec: Dict):
+        self._buffer = buffer
+        self._offsets = _mapped_array(buffer, base, spec['offsets'])
+        self._data = base + spec['data'][0]
+        self._nulls = _mapped_array(buffer, base, spec['nulls']) if 'nulls' in spec else None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if self._nulls is not None and self._nulls[i]:
+            return None
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._buffer[self._data + start:self._data + end].decode('utf-8')
+
+
+class _MappedPostings:
+    """Постинг-листы в mmap: отсортированные ключи и номера строк в формате CSR"""
+
+    def __init__(self, buffer, base: int, spec: Dict):
+        self.keys = _MappedStrings(buffer, base, spec['keys'])
+        self._offsets = _mapped_array(buffer, base, spec['offsets'])
+        self._rows = _mapped_array(buffer, base, spec['rows'])
+
+    def at(self, position: int) -> np.ndarray:
+        return self._rows[int(self._offsets[position]):int(self._offsets[position + 1])]
+
+    def get(self, key: str) -> np.ndarray:
+        # Бинарный поиск по ключам, декодируются только ~log2(N) строк
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.at(position)
+        return self._rows[:0]
+
+
+class MappedSpecialtyIndex(BaseSpecialtyIndex):
+    """Индекс специальностей поверх скомпилированного файла"""
+
+    def __init__(self, postings: _MappedPostings, phrases: _MappedPostings, trigram_terms: _MappedPostings,
+                 row_columns: List[_MappedStrings], size: int):
+        super().__init__()
+        self.postings = postings
+        self.phrases = phrases
+        self.trigram_terms = trigram_terms
+        self._row_columns = row_columns
+        self.size = size
+
+    def vocabulary(self) -> Iterable[str]:
+        return iter(self.postings.keys)
+
+    def terms_with_trigram(self, trigram: str) -> Set[str]:
+        return {self.postings.keys[int(term_id)] for term_id in self.trigram_terms.get(trigram)}
+
+    def term_rows(self, term: str) -> Set[int]:
+        return set(self.postings.get(term).tolist())
+
+    def row_texts(self, row_id: int) -> Sequence[Optional[str]]:
+        return tuple(column[row_id] or None for column in self._row_columns)
+
+    def rows_for_phrase(self, phrase: str) -> Set[int]:
+        return set(self.phrases.get(phrase.strip().lower()).tolist())
+
+
+class CompiledDoctorCatalog:
+    """Каталог врачей из скомпилированного файла, открытого через mmap (страницы общие для процессов)"""
+
+    def __init__(self, path: str, version=None):
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: не является скомпилированным каталогом врачей")
+        header_size = struct.unpack_from('<Q', self._buffer, len(MAGIC))[0]
+        base = len(MAGIC) + 8 + header_size
+        header = json.loads(self._buffer[len(MAGIC) + 8:base].decode('utf-8'))
+        if header.get('format') != FORMAT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемая версия формата {header.get('format')}")
+
+        self.source_path = path
+        self.version = version
+        self.sources = header['sources']
+        self._rows = header['rows']
+        self._columns = {}
+        for name, spec in header['columns'].items():
+            if spec['kind'] in NUMERIC_KINDS:
+                self._columns[name] = (spec['kind'], _mapped_array(self._buffer, base, spec))
+            else:
+                self._columns[name] = (spec['kind'], _MappedStrings(self._buffer, base, spec))
+
+        index = header['index']
+        row_columns = [self._columns[f'lower_{field}'][1] for field in index['fields']]
+        self.index = MappedSpecialtyIndex(
+            _MappedPostings(self._buffer, base, index['postings']),
+            _MappedPostings(self._buffer, base, index['phrases']),
+            _MappedPostings(self._buffer, base, index['trigrams']),
+            row_columns,
+            self._rows,
+        )
+        self._embeddings = None
+        if 'embeddings' in header:
+            spec = header['embeddings']['matrix']
+            rows, dim = spec['shape']
+            matrix = np.frombuffer(self._buffer, dtype=np.dtype(spec['dtype']), count=rows * dim,
+                                   offset=base + spec['block'][0]).reshape(rows, dim)
+            self._embeddings = DoctorEmbeddings(matrix, _mapped_array(self._buffer, base, header['embeddings']['idf']))
+        self._df = None
+        self._df_lock = threading.Lock()
+        self.load_seconds = time.perf_counter() - started
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    def column_values(self, name: str, row_ids: Sequence[int]) -> List:
+        """Значения одной колонки для выбранных строк"""
+        kind, column = self._columns[name]
+        if kind in NUMERIC_KINDS:
+            return column[list(row_ids)].tolist()
+        if kind == 'str_list':
+            return [column[i].split(LIST_SEPARATOR) if column[i] else [] for i in row_ids]
+        return [column[i] for i in row_ids]
+
+    def attribute(self, name: str) -> np.ndarray:
+        """Числовая колонка по всему каталогу прямо из mmap (для масок фильтров)"""
+        kind, column = self._columns[name]
+        if kind not in NUMERIC_KINDS:
+            raise ValueError(f"Колонка {name} не числовая")
+        return column
+
+    def take(self, row_ids: Sequence[int]) -> pd.DataFrame:
+        """DataFrame только по нужным строкам (остальные строки не декодируются)"""
+        row_ids = list(row_ids)
+        data = {}
+        for name, (kind, column) in self._columns.items():
+            if kind in NUMERIC_KINDS:
+                data[name] = column[row_ids]  # Числовые колонки сохраняют тип (float64 с NaN, bool)
+            else:
+                data[name] = self.column_values(name, row_ids)
+        return pd.DataFrame(data, index=row_ids, columns=list(self._columns))
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Полный DataFrame; строится при первом обращении"""
+        if self._df is None:
+            with self._df_lock:
+                if self._df is None:
+                    self._df = self.take(range(self._rows))
+        return self._df
+
+    @property
+    def embeddings(self) -> DoctorEmbeddings:
+        """Матрица эмбеддингов врачей прямо из mmap (в старых файлах без нее - строится при первом обращении)"""
+        if self._embeddings is None:
+            with self._df_lock:
+                if self._embeddings is None:
+                    self._embeddings = embed_catalog(self.take(range(self._rows)))
+        return self._embeddings
+
+    @property
+    def memory_bytes(self) -> int:
+        """Память процесса сверх общих страниц mmap (только материализованный DataFrame)"""
+        return int(self._df.memory_usage(deep=True).sum()) if self._df is not None else 0
+
+    def stats(self) -> Dict:
+        """Статистика загрузки каталога"""
+        return {
+            'source': self.source_path,
+            'format': 'compiled',
+            'rows': self._rows,
+            'version': self.version,
+            'load_seconds': round(self.load_seconds, 4),
+            'mapped_bytes': len(self._buffer),
+            'memory_bytes': self.memory_bytes,
+        }
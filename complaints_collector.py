@@ -1,10 +1,13 @@
 from ai_helper import (
+    MAX_CONSULTATION_QUESTIONS,
     initialize_ai_consultation,
     generate_next_question,
+    generate_next_question_stream,
     process_user_answer,
     is_consultation_complete,
-    get_ai_recommendation
+    get_consultation_recommendation
 )
+from emergency_detector import EMERGENCY_RECOMMENDATION, detect_emergency
 
 
 class ComplaintsCollector:
@@ -16,9 +19,14 @@ class ComplaintsCollector:
         self.is_active = False
         self.completed = False
         self.initial_data = {}
+        self.emergency = None
 
-    def start_collection(self, initial_data):
-        """Начало сбора жалоб через LLM с учетом начальных данных"""
+    def start_collection(self, initial_data, generate_question=True):
+        """Начало сбора жалоб через LLM с учетом начальных данных.
+
+        generate_question=False - первый вопрос не генерируется сразу, а выводится потоком
+        через stream_next_question (текстовый интерфейс).
+        """
         self.initial_data = initial_data
         self.consultation = initialize_ai_consultation(self._compile_initial_info())
         self.user_answers = []
@@ -26,10 +34,18 @@ class ComplaintsCollector:
         self.is_active = True
         self.completed = False
         self.current_question = None
+        self.emergency = None
 
-        # Генерируем первый вопрос
-        if generate_next_question(self.consultation):
-            self.current_question = self.consultation['current_question']
+        # Угрожающие жизни симптомы в начальных данных: сразу скорая, без вопросов LLM
+        if self._check_emergency(" ".join(str(value) for value in initial_data.values() if value)):
+            return
+
+        # Генерируем первый вопрос (специалист может быть ясен уже по начальным данным)
+        if generate_question:
+            if generate_next_question(self.consultation):
+                self.current_question = self.consultation['current_question']
+            else:
+                self._complete_consultation()
 
     def _compile_initial_info(self):
         """Компиляция начальной информации для LLM"""
@@ -46,18 +62,23 @@ class ComplaintsCollector:
         else:
             return "Пациент обратился за консультацией"
 
-    def process_answer(self, answer):
-        """Обработка ответа пользователя"""
+    def process_answer(self, answer, generate_question=True):
+        """Обработка ответа пользователя (generate_question=False - см. start_collection)"""
         if not self.is_active or not self.consultation:
             return False
 
         self.user_answers.append(answer)
         self.consultation = process_user_answer(self.consultation, answer)
+        if self._check_emergency(answer):
+            return False
 
         # Генерируем следующий вопрос или завершаем
         if is_consultation_complete(self.consultation):
             self._complete_consultation()
             return False
+        elif not generate_question:
+            self.current_question = None
+            return True
         else:
             if generate_next_question(self.consultation):
                 self.current_question = self.consultation['current_question']
@@ -66,10 +87,33 @@ class ComplaintsCollector:
                 self._complete_consultation()
                 return False
 
+    def _check_emergency(self, text):
+        """Локальная проверка на угрожающие жизни симптомы; при находке консультация завершается"""
+        emergency = detect_emergency(text)
+        if not emergency:
+            return False
+        print(f"Экстренный случай ({emergency['category']}): {emergency['phrase']}")
+        self.emergency = emergency
+        self.recommendation = EMERGENCY_RECOMMENDATION
+        self.current_question = None
+        self.completed = True
+        self.is_active = False
+        return True
+
+    def stream_next_question(self):
+        """Потоковая генерация следующего вопроса; по окончании он становится текущим"""
+        if not self.is_active:
+            return
+        yield from generate_next_question_stream(self.consultation)
+        if self.consultation['current_question']:
+            self.current_question = self.consultation['current_question']
+        else:
+            self._complete_consultation()
+
     def _complete_consultation(self):
         """Завершение консультации и получение рекомендации"""
         try:
-            self.recommendation = get_ai_recommendation(self.consultation['patient_info'])
+            self.recommendation = get_consultation_recommendation(self.consultation)
             self.completed = True
             self.is_active = False
         except Exception as e:
@@ -85,7 +129,9 @@ class ComplaintsCollector:
         """Получение прогресса"""
         if not self.consultation:
             return 0
-        return self.consultation['questions_asked'] / 4
+        if self.completed:
+            return 1
+        return self.consultation['questions_asked'] / MAX_CONSULTATION_QUESTIONS
 
     def stop_collection(self):
         """Остановка сбора жалоб"""
@@ -96,6 +142,7 @@ class ComplaintsCollector:
         """Получение результатов"""
         return {
             'recommendation': self.recommendation,
+            'emergency': self.emergency,
             'answers': self.user_answers,
             'consultation_data': self.consultation,
             'symptoms_text': self._compile_symptoms_text(),
@@ -0,0 +1,73 @@
+from typing import Dict, List
+
+from text_utils import clip_tokens, estimate_tokens
+
+# Бюджет токенов истории консультации (жалобы и шаги диалога, без системного промпта).
+# При превышении старые шаги сжимаются в краткую сводку, последние передаются целиком
+CONTEXT_TOKEN_BUDGET = 600
+KEEP_RECENT_TURNS = 2
+
+# Ограничения длины: исходные жалобы, один ответ (длинные расшифровки голосовых ответов),
+# шаг в сводке и сводка целиком
+MAX_SYMPTOMS_TOKENS = 300
+MAX_ANSWER_TOKENS = 150
+SUMMARY_QUESTION_TOKENS = 20
+SUMMARY_ANSWER_TOKENS = 40
+MAX_SUMMARY_TOKENS = 250
+
+
+def _summary_line(turn: Dict) -> str:
+    answer = clip_tokens(turn['answer'], SUMMARY_ANSWER_TOKENS)
+    if not turn['question']:
+        return f"- {answer}"
+    return f"- {clip_tokens(turn['question'], SUMMARY_QUESTION_TOKENS)} — {answer}"
+
+
+def _summary(turns: List[Dict]) -> str:
+    """Структурированная сводка сжатых шагов; при переполнении остаются самые поздние"""
+    lines = [_summary_line(turn) for turn in turns]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > MAX_SUMMARY_TOKENS:
+        lines.pop(0)
+    return "Ранее выяснено:\n" + "\n".join(lines)
+
+
+def _history_tokens(symptoms: str, summary: str, recent: List[Dict]) -> int:
+    parts = [symptoms, summary] + [turn['question'] or '' for turn in recent] + [turn['answer'] for turn in recent]
+    return sum(estimate_tokens(part) for part in parts if part)
+
+
+def update_context(consultation: Dict) -> Dict:
+    """Пересборка messages и patient_info консультации в пределах CONTEXT_TOKEN_BUDGET.
+
+    Шаги (вопрос и ответ) хранятся в consultation['turns']; самые старые сжимаются в сводку,
+    пока история не уложится в бюджет (последние KEEP_RECENT_TURNS шагов не сжимаются).
+    Число сжатых шагов только растет, поэтому начало промпта не меняется от шага к шагу.
+    """
+    symptoms = clip_tokens(consultation['symptoms'], MAX_SYMPTOMS_TOKENS)
+    turns = [dict(turn, answer=clip_tokens(turn['answer'], MAX_ANSWER_TOKENS)) for turn in consultation['turns']]
+
+    compacted = consultation.get('compacted_turns', 0)
+    while compacted < len(turns) - KEEP_RECENT_TURNS:
+        summary = _summary(turns[:compacted]) if compacted else ''
+        if _history_tokens(symptoms, summary, turns[compacted:]) <= CONTEXT_TOKEN_BUDGET:
+            break
+        compacted += 1
+    summary = _summary(turns[:compacted]) if compacted else ''
+
+    messages = [consultation['messages'][0],
+                {"role": "user", "content": f"{symptoms}\n\n{summary}" if summary else symptoms}]
+    for turn in turns[compacted:]:
+        if turn['question']:
+            messages.append({"role": "assistant", "content": turn['question']})
+        messages.append({"role": "user", "content": turn['answer']})
+
+    answers = [clip_tokens(turn['answer'], SUMMARY_ANSWER_TOKENS) for turn in turns[:compacted]]
+    answers += [turn['answer'] for turn in turns[compacted:]]
+    while len(answers) > KEEP_RECENT_TURNS and \
+            estimate_tokens(". ".join([symptoms] + answers)) > CONTEXT_TOKEN_BUDGET:
+        answers.pop(0)
+    consultation['messages'] = messages
+    consultation['patient_info'] = ". ".join([symptoms] + answers)
+    consultation['compacted_turns'] = compacted
+    consultation['context_tokens'] = sum(estimate_tokens(message['content']) for message in messages)
+    return consultation
@@ -0,0 +1,217 @@
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+import numpy as np
+
+from compiled_catalog import COMPILED_SUFFIX, CompiledDoctorCatalog, compiled_path_for, file_digest
+from doctor_embeddings import DoctorEmbeddings, embed_catalog
+from doctor_filters import add_attribute_columns
+from doctor_index import INDEX_FIELDS, SpecialtyIndex
+from text_utils import clean_html, split_specialties, tokenize
+
+DEFAULT_CATALOG_PATH = 'all_doctors.csv'
+
+# Таблица обобщенных отзывов лежит рядом с каталогом
+DEFAULT_REVIEWS_NAME = 'отзывы - Лист1.csv'
+
+# Колонки с отзывами в порядке приоритета (в разных выгрузках называются по-разному)
+REVIEW_COLUMNS = ('отзыв', 'reviews', 'Обобщенный_отзыв')
+
+# Поля, которые в профиле врача выводятся очищенными от HTML
+CLEAN_FIELDS = ('education_add', 'detail_text')
+
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    """Версия файла каталога: время изменения и размер"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def reviews_path_for(csv_path: str) -> str:
+    """Путь к таблице отзывов рядом с CSV каталога"""
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), DEFAULT_REVIEWS_NAME)
+
+
+def catalog_sources(csv_path: str, reviews_path: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Контрольные суммы исходных файлов каталога"""
+    return {
+        'doctors': file_digest(csv_path),
+        'reviews': file_digest(reviews_path or reviews_path_for(csv_path)),
+    }
+
+
+def merge_reviews(df: pd.DataFrame, reviews_path: str) -> pd.DataFrame:
+    """Подстановка обобщенных отзывов из отдельной таблицы по id врача"""
+    if not os.path.exists(reviews_path) or 'id' not in df.columns:
+        return df
+    reviews = pd.read_csv(reviews_path).dropna().drop_duplicates('ID_врача')
+    summary = df['id'].map(reviews.set_index('ID_врача')['Обобщенный_отзыв'])
+    if 'Обобщенный_отзыв' in df.columns:
+        summary = summary.where(summary.notna(), df['Обобщенный_отзыв'])
+    df['Обобщенный_отзыв'] = summary
+    return df
+
+
+def _clean_column(df: pd.DataFrame, field: str) -> pd.Series:
+    """Очищенная от HTML колонка; пропуски и 'none' превращаются в пустую строку"""
+    if field not in df.columns:
+        return pd.Series([''] * len(df), index=df.index, dtype=object)
+    return df[field].map(lambda value: '' if pd.isna(value) or value == 'none' else clean_html(value))
+
+
+def normalize_catalog(df: pd.DataFrame) -> pd.DataFrame:
+    """Нормализация текстовых колонок один раз при загрузке каталога.
+
+    clean_* - текст без HTML для профилей, lower_* - он же в нижнем регистре для поиска,
+    specialities_list - список специализаций, tokens - слова всех поисковых полей,
+    числовые атрибуты для структурных фильтров - см. doctor_filters.ATTRIBUTE_COLUMNS.
+    """
+    for field in CLEAN_FIELDS:
+        df[f'clean_{field}'] = _clean_column(df, field)
+
+    review = pd.Series([''] * len(df), index=df.index, dtype=object)
+    for column in reversed(REVIEW_COLUMNS):
+        candidate = _clean_column(df, column)
+        review = candidate.where(candidate != '', review)
+    df['clean_review'] = review
+
+    for field in INDEX_FIELDS:
+        clean = df[f'clean_{field}'] if field in CLEAN_FIELDS else _clean_column(df, field)
+        df[f'lower_{field}'] = clean.str.lower()
+
+    df['specialities_list'] = df['lower_specialities'].map(split_specialties)
+    lower_columns = [f'lower_{field}' for field in INDEX_FIELDS]
+    df['tokens'] = [tokenize(' '.join(texts)) for texts in zip(*(df[column] for column in lower_columns))]
+    return add_attribute_columns(df)
+
+
+class DoctorCatalog:
+    """Каталог врачей только для чтения, один на процесс и общий для всех сессий"""
+
+    def __init__(self, df: pd.DataFrame, source_path: str, version: Optional[Tuple[int, int]],
+                 load_seconds: float = 0.0):
+        self.df = df
+        self.source_path = source_path
+        self.version = version
+        self.index = SpecialtyIndex.from_dataframe(df)
+        self.load_seconds = load_seconds
+        self._embeddings = None
+        self._embeddings_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, csv_path: str) -> 'DoctorCatalog':
+        """Чтение CSV (с отзывами из отдельной таблицы) и построение индекса"""
+        started = time.perf_counter()
+        version = _file_version(csv_path)
+        try:
+            df = normalize_catalog(merge_reviews(pd.read_csv(csv_path), reviews_path_for(csv_path)))
+        except FileNotFoundError:
+            df = pd.DataFrame()
+        catalog = cls(df, csv_path, version)
+        catalog.load_seconds = time.perf_counter() - started
+        return catalog
+
+    @property
+    def rows(self) -> int:
+        return len(self.df)
+
+    def take(self, row_ids: Sequence[int]) -> pd.DataFrame:
+        """Строки каталога по номерам"""
+        return self.df.iloc[list(row_ids)]
+
+    def attribute(self, name: str) -> np.ndarray:
+        """Числовая колонка по всему каталогу (для масок фильтров)"""
+        return self.df[name].to_numpy()
+
+    @property
+    def embeddings(self) -> DoctorEmbeddings:
+        """Матрица эмбеддингов врачей; строится при первом семантическом поиске"""
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    self._embeddings = embed_catalog(self.df)
+        return self._embeddings
+
+    @property
+    def memory_bytes(self) -> int:
+        """Примерный объем памяти каталога: DataFrame, постинг-листы индекса и эмбеддинги"""
+        df_bytes = int(self.df.memory_usage(deep=True).sum())
+        index_bytes = sum(sys.getsizeof(rows) for rows in self.index.postings.values())
+        index_bytes += sum(sys.getsizeof(rows) for rows in self.index.phrases.values())
+        embedding_bytes = self._embeddings.nbytes if self._embeddings is not None else 0
+        return df_bytes + index_bytes + embedding_bytes
+
+    def stats(self) -> Dict:
+        """Статистика загрузки каталога"""
+        return {
+            'source': self.source_path,
+            'format': 'csv',
+            'rows': self.rows,
+            'version': self.version,
+            'load_seconds': round(self.load_seconds, 4),
+            'memory_bytes': self.memory_bytes,
+        }
+
+
+AnyCatalog = Union[DoctorCatalog, CompiledDoctorCatalog]
+
+_catalogs: Dict[str, AnyCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def _open_catalog(path: str) -> AnyCatalog:
+    """Скомпилированный каталог, если он собран из текущих CSV, иначе чтение CSV"""
+    if path.endswith(COMPILED_SUFFIX):
+        return CompiledDoctorCatalog(path, _file_version(path))
+    compiled_path = compiled_path_for(path)
+    if os.path.exists(compiled_path):
+        try:
+            catalog = CompiledDoctorCatalog(compiled_path, _file_version(path))
+            if catalog.sources == catalog_sources(path):
+                return catalog
+            print(f"Скомпилированный каталог {compiled_path} устарел, читаем CSV")
+        except (OSError, ValueError) as e:
+            print(f"Не удалось открыть скомпилированный каталог {compiled_path}: {e}")
+    return DoctorCatalog.load(path)
+
+
+def _is_fresh(catalog: Optional[AnyCatalog], path: str) -> bool:
+    """Каталог загружен и соответствует текущей версии файла"""
+    return catalog is not None and catalog.version == _file_version(path)
+
+
+def _load_and_swap(path: str) -> AnyCatalog:
+    """Загрузка новой версии каталога и атомарная замена ссылки на нее"""
+    catalog = _open_catalog(path)
+    _catalogs[path] = catalog
+    print(f"Каталог врачей загружен: {catalog.stats()}")
+    return catalog
+
+
+def get_catalog(csv_path: str = DEFAULT_CATALOG_PATH) -> AnyCatalog:
+    """Общий каталог процесса; загружается один раз и перечитывается, если файл изменился"""
+    path = os.path.abspath(csv_path)
+    catalog = _catalogs.get(path)
+    if _is_fresh(catalog, path):
+        return catalog
+    with _catalogs_lock:
+        # Пока ждали блокировку, каталог мог перезагрузить другой поток
+        catalog = _catalogs.get(path)
+        if _is_fresh(catalog, path):
+            return catalog
+        return _load_and_swap(path)
+
+
+def reload_catalog(csv_path: str = DEFAULT_CATALOG_PATH) -> AnyCatalog:
+    """Принудительная перезагрузка каталога; сессии со старой ссылкой дорабатывают на прежней версии"""
+    path = os.path.abspath(csv_path)
+    with _catalogs_lock:
+        return _load_and_swap(path)
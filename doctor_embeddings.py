@@ -0,0 +1,190 @@
+import re
+import zlib
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from doctor_ranking import QUERY_STOP_WORDS
+from text_utils import normalize_text, stem, tokenize
+
+# Размерность хешированных эмбеддингов. Матрица хранится в int8 (значение * EMBEDDING_SCALE): 256 байт
+# на врача, 100k врачей ~ 25 МБ в mmap, поиск ~ 7 мс на запрос (benchmark.py semantic)
+EMBEDDING_DIM = 256
+EMBEDDING_SCALE = 127
+NGRAM_SIZE = 3
+
+# Строк матрицы на одно умножение: int8 переводится в float32 частями, которые помещаются в кэш процессора
+SEARCH_BLOCK_ROWS = 512
+
+# Основа слова весит больше отдельной триграммы: совпадение целого слова надежнее
+STEM_WEIGHT = 3.0
+
+# Из длинных описаний берем начало: специализация и основные заболевания обычно в первых абзацах
+MAX_DETAIL_CHARS = 600
+
+# Поля профиля и веса их признаков: специальность и специализации весят больше описания опыта,
+# в котором много общих слов (отзывы в эмбеддинг не входят)
+EMBEDDING_FIELDS = (
+    ('lower_spec', 4.0),
+    ('lower_doctor_specialization', 2.0),
+    ('lower_specialities', 2.0),
+    ('lower_detail_text', 1.0),
+)
+
+
+# Общие слова жалоб, которые встречаются в описаниях врачей любых специальностей (в эмбеддингах врачей
+# не учитываются, локальный классификатор специальности их по-прежнему видит)
+COMPLAINT_STOP_WORDS = {'болит', 'болят', 'болело', 'болела', 'болел', 'боль', 'боли', 'болью', 'беспокоит',
+                        'сильно', 'сильная', 'сильные', 'плохо', 'часто', 'постоянно'}
+EMBEDDING_STOP_WORDS = QUERY_STOP_WORDS | COMPLAINT_STOP_WORDS
+
+# Бытовые слова жалоб, которых нет в профилях врачей: запрос дополняется названиями специальности
+# (текст в нижнем регистре, ё заменена на е)
+QUERY_EXPANSIONS = {
+    'лор': [
+        r'\bух[оауе]\b', r'\bуш(и|ей|ах|ам|ами|н\w*)\b', r'\bгорл', r'\bнос(а|у|ом)?\b', r'насморк', r'гаймор',
+        r'ангин', r'миндалин', r'\bслух',
+    ],
+    'травматолог ортопед': [
+        r'\bколен', r'\bсустав', r'перелом', r'вывих', r'растяжени', r'\bплеч', r'\bлок(оть|тя|тем)', r'лодыж',
+        r'\bстоп[аеуы]\b', r'ушиб', r'\bтравм',
+    ],
+    'стоматолог': [r'\bзуб', r'\bдесн', r'\bчелюст', r'кариес', r'пломб'],
+    'психотерапевт психиатр психолог': [r'тревог', r'тревожн', r'бессонниц', r'депресс', r'паник', r'стресс'],
+    'дерматолог': [
+        r'\bкож[аеиу]', r'\bсып', r'прыщ', r'\bакне\b', r'родинк', r'\bзуд', r'экзем', r'псориаз',
+        r'выпадени\w*\s+волос',
+    ],
+    'кардиолог': [r'\bсердц', r'сердечн', r'аритми', r'\bпульс', r'давлени'],
+    'терапевт': [r'\bкаш(ел|ля)', r'температур', r'простуд', r'\bгрипп', r'\bорви\b', r'слабост'],
+    'невролог': [
+        r'\bспин[аеуы]\b', r'поясниц', r'головн\w*\s+бол', r'голов[аеу]\s+(болит|кружит)', r'(болит|кружится)\s+голов',
+        r'мигрен', r'онемени', r'немеет', r'головокружени',
+    ],
+    'гастроэнтеролог': [r'\bживот', r'желуд', r'изжог', r'тошнот', r'\bпечен', r'кишечн', r'запор', r'понос', r'диаре'],
+    'офтальмолог окулист': [r'\bглаз', r'\bзрени', r'\bвижу\b', r'\bвид(ит|еть)\b'],
+    'уролог': [r'\bпочк', r'мочеиспускан', r'простат'],
+    'гинеколог': [r'месячн', r'менструа', r'беременн', r'\bматк'],
+    'эндокринолог': [r'щитовид', r'диабет', r'\bсахар', r'гормон'],
+    'аллерголог': [r'аллерги'],
+    'педиатр': [r'\bребен', r'\bмалыш', r'\bдет(и|ей|ск\w*)\b'],
+}
+QUERY_EXPANSION_RES = [(re.compile('|'.join(patterns)), terms) for terms, patterns in QUERY_EXPANSIONS.items()]
+
+# Вес добавленных названий специальностей: они совпадают с полем spec, а короткие бытовые слова
+# ("ухо", "нос") по триграммам совпадают почти с чем угодно
+EXPANSION_WEIGHT = 2.0
+
+
+def query_fields(text: str) -> List[Tuple[str, float]]:
+    """Текст запроса и названия специальностей для его бытовых слов ("болит ухо" -> "лор ...") с весами"""
+    normalized = normalize_text(text)
+    terms = [terms for pattern, terms in QUERY_EXPANSION_RES if pattern.search(normalized)]
+    return [(normalized, 1.0)] + ([(' '.join(terms), EXPANSION_WEIGHT)] if terms else [])
+
+
+def _features(text: str, stop_words: Set[str]) -> Iterable[Tuple[str, float]]:
+    """Признаки текста с весами: символьные триграммы слов и основы слов"""
+    for token in tokenize(text):
+        if token in stop_words or token.isdigit():
+            continue
+        padded = f" {token} "
+        for i in range(len(padded) - NGRAM_SIZE + 1):
+            yield padded[i:i + NGRAM_SIZE], 1.0
+        yield f"w:{stem(token)}", STEM_WEIGHT
+
+
+def weighted_counts(fields: Iterable[Tuple[str, float]], dim: int = EMBEDDING_DIM,
+                    stop_words: Set[str] = EMBEDDING_STOP_WORDS) -> np.ndarray:
+    """Сглаженные частоты признаков нескольких текстов с весами по корзинам хеша (без сети и моделей)"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for text, field_weight in fields:
+        for feature, weight in _features(normalize_text(text), stop_words):
+            vector[zlib.crc32(feature.encode('utf-8')) % dim] += weight * field_weight
+    return np.log1p(vector)
+
+
+def hashed_counts(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Сглаженные частоты признаков текста по корзинам хеша (признаки локального классификатора специальности)"""
+    return weighted_counts([(text, 1.0)], dim, QUERY_STOP_WORDS)
+
+
+def _normalized(matrix: np.ndarray) -> np.ndarray:
+    """L2-нормировка строк (нулевые строки остаются нулевыми)"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def quantize(matrix: np.ndarray) -> np.ndarray:
+    """L2-нормированные неотрицательные строки в int8 (значение * EMBEDDING_SCALE)"""
+    return np.rint(matrix * EMBEDDING_SCALE).astype(np.int8)
+
+
+class DoctorEmbeddings:
+    """Эмбеддинги врачей: L2-нормированные строки TF-IDF по хешированным признакам и веса IDF корзин.
+
+    Матрица в int8 (quantize); float32-матрица (каталоги, скомпилированные до квантования) тоже поддерживается.
+    """
+
+    def __init__(self, matrix: np.ndarray, idf: np.ndarray):
+        self.matrix = matrix
+        self.idf = idf
+        self.scale = EMBEDDING_SCALE if matrix.dtype == np.int8 else 1
+
+    @classmethod
+    def build(cls, documents: Sequence[Sequence[Tuple[str, float]]], dim: int = EMBEDDING_DIM) -> 'DoctorEmbeddings':
+        """Построение по полям профилей с весами (офлайн при компиляции каталога или один раз при загрузке CSV)"""
+        counts = np.zeros((len(documents), dim), dtype=np.float32)
+        for i, fields in enumerate(documents):
+            counts[i] = weighted_counts(fields, dim)
+        doc_freq = (counts > 0).sum(axis=0)
+        idf = (np.log((1 + len(documents)) / (1 + doc_freq)) + 1).astype(np.float32)
+        return cls(quantize(_normalized(counts * idf)), idf)
+
+    @property
+    def dim(self) -> int:
+        return self.idf.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.idf.nbytes
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Вектор запроса в том же пространстве (с названиями специальностей для бытовых слов жалоб)"""
+        return _normalized(weighted_counts(query_fields(text), self.dim) * self.idf).astype(np.float32)
+
+    def scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """Косинусная близость всех врачей к вектору запроса"""
+        if self.matrix.dtype != np.int8:
+            return self.matrix @ query_vector
+        scores = np.empty(len(self.matrix), dtype=np.float32)
+        block = np.empty((SEARCH_BLOCK_ROWS, self.dim), dtype=np.float32)
+        for start in range(0, len(self.matrix), SEARCH_BLOCK_ROWS):
+            rows = self.matrix[start:start + SEARCH_BLOCK_ROWS]
+            np.copyto(block[:len(rows)], rows, casting='unsafe')
+            np.dot(block[:len(rows)], query_vector, out=scores[start:start + len(rows)])
+        return scores / self.scale
+
+    def search(self, query: str, top_k: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Ближайшие врачи по косинусной близости: умножение матрицы на вектор запроса"""
+        if not len(self.matrix) or top_k <= 0:
+            return []
+        scores = self.scores(self.embed_query(query))
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(row_id), float(scores[row_id])) for row_id in best if scores[row_id] > min_score]
+
+
+def doctor_fields(df: pd.DataFrame) -> List[List[Tuple[str, float]]]:
+    """Поля профиля врача с весами для эмбеддинга (из нормализованных колонок каталога)"""
+    columns = [df[field].tolist() if field in df.columns else [''] * len(df) for field, _ in EMBEDDING_FIELDS]
+    weights = [weight for _, weight in EMBEDDING_FIELDS]
+    return [[((value or '')[:MAX_DETAIL_CHARS], weight) for value, weight in zip(values, weights)]
+            for values in zip(*columns)]
+
+
+def embed_catalog(df: pd.DataFrame, dim: Optional[int] = None) -> DoctorEmbeddings:
+    """Эмбеддинги всех врачей каталога"""
+    return DoctorEmbeddings.build(doctor_fields(df), dim or EMBEDDING_DIM)
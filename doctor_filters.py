@@ -0,0 +1,186 @@
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Производные числовые атрибуты врача: считаются при загрузке каталога, фильтры - маски numpy по ним
+GENDER_CODES = {'male': 1, 'female': 2}
+CATEGORY_LEVELS = {'second': 1, 'first': 2, 'high': 3}
+DEGREE_LEVELS = {'Ph.D.Medicine': 1, 'Ph.D.Psychologic': 1, 'D.Medicine': 2}
+ATTRIBUTE_COLUMNS = ('gender_code', 'category_level', 'degree_level', 'graduation_year', 'treats_children')
+
+YEAR_RE = re.compile(r'\b(19[5-9]\d|20[0-4]\d)\b')
+CHILDREN_RE = re.compile(r'детск|детей|педиатр|подрост|неонатолог')
+
+# Разбор свободного текста ответов на уточняющие вопросы
+NOT_IMPORTANT_RE = re.compile(r'не\s*важ|неваж|без\s+разниц|все\s*равно|всё\s*равно|любо|не\s*нуж|не\s*обязат')
+FEMALE_RE = re.compile(r'женщ|женск|девушк')
+MALE_RE = re.compile(r'мужчин|мужск')
+DOCTOR_OF_SCIENCE_RE = re.compile(r'доктор\w*\s+(медицинских\s+)?наук|профессор|д\.\s*м\.\s*н')
+ANY_DEGREE_RE = re.compile(r'кандидат|к\.\s*м\.\s*н|учен\w*\s+степен|степен|учен')
+HIGH_CATEGORY_RE = re.compile(r'высш\w*\s+категор')
+FIRST_CATEGORY_RE = re.compile(r'перв\w*\s+категор')
+EXPERIENCED_RE = re.compile(r'опытн|большим\s+опыт|стаж')
+YOUNG_RE = re.compile(r'молод')
+MIN_YEARS_RE = re.compile(r'(\d+)\s*\+?\s*(лет|год)')
+CHILD_PATIENT_RE = re.compile(r'ребен|ребён|дет|дочь|дочер|сын|малыш|подрост|младен|школьн')
+
+EXPERIENCED_YEARS = 10
+
+
+def add_attribute_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Производные атрибуты для структурной фильтрации (один раз при загрузке каталога)"""
+    def codes(column, mapping):
+        if column not in df.columns:
+            return np.zeros(len(df), dtype=np.int64)
+        return df[column].map(mapping).fillna(0).to_numpy(np.int64)
+
+    df['gender_code'] = codes('gender', GENDER_CODES)
+    df['category_level'] = codes('doctor_category', CATEGORY_LEVELS)
+    df['degree_level'] = codes('degree', DEGREE_LEVELS)
+
+    education = df['education'] if 'education' in df.columns else pd.Series([''] * len(df), index=df.index)
+    df['graduation_year'] = [
+        min((int(year) for year in YEAR_RE.findall(str(text))), default=0) if not pd.isna(text) else 0
+        for text in education
+    ]
+
+    search_columns = [column for column in ('lower_spec', 'lower_specialities', 'lower_doctor_specialization',
+                                            'lower_detail_text') if column in df.columns]
+    df['treats_children'] = [
+        int(bool(CHILDREN_RE.search(' '.join(texts)))) for texts in zip(*(df[column] for column in search_columns))
+    ] if search_columns else 0
+    return df
+
+
+def _answer(criteria: Dict, key: str) -> str:
+    """Текст ответа в нижнем регистре ('' если не указан)"""
+    value = criteria.get(key) or ''
+    return '' if value == 'не указано' else value.lower()
+
+
+def parse_criteria(criteria: Dict) -> Dict:
+    """Структурные предпочтения из словаря get_doctor_search_criteria"""
+    prefs = {'gender': None, 'min_degree': 0, 'min_category': 0, 'min_years': None, 'experienced': False,
+             'young': False, 'child': False}
+
+    gender = _answer(criteria, 'doctor_gender')
+    if gender and not NOT_IMPORTANT_RE.search(gender):
+        if FEMALE_RE.search(gender):
+            prefs['gender'] = GENDER_CODES['female']
+        elif MALE_RE.search(gender):
+            prefs['gender'] = GENDER_CODES['male']
+
+    degree = _answer(criteria, 'academic_degree')
+    if degree and not NOT_IMPORTANT_RE.search(degree):
+        if DOCTOR_OF_SCIENCE_RE.search(degree):
+            prefs['min_degree'] = 2
+        elif ANY_DEGREE_RE.search(degree):
+            prefs['min_degree'] = 1
+
+    experience = _answer(criteria, 'experience')
+    if experience and not NOT_IMPORTANT_RE.search(experience):
+        if HIGH_CATEGORY_RE.search(experience):
+            prefs['min_category'] = CATEGORY_LEVELS['high']
+        elif FIRST_CATEGORY_RE.search(experience):
+            prefs['min_category'] = CATEGORY_LEVELS['first']
+        years = MIN_YEARS_RE.search(experience)
+        if years:
+            prefs['min_years'] = int(years.group(1))
+        prefs['experienced'] = bool(EXPERIENCED_RE.search(experience))
+        prefs['young'] = bool(YOUNG_RE.search(experience))
+
+    prefs['child'] = bool(CHILD_PATIENT_RE.search(_answer(criteria, 'patient_type')))
+    return prefs
+
+
+class _CatalogRows:
+    """Атрибуты только строк row_ids в интерфейсе каталога: маски и оценки считаются по кандидатам,
+    а не по всему каталогу"""
+
+    def __init__(self, catalog, row_ids: np.ndarray):
+        self._catalog = catalog
+        self._row_ids = row_ids
+        self._values: Dict[str, np.ndarray] = {}
+
+    @property
+    def rows(self) -> int:
+        return len(self._row_ids)
+
+    def attribute(self, name: str) -> np.ndarray:
+        values = self._values.get(name)
+        if values is None:
+            values = self._values[name] = self._catalog.attribute(name)[self._row_ids]
+        return values
+
+
+def _experience_years(catalog) -> np.ndarray:
+    """Стаж по году окончания вуза (-1, если год неизвестен)"""
+    graduation = catalog.attribute('graduation_year')
+    return np.where(graduation > 0, datetime.now().year - graduation, -1)
+
+
+def criteria_masks(catalog, prefs: Dict) -> List[Tuple[str, np.ndarray]]:
+    """Жесткие фильтры по всему каталогу в порядке важности (булевы маски)"""
+    masks = []
+    if prefs['child']:
+        masks.append(('child', catalog.attribute('treats_children') == 1))
+    if prefs['gender']:
+        masks.append(('gender', catalog.attribute('gender_code') == prefs['gender']))
+    if prefs['min_degree']:
+        masks.append(('degree', catalog.attribute('degree_level') >= prefs['min_degree']))
+    if prefs['min_category']:
+        masks.append(('category', catalog.attribute('category_level') >= prefs['min_category']))
+    if prefs['min_years']:
+        masks.append(('experience', _experience_years(catalog) >= prefs['min_years']))
+    return masks
+
+
+def criteria_scores(catalog, prefs: Dict) -> np.ndarray:
+    """Мягкая оценка соответствия критериям (для порядка внутри отфильтрованных)"""
+    scores = np.zeros(catalog.rows, dtype=np.float64)
+    years = _experience_years(catalog)
+    if prefs['experienced']:
+        scores += (years >= EXPERIENCED_YEARS) + 0.5 * (catalog.attribute('category_level') == CATEGORY_LEVELS['high'])
+    if prefs['young']:
+        scores += (years >= 0) & (years < EXPERIENCED_YEARS)
+    if prefs['min_degree']:
+        scores += 0.5 * catalog.attribute('degree_level')
+    return scores
+
+
+def apply_criteria(catalog, row_ids: Sequence[int], criteria: Optional[Dict],
+                   min_candidates: int = 5) -> List[int]:
+    """Отбор кандидатов по структурным критериям.
+
+    Фильтры применяются по очереди; фильтр, после которого осталось бы меньше min_candidates врачей,
+    пропускается. Оставшиеся врачи упорядочиваются по мягкой оценке (при равенстве - порядок каталога).
+    Маски и оценки считаются только по строкам row_ids, время не зависит от размера каталога.
+    """
+    return score_criteria(catalog, row_ids, criteria, min_candidates)[0]
+
+
+def score_criteria(catalog, row_ids: Sequence[int], criteria: Optional[Dict],
+                   min_candidates: int = 5) -> Tuple[List[int], np.ndarray]:
+    """apply_criteria вместе с мягкими оценками отобранных врачей (в том же порядке).
+
+    Оценки передаются в doctor_ranking.rank_candidates: соответствие критериям остается главным ключом
+    порядка и после BM25-предранжирования.
+    """
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    if not criteria or not len(row_ids):
+        return row_ids.tolist(), np.zeros(len(row_ids))
+
+    prefs = parse_criteria(criteria)
+    candidates = _CatalogRows(catalog, row_ids)
+    keep = np.ones(len(row_ids), dtype=bool)
+    for _, mask in criteria_masks(candidates, prefs):
+        narrowed = keep & mask
+        if narrowed.sum() >= max(1, min(min_candidates, int(keep.sum()))):
+            keep = narrowed
+
+    scores = criteria_scores(candidates, prefs)[keep]
+    order = np.argsort(-scores, kind='stable')
+    return row_ids[keep][order].tolist(), scores[order]
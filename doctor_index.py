@@ -0,0 +1,205 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+from text_utils import normalize_text, split_specialties, tokenize
+
+# Поля, по которым ищется специальность (тот же набор, что проверял построчный поиск)
+INDEX_FIELDS = ('spec', 'specialities', 'doctor_specialization', 'detail_text')
+
+# Поля, значения которых целиком считаются "фразами" специальностей
+PHRASE_FIELDS = ('spec', 'specialities', 'doctor_specialization')
+
+WORD_QUERY_RE = re.compile(r'^\w+$')
+
+# Позиции полей специальностей среди INDEX_FIELDS (описание врача в поиск специальности не входит)
+PHRASE_FIELD_POSITIONS = tuple(INDEX_FIELDS.index(field) for field in PHRASE_FIELDS)
+
+
+def trigrams(term: str) -> Iterable[str]:
+    """Триграммы слова"""
+    return (term[i:i + 3] for i in range(len(term) - 2))
+
+
+class BaseSpecialtyIndex:
+    """Поиск специальности по инвертированному индексу; хранение постингов задают наследники"""
+
+    size = 0
+
+    def __init__(self, query_cache_size: int = 512):
+        self._query_cache: 'OrderedDict[str, Tuple[int, ...]]' = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._cache_lock = threading.Lock()
+
+    def vocabulary(self) -> Iterable[str]:
+        """Все слова словаря"""
+        raise NotImplementedError
+
+    def terms_with_trigram(self, trigram: str) -> Set[str]:
+        """Слова словаря, содержащие триграмму"""
+        raise NotImplementedError
+
+    def term_rows(self, term: str) -> Set[int]:
+        """Строки, в которых встречается слово"""
+        raise NotImplementedError
+
+    def row_texts(self, row_id: int) -> Sequence[Optional[str]]:
+        """Нормализованные тексты поисковых полей строки"""
+        raise NotImplementedError
+
+    def rows_for_phrase(self, phrase: str) -> Set[int]:
+        """Строки с точным совпадением фразы специальности"""
+        raise NotImplementedError
+
+    def _terms_containing(self, token: str) -> Iterable[str]:
+        """Термы словаря, содержащие token как подстроку"""
+        if len(token) < 3:
+            return [term for term in self.vocabulary() if token in term]
+        trigram_sets = []
+        for trigram in trigrams(token):
+            terms = self.terms_with_trigram(trigram)
+            if not terms:
+                return []
+            trigram_sets.append(terms)
+        trigram_sets.sort(key=len)
+        candidates = set.intersection(*trigram_sets)
+        return [term for term in candidates if token in term]
+
+    def _rows_with_token(self, token: str) -> Set[int]:
+        """Строки, где token встречается внутри какого-либо слова"""
+        rows = set()
+        for term in self._terms_containing(token):
+            rows |= self.term_rows(term)
+        return rows
+
+    def _text_matches(self, row_id: int, query: str) -> bool:
+        """Проверка подстроки по полям конкретной строки (в specialities - внутри одной специализации)"""
+        for field, text in zip(INDEX_FIELDS, self.row_texts(row_id)):
+            if not text:
+                continue
+            if field == 'specialities':
+                if any(query in phrase for phrase in split_specialties(text)):
+                    return True
+            elif query in text:
+                return True
+        return False
+
+    def lookup(self, target_specialty: str) -> Tuple[int, ...]:
+        """Номера строк (по возрастанию), где специальность встречается как подстрока полей"""
+        query = target_specialty.lower()
+        with self._cache_lock:
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                self._query_cache.move_to_end(query)
+                return cached
+
+        tokens = tokenize(query)
+        if not tokens:
+            rows = ()
+        else:
+            token_rows = sorted((self._rows_with_token(token) for token in set(tokens)), key=len)
+            candidates = set.intersection(*token_rows)
+            if WORD_QUERY_RE.match(query):
+                rows = tuple(sorted(candidates))
+            else:
+                # Многословный запрос: кандидаты из индекса, точная проверка только по ним
+                rows = tuple(sorted(row_id for row_id in candidates if self._text_matches(row_id, query)))
+
+        self._remember(query, rows)
+        return rows
+
+    def lookup_terms(self, terms: Sequence[str]) -> Tuple[int, ...]:
+        """Номера строк (по возрастанию), где одно из слов начинается с terms в полях специальностей.
+
+        Кандидаты берутся из индекса, точная проверка идет только по spec, specialities
+        и doctor_specialization: упоминание специальности в описании врача не в счет.
+        """
+        key = '\x00'.join(['terms'] + sorted(terms))
+        with self._cache_lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+                return cached
+
+        pattern = re.compile(r'(?<![\w-])(' + '|'.join(re.escape(term.lower()) for term in terms) + ')')
+        candidates = set()
+        for term in terms:
+            token_rows = sorted((self._rows_with_token(token) for token in set(tokenize(term.lower()))), key=len)
+            if token_rows:
+                candidates |= set.intersection(*token_rows)
+        rows = tuple(sorted(row_id for row_id in candidates if self._phrase_fields_match(row_id, pattern)))
+        self._remember(key, rows)
+        return rows
+
+    def _phrase_fields_match(self, row_id: int, pattern: re.Pattern) -> bool:
+        texts = self.row_texts(row_id)
+        return any(texts[position] and pattern.search(texts[position]) for position in PHRASE_FIELD_POSITIONS)
+
+    def _remember(self, key: str, rows: Tuple[int, ...]):
+        with self._cache_lock:
+            self._query_cache[key] = rows
+            if len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+
+
+class SpecialtyIndex(BaseSpecialtyIndex):
+    """Инвертированный индекс в памяти: токены и фразы специальностей -> номера строк каталога"""
+
+    def __init__(self, row_texts: Sequence[Sequence[Optional[str]]], query_cache_size: int = 512):
+        super().__init__(query_cache_size)
+        # Тексты полей уже нормализованы (без HTML, нижний регистр) на этапе загрузки каталога
+        self._row_texts = [tuple(texts) for texts in row_texts]
+        self.size = len(self._row_texts)
+        self.postings: Dict[str, Set[int]] = {}
+        self.phrases: Dict[str, Set[int]] = {}
+        self.trigram_terms: Dict[str, Set[str]] = {}
+        self._build()
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, fields: Iterable[str] = INDEX_FIELDS) -> 'SpecialtyIndex':
+        """Построение индекса по DataFrame врачей (использует колонки lower_*, если они посчитаны)"""
+        columns = []
+        for field in fields:
+            if f'lower_{field}' in df.columns:
+                columns.append([value or None for value in df[f'lower_{field}']])
+            elif field in df.columns:
+                columns.append([None if pd.isna(value) else normalize_text(value) for value in df[field]])
+            else:
+                columns.append([None] * len(df))
+        return cls(list(zip(*columns)) if columns else [])
+
+    def _build(self):
+        """Заполнение постинг-листов токенов и фраз"""
+        for row_id, texts in enumerate(self._row_texts):
+            for field, text in zip(INDEX_FIELDS, texts):
+                if not text:
+                    continue
+                for token in tokenize(text):
+                    self.postings.setdefault(token, set()).add(row_id)
+                if field in PHRASE_FIELDS:
+                    phrases = split_specialties(text) if field == 'specialities' else [text.strip()]
+                    for phrase in phrases:
+                        self.phrases.setdefault(phrase, set()).add(row_id)
+
+        # Триграммы словаря позволяют искать подстроку по словарю, а не по всем врачам
+        for term in self.postings:
+            for trigram in trigrams(term):
+                self.trigram_terms.setdefault(trigram, set()).add(term)
+
+    def vocabulary(self) -> Iterable[str]:
+        return self.postings.keys()
+
+    def terms_with_trigram(self, trigram: str) -> Set[str]:
+        return self.trigram_terms.get(trigram, set())
+
+    def term_rows(self, term: str) -> Set[int]:
+        return self.postings.get(term, set())
+
+    def row_texts(self, row_id: int) -> Sequence[Optional[str]]:
+        return self._row_texts[row_id]
+
+    def rows_for_phrase(self, phrase: str) -> Set[int]:
+        return self.phrases.get(phrase.strip().lower(), set())
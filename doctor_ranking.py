@@ -0,0 +1,69 @@
+import math
+from collections import Counter
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+from text_utils import normalize_text, stem, tokenize
+
+# Служебные слова и подписи из criteria_text, которые не несут смысла для поиска врача
+QUERY_STOP_WORDS = {
+    'и', 'в', 'во', 'на', 'с', 'со', 'по', 'к', 'ко', 'у', 'о', 'об', 'от', 'до', 'за', 'из', 'для', 'при', 'не',
+    'но', 'а', 'или', 'что', 'как', 'это', 'мне', 'меня', 'я', 'мой', 'моя', 'уже', 'есть', 'нет', 'да',
+    'очень', 'после', 'когда', 'иногда', 'врач', 'врача', 'основная', 'специализация', 'тип', 'пациента',
+    'предпочтительный', 'пол', 'стаж', 'ученая', 'степень', 'приема', 'предыдущие', 'диагнозы', 'хронические',
+    'заболевания', 'необходимые', 'обследования', 'особые', 'пожелания', 'жалобы', 'основные', 'пациент',
+    'данные', 'уточняющая', 'информация', 'указано', 'голосовая', 'текстовая', 'консультация',
+}
+
+
+def query_terms(text: str) -> List[str]:
+    """Стеммированные слова запроса без служебных"""
+    return [stem(token) for token in tokenize(normalize_text(text)) if token not in QUERY_STOP_WORDS]
+
+
+class BM25:
+    """BM25 по набору документов-кандидатов (документ - список слов)"""
+
+    def __init__(self, documents: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(stem(token) for token in document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        doc_freqs = Counter(term for freqs in self.term_freqs for term in freqs)
+        total = len(documents)
+        self.idf = {term: math.log(1 + (total - freq + 0.5) / (freq + 0.5)) for term, freq in doc_freqs.items()}
+
+    def scores(self, terms: Sequence[str]) -> List[float]:
+        """Оценка каждого документа по запросу"""
+        terms = [term for term in set(terms) if term in self.idf]
+        result = []
+        for freqs, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            score = 0.0
+            for term in terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            result.append(score)
+        return result
+
+
+def rank_candidates(candidates: pd.DataFrame, query_text: str, top_n: int,
+                    priority: Optional[Sequence[float]] = None) -> pd.DataFrame:
+    """Лексическое предранжирование кандидатов: top_n врачей с наибольшим BM25 по жалобам и критериям.
+
+    Статистики BM25 считаются по самим кандидатам: ранжируем внутри одной специальности.
+    Кандидаты сортируются и тогда, когда их не больше top_n (порядок важен для бюджета профилей).
+    priority (мягкая оценка критериев, doctor_filters.score_criteria) - главный ключ порядка:
+    BM25 упорядочивает врачей только внутри равной оценки.
+    """
+    if len(candidates) < 2 or 'tokens' not in candidates.columns:
+        return candidates
+    terms = query_terms(query_text)
+    scores = BM25(candidates['tokens'].tolist()).scores(terms) if terms else [0.0] * len(candidates)
+    priority = priority if priority is not None else [0.0] * len(candidates)
+    # Устойчивая сортировка: при равных оценках сохраняется исходный порядок каталога
+    order = sorted(range(len(scores)), key=lambda i: (-priority[i], -scores[i]))[:top_n]
+    return candidates.iloc[order]
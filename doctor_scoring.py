@@ -0,0 +1,166 @@
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from doctor_filters import CATEGORY_LEVELS, GENDER_CODES, criteria_masks, criteria_scores, parse_criteria
+from doctor_ranking import BM25, query_terms
+
+# Веса сигналов локального ранжирования (подобраны вручную, порядок важности как в промпте select_top_doctors)
+LOCAL_RANK_WEIGHTS = {
+    'criteria': 3.0,
+    'relevance': 1.5,
+    'reviews': 1.0,
+    'category': 1.0,
+    'degree': 0.7,
+}
+
+NO_REVIEW_RE = re.compile(r'^\s*(нет\s+отзыв|отзыв\w*\s+нет)')
+POSITIVE_REVIEW_RE = re.compile(
+    r'рекоменд|благодар|признательн|внимательн|профессионал|грамотн|отличн|замечательн|прекрасн|вылечи|'
+    r'помог|доволь|лучш|чутк|компетентн|опытн|тщательн')
+NEGATIVE_REVIEW_RE = re.compile(r'не\s+рекоменд|груб|хам|равнодуш|невнимательн|ужасн|плох|недоволь|развод|'
+                                r'не\s+помог|жалоб\w*\s+на\s+врач')
+MAX_REVIEW_SIGNALS = 3
+
+CATEGORY_NAMES = {CATEGORY_LEVELS['high']: 'высшая категория', CATEGORY_LEVELS['first']: 'первая категория'}
+DEGREE_NAMES = {2: 'доктор медицинских наук', 1: 'кандидат наук'}
+GENDER_NAMES = {GENDER_CODES['female']: 'врач-женщина', GENDER_CODES['male']: 'врач-мужчина'}
+
+
+class _CandidateAttributes:
+    """Числовые атрибуты кандидатов в интерфейсе каталога (для масок doctor_filters)"""
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+
+    @property
+    def rows(self) -> int:
+        return len(self._df)
+
+    def attribute(self, name: str) -> np.ndarray:
+        if name not in self._df.columns:
+            return np.zeros(len(self._df), dtype=np.int64)
+        return self._df[name].fillna(0).to_numpy(np.int64)
+
+
+def review_signal(review: Optional[str]) -> int:
+    """Тональность обобщенного отзыва: число положительных маркеров минус удвоенное число отрицательных"""
+    if not review or NO_REVIEW_RE.search(review):
+        return 0
+    text = review.lower()
+    negative = len(NEGATIVE_REVIEW_RE.findall(text))
+    positive = len(POSITIVE_REVIEW_RE.findall(text)) - negative
+    return int(np.clip(positive - 2 * negative, -MAX_REVIEW_SIGNALS, MAX_REVIEW_SIGNALS))
+
+
+def _reasons(category: int, degree: int, reviews: int, relevance: float, matched: List[str]) -> List[str]:
+    """Короткие причины выбора врача для карточки"""
+    reasons = list(matched)
+    if relevance >= 0.5:
+        reasons.append('профиль соответствует жалобам')
+    if category in CATEGORY_NAMES:
+        reasons.append(CATEGORY_NAMES[category])
+    if degree in DEGREE_NAMES:
+        reasons.append(DEGREE_NAMES[degree])
+    if reviews > 0:
+        reasons.append('положительные отзывы пациентов')
+    return list(dict.fromkeys(reasons))
+
+
+def local_top_doctors(candidates: pd.DataFrame, criteria: Optional[Dict] = None, query_text: str = "",
+                      num_doctors: int = 5) -> pd.DataFrame:
+    """Детерминированный выбор лучших врачей без LLM.
+
+    Оценка - взвешенная сумма соответствия критериям пациента, релевантности жалобам (BM25),
+    тональности отзывов, категории и ученой степени. При равных оценках сохраняется порядок кандидатов.
+    Возвращает num_doctors строк с колонками local_score и local_reasons.
+    """
+    if candidates.empty or num_doctors <= 0:
+        return candidates.head(0)
+
+    attributes = _CandidateAttributes(candidates)
+    prefs = parse_criteria(criteria or {})
+    masks = criteria_masks(attributes, prefs)
+    if masks:
+        fit = np.mean([mask for _, mask in masks], axis=0)
+    else:
+        fit = np.ones(len(candidates))
+    soft = criteria_scores(attributes, prefs)
+    fit = fit + (soft / soft.max() * 0.5 if soft.max() > 0 else 0)
+
+    relevance = np.zeros(len(candidates))
+    terms = query_terms(query_text)
+    if terms and 'tokens' in candidates.columns:
+        relevance = np.asarray(BM25(candidates['tokens'].tolist()).scores(terms))
+        if relevance.max() > 0:
+            relevance = relevance / relevance.max()
+
+    reviews = np.array([review_signal(review) for review in candidates.get('clean_review', [None] * len(candidates))])
+    category = attributes.attribute('category_level')
+    degree = attributes.attribute('degree_level')
+
+    weights = LOCAL_RANK_WEIGHTS
+    scores = (weights['criteria'] * fit + weights['relevance'] * relevance
+              + weights['reviews'] * reviews / MAX_REVIEW_SIGNALS
+              + weights['category'] * category / CATEGORY_LEVELS['high'] + weights['degree'] * degree / 2)
+
+    order = np.argsort(-scores, kind='stable')[:num_doctors]
+    top = candidates.iloc[order].copy()
+    top['local_score'] = np.round(scores[order], 3)
+    top['local_reasons'] = [
+        _reasons(int(category[i]), int(degree[i]), int(reviews[i]), float(relevance[i]),
+                 [_matched_name(name, prefs) for name, mask in masks if mask[i]])
+        for i in order
+    ]
+    return top
+
+
+def _matched_name(name: str, prefs: Dict) -> str:
+    """Название выполненного критерия пациента"""
+    if name == 'gender':
+        return GENDER_NAMES[prefs['gender']]
+    if name == 'child':
+        return 'принимает детей'
+    if name == 'experience':
+        return f"стаж от {prefs['min_years']} лет"
+    if name == 'degree':
+        return DEGREE_NAMES[prefs['min_degree']]
+    return CATEGORY_NAMES[prefs['min_category']]
+
+
+def selected_doctors(candidates: pd.DataFrame, selection: List[Dict]) -> pd.DataFrame:
+    """Карточки врачей из структурированного выбора LLM (select_top_doctors_structured_cached).
+
+    Берутся только строки из кандидатов, в порядке выбора; причина LLM - в колонке llm_reason.
+    """
+    selection = [item for item in selection or [] if item['row_id'] in candidates.index]
+    top = candidates.loc[[item['row_id'] for item in selection]].copy()
+    top['llm_reason'] = [item['reason'] for item in selection]
+    return top
+
+
+def format_doctor_card(doctor: Dict, position: int, explanation: Optional[str] = None) -> str:
+    """Карточка одного врача; explanation (от explain_doctors) заменяет краткую причину и отзыв"""
+    name = doctor.get('name') if isinstance(doctor.get('name'), str) else f"Врач №{doctor.get('id', position)}"
+    lines = [f"{position}. {name} - {doctor.get('spec', '')}"]
+    if doctor.get('doctor_specialization') and not pd.isna(doctor['doctor_specialization']):
+        lines.append(f"   Специализация: {doctor['doctor_specialization']}")
+    if explanation:
+        lines += [f"   {line.strip()}" for line in explanation.strip().splitlines() if line.strip()]
+        return "\n".join(lines) + "\n"
+    reasons = doctor.get('local_reasons') or []
+    if isinstance(doctor.get('llm_reason'), str) and doctor['llm_reason']:
+        lines.append(f"   Почему подходит: {doctor['llm_reason']}")
+    elif reasons:
+        lines.append(f"   Почему подходит: {', '.join(reasons)}")
+    review = doctor.get('clean_review')
+    if review and not NO_REVIEW_RE.search(review):
+        lines.append(f"   * отзывы пациентов: {review[:200]}")
+    return "\n".join(lines) + "\n"
+
+
+def format_local_recommendation(top: pd.DataFrame) -> str:
+    """Текст рекомендации в формате ответа select_top_doctors (локальный рейтинг или selected_doctors)"""
+    return "\n".join(format_doctor_card(doctor, position) for position, doctor in enumerate(top.to_dict('records'), 1))
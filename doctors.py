@@ -1,132 +1,157 @@
 import pandas as pd
 import streamlit as st
-from typing import List, Dict, Tuple
-import re
+from typing import List, Dict, Optional, Tuple
+from doctor_catalog import AnyCatalog, get_catalog
+from doctor_filters import score_criteria
+from doctor_index import BaseSpecialtyIndex
+from doctor_ranking import QUERY_STOP_WORDS, rank_candidates
+from profile_packer import PROFILE_TOKEN_BUDGET, pack_profiles
+from specialty_resolver import catalog_terms, resolve_specialties
+from text_utils import split_specialties, stem, tokenize
+
+# Колонки, которые читает prepare_doctor_profile
+PROFILE_COLUMNS = ['id', 'name', 'spec', 'doctor_specialization', 'specialities_list', 'doctor_category', 'degree',
+                   'gender', 'education', 'clean_education_add', 'clean_detail_text', 'clean_review']
+
+# Сколько кандидатов после BM25-предранжирования отправляется в select_top_doctors
+PRERANK_TOP_N = 30
+
+# Сколько врачей добирается семантическим поиском, если по специальности найдено слишком мало
+SEMANTIC_TOP_K = 15
+
+
+def _to_records(df: pd.DataFrame, columns: List[str]) -> List[Dict]:
+    """Строки DataFrame как словари (только нужные колонки; быстрее iterrows и to_dict)"""
+    columns = [column for column in columns if column in df.columns]
+    return [dict(zip(columns, values)) for values in zip(*(df[column].tolist() for column in columns))]
 
 
 class DoctorMatcher:
     def __init__(self, csv_path='all_doctors.csv'):
         self.csv_path = csv_path
-        self.df = self.load_data()
-
-    def load_data(self) -> pd.DataFrame:
-        """Загрузка данных врачей из CSV"""
-        try:
-            df = pd.read_csv(self.csv_path)
-            st.success(f"✅ Загружено {len(df)} врачей из базы данных")
-            return df
-        except FileNotFoundError:
+        self.load_data()
+
+    @property
+    def catalog(self) -> AnyCatalog:
+        """Общий для всех сессий каталог врачей (загружается один раз на процесс)"""
+        return get_catalog(self.csv_path)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.catalog.df
+
+    @property
+    def index(self) -> BaseSpecialtyIndex:
+        return self.catalog.index
+
+    def load_data(self) -> AnyCatalog:
+        """Загрузка данных врачей из общего каталога"""
+        catalog = self.catalog
+        if catalog.rows == 0:
             st.error("❌ Файл doctors.csv не найден")
-            return pd.DataFrame()
+        else:
+            st.success(f"✅ Загружено {catalog.rows} врачей из базы данных")
+        return catalog
 
     def preprocess_specialties(self, specialties_text):
         """Очистка и нормализация специализаций"""
         if pd.isna(specialties_text):
             return []
         # Убираем HTML теги, приводим к нижнему регистру, разбиваем по разделителям
-        clean_text = re.sub('<[^<]+?>', '', str(specialties_text))
-        specialties = [spec.strip().lower() for spec in re.split(',|;|и', clean_text) if spec.strip()]
-        return specialties
+        return split_specialties(str(specialties_text))
 
     def filter_by_specialty(self, target_specialty: str) -> pd.DataFrame:
         """Фильтрация врачей по специальности"""
-        if self.df.empty:
-            return pd.DataFrame()
-
-        target_specialty = target_specialty.lower()
-        filtered_doctors = []
+        return self._filter_by_specialty(self.catalog, target_specialty)
 
-        for _, doctor in self.df.iterrows():
-            # Проверяем основную специальность
-            spec_match = False
-            if not pd.isna(doctor.get('spec')):
-                spec_match = target_specialty in doctor['spec'].lower()
+    @staticmethod
+    def _filter_by_specialty(catalog: AnyCatalog, target_specialty: str) -> pd.DataFrame:
+        """Фильтрация по специальности в конкретной версии каталога"""
+        if catalog.rows == 0:
+            return pd.DataFrame()
 
-            # Проверяем ключевую специализацию
-            doctor_spec_match = False
-            if not pd.isna(doctor.get('doctor_specialization')):
-                doctor_spec_match = target_specialty in doctor['doctor_specialization'].lower()
+        # Свободный текст ("Врач-невролог.", "к неврологу") сводится к каноническим специальностям,
+        # которые ищутся в spec, specialities и doctor_specialization
+        terms = [term for specialty_id in resolve_specialties(target_specialty) for term in catalog_terms(specialty_id)]
+        if not terms:
+            # Нераспознанная специальность: основы ее слов в тех же полях
+            terms = [stem(token) for token in tokenize(target_specialty.lower())
+                     if token not in QUERY_STOP_WORDS and token != 'врач']
+        if not terms:
+            return pd.DataFrame()
+        return catalog.take(catalog.index.lookup_terms(terms))
 
-            # Проверяем список специализаций
-            specialties_match = False
-            if not pd.isna(doctor.get('specialities')):
-                specialties = self.preprocess_specialties(doctor['specialities'])
-                specialties_match = any(target_specialty in spec for spec in specialties)
+    def semantic_candidates(self, query_text: str, top_k: int = SEMANTIC_TOP_K) -> pd.DataFrame:
+        """Врачи, ближайшие к тексту жалоб по эмбеддингам (работает без сети)"""
+        return self._semantic_candidates(self.catalog, query_text, top_k)
 
-            # Проверяем детальное описание
-            detail_match = False
-            if not pd.isna(doctor.get('detail_text')):
-                detail_match = target_specialty in doctor['detail_text'].lower()
+    @staticmethod
+    def _semantic_candidates(catalog: AnyCatalog, query_text: str, top_k: int) -> pd.DataFrame:
+        """Семантический поиск в конкретной версии каталога"""
+        if catalog.rows == 0 or not query_text.strip():
+            return pd.DataFrame()
+        row_ids = [row_id for row_id, _ in catalog.embeddings.search(query_text, top_k)]
+        return catalog.take(row_ids)
 
-            if spec_match or doctor_spec_match or specialties_match or detail_match:
-                filtered_doctors.append(doctor)
+    def prepare_doctor_profile(self, doctor) -> str:
+        """Подготовка профиля врача для LLM (без ограничения бюджета)"""
+        return pack_profiles([doctor], token_budget=None)['text']
+
+    def get_filtered_candidates(self, target_specialty: str, min_candidates: int = 5, query_text: str = "",
+                                top_n: Optional[int] = PRERANK_TOP_N, criteria: Optional[Dict] = None,
+                                verbose: bool = True,
+                                token_budget: Optional[int] = PROFILE_TOKEN_BUDGET) -> Tuple[pd.DataFrame, str]:
+        """Получение отфильтрованных кандидатов и их профилей для LLM.
+
+        criteria (словарь из get_doctor_search_criteria) сужает кандидатов по полу, степени, категории,
+        стажу и детскому приему. Если кандидатов больше top_n, в LLM уходят только top_n лучших:
+        по мягкой оценке критериев, а при равной оценке - по BM25 относительно query_text (жалобы пациента
+        и критерии поиска). Профили упаковываются
+        в token_budget токенов (profile_packer.pack_profiles): не поместившиеся кандидаты с конца
+        рейтинга отбрасываются и из возвращаемого DataFrame, размер профилей - в filtered_df.attrs['profiles'],
+        общая строка и профили по отдельности (в порядке строк filtered_df) - в filtered_df.attrs['profile_blocks'].
+        Если по названию
+        специальности найдено меньше min_candidates врачей, список дополняется семантическим поиском
+        по специальности и query_text. verbose=False отключает сообщения в интерфейсе (фоновый подбор).
+        """
+        # Берем ссылку один раз, чтобы все шаги работали с одной версией каталога
+        catalog = self.catalog
+        filtered_df = self._filter_by_specialty(catalog, target_specialty)
+
+        if filtered_df.empty and catalog.rows == 0:
+            return pd.DataFrame(), ""
 
-        return pd.DataFrame(filtered_doctors)
+        if verbose and not filtered_df.empty:
+            st.info(f"🎯 Найдено {len(filtered_df)} врачей по специальности '{target_specialty}'")
 
-    def prepare_doctor_profile(self, doctor) -> str:
-        """Подготовка профиля врача для LLM"""
-        profile = f"Врач: {doctor.get('name', 'Не указано')}\n"
-
-        # Основная информация
-        if not pd.isna(doctor.get('spec')):
-            profile += f"Специальность: {doctor['spec']}\n"
-
-        if not pd.isna(doctor.get('doctor_specialization')):
-            profile += f"Ключевая специализация: {doctor['doctor_specialization']}\n"
-
-        if not pd.isna(doctor.get('specialities')):
-            specialties = self.preprocess_specialties(doctor['specialities'])
-            if specialties:
-                profile += f"Дополнительные специализации: {', '.join(specialties)}\n"
-
-        # Квалификация
-        if not pd.isna(doctor.get('doctor_category')):
-            profile += f"Категория: {doctor['doctor_category']}\n"
-
-        if not pd.isna(doctor.get('degree')) and doctor['degree'] != 'none':
-            profile += f"Ученая степень: {doctor['degree']}\n"
-
-        if not pd.isna(doctor.get('gender')):
-            profile += f"Пол: {doctor['gender']}\n"
-
-        # Образование
-        if not pd.isna(doctor.get('education')):
-            profile += f"Образование: {doctor['education']}\n"
-
-        if not pd.isna(doctor.get('education_add')):
-            education_clean = re.sub('<[^<]+?>', '', str(doctor['education_add']))
-            if education_clean.strip():
-                profile += f"Дополнительное образование: {education_clean[:200]}...\n"
-
-        # Опыт и описание
-        if not pd.isna(doctor.get('detail_text')):
-            detail_clean = re.sub('<[^<]+?>', '', str(doctor['detail_text']))
-            profile += f"Описание: {detail_clean[:300]}...\n"
-        # Отзыв
-        if not pd.isna(doctor.get('отзыв')) and doctor['отзыв'] != 'none':
-            review_clean = re.sub('<[^<]+?>', '', str(doctor['отзыв']))
-            if review_clean.strip():
-                profile += f"Отзывы: {review_clean[:250]}...\n"
-        elif not pd.isna(doctor.get('reviews')) and doctor['reviews'] != 'none':
-            # Если колонка называется 'reviews' вместо 'отзыв'
-            review_clean = re.sub('<[^<]+?>', '', str(doctor['reviews']))
-            if review_clean.strip():
-                profile += f"Отзывы: {review_clean[:250]}...\n"
-        profile += "---\n"
-        return profile
-
-    def get_filtered_candidates(self, target_specialty: str, min_candidates: int = 5) -> Tuple[pd.DataFrame, str]:
-        """Получение отфильтрованных кандидатов и их профилей для LLM"""
-        filtered_df = self.filter_by_specialty(target_specialty)
+        if len(filtered_df) < min_candidates:
+            similar_df = self._semantic_candidates(catalog, f"{target_specialty}\n{query_text}", SEMANTIC_TOP_K)
+            similar_df = similar_df[~similar_df.index.isin(filtered_df.index)] if not similar_df.empty else similar_df
+            if not similar_df.empty:
+                if verbose:
+                    st.info(f"🔎 Добавлено {len(similar_df)} врачей со схожим профилем")
+                filtered_df = pd.concat([filtered_df, similar_df]) if not filtered_df.empty else similar_df
 
         if filtered_df.empty:
             return pd.DataFrame(), ""
 
-        st.info(f"🎯 Найдено {len(filtered_df)} врачей по специальности '{target_specialty}'")
+        criteria_scores = None
+        if criteria:
+            row_ids, criteria_scores = score_criteria(catalog, filtered_df.index.to_numpy(), criteria, min_candidates)
+            filtered_df = filtered_df.loc[row_ids]
 
-        # Подготавливаем профили для LLM
-        candidates_profiles = ""
-        for _, doctor in filtered_df.iterrows():
-            candidates_profiles += self.prepare_doctor_profile(doctor)
+        # При бюджете профилей порядок важен и без отсечения: в промпт первыми попадают лучшие кандидаты.
+        # Соответствие критериям - главный ключ порядка, BM25 - внутри равной оценки
+        if (top_n and len(filtered_df) > top_n) or token_budget is not None:
+            filtered_df = rank_candidates(filtered_df, query_text, max(top_n or len(filtered_df), min_candidates),
+                                          criteria_scores)
 
-        return filtered_df, candidates_profiles
\ No newline at end of file
+        # Подготавливаем профили для LLM
+        packed = pack_profiles(_to_records(filtered_df, PROFILE_COLUMNS), token_budget)
+        if packed['dropped']:
+            filtered_df = filtered_df.iloc[:packed['count']]
+        # Размер профилей доступен вызывающему коду вместе с кандидатами
+        filtered_df.attrs['profiles'] = {key: packed[key] for key in ('count', 'dropped', 'tokens', 'budget')}
+        filtered_df.attrs['profile_blocks'] = {key: packed[key] for key in ('shared', 'profiles')}
+
+        return filtered_df, packed['text']
\ No newline at end of file
@@ -0,0 +1,116 @@
+import re
+from typing import Dict, Optional
+
+from text_utils import normalize_text
+
+# Итог консультации при угрожающих жизни симптомах
+EMERGENCY_RECOMMENDATION = "Срочно вызовите скорую помощь по номеру 103"
+EMERGENCY_WARNING = "По вашему описанию состояние может угрожать жизни. Не ждите записи к врачу."
+
+# Ответ LLM вместо специалиста при критичном состоянии: промпты просят назвать номер скорой 103
+EMERGENCY_ANSWER_RE = re.compile(r'(?<!\d)103(?!\d)')
+
+# Грудь как часть тела ("грудь", "в груди", "грудная клетка"), но не "грудной отдел позвоночника"
+_CHEST = r'(груд(ь|и|ью)\b|грудн\w*\s+клетк)'
+
+# Угрожающие жизни симптомы: фразы и их словоформы (текст в нижнем регистре, ё заменена на е)
+EMERGENCY_PATTERNS = {
+    'chest_pain': [
+        rf'бол\w*\s+(в|за)\s+{_CHEST}', rf'(давит|давящ\w*|жжет|жжени\w*|сдавлива\w*)\s+(в|за)\s+{_CHEST}',
+        rf'(болит|болят|болела|заболел\w*|ноет|колет|давит|жжет|сдавливает)\s+(сильно\s+)?(в\s+)?{_CHEST}',
+        rf'{_CHEST}\s+(сильно\s+)?(болит|давит|жжет|сдавлива)', r'за\s*грудин',
+    ],
+    'hypertensive_crisis': [
+        r'давлени\w*\s+(\w+\s+){0,2}?(до\s+|под\s+|выше\s+|больше\s+|за\s+)?(1[89]\d|2\d\d)\b',
+        r'\b(1[89]\d|2\d\d)\s*(/|на)\s*\d{2,3}\b', r'гипертонич\w*\s+криз',
+    ],
+    'breathing': [
+        r'задыха\w*', r'удушь\w*', r'не\s+мо\w*\s+(вдохнуть|дышать|продышаться)', r'трудно\s+дышать',
+        r'(нехватк\w*|не\s+хвата\w*)\s+воздух', r'(губы|лицо)\s+посинел', r'посинел\w*\s+(губ|лиц)',
+    ],
+    'consciousness': [
+        r'(потер\w*|теря\w*)\s+сознан', r'без\s+сознан', r'обморок', r'не\s+приход\w*\s+в\s+себя',
+    ],
+    'stroke': [
+        r'перекос\w*\s+(лиц|рот)', r'(лиц\w*|рот)\s+перекос', r'онемел\w*\s+(половин|одн\w*\s+сторон)',
+        r'(отнял\w*|парализ\w*)\s+(рук|ног|половин)', r'не\s+мо\w*\s+говорить', r'заплета\w*\s+язык',
+        r'невнятн\w*\s+реч', r'(внезапн\w*|резк\w*)\s+(сильн\w*|сильнейш\w*|невыносим\w*)\s+головн\w*\s+бол',
+    ],
+    'bleeding': [
+        r'(сильн\w*|обильн\w*)\s+кровотеч', r'кровотечени\w*\s+не\s+останавлива', r'кровь\s+не\s+останавлива',
+        r'(рвот\w*|рвет|стошнил\w*|кашля\w*|кашель)\s+(с\s+)?кров', r'кровав\w*\s+рвот',
+        r'беремен\w*.{0,40}кровотеч',
+    ],
+    'anaphylaxis': [
+        r'отек\w*\s+(горл|гортан|язык|квинке)', r'(горл|язык)\w*\s+(отек|отекл|распух)', r'анафилакс',
+    ],
+    'seizures': [
+        r'эпилептич\w*\s+припад', r'припадок', r'судорог\w*\s+(и|с)\s+потер\w*\s+сознан',
+        r'судорог\w*\s+не\s+прекраща',
+    ],
+    'suicide': [
+        r'поконч\w*\s+с\s+(собой|жизн)', r'суицид', r'(хочу|хочется)\s+(умереть|не\s+жить)',
+    ],
+    'poisoning': [
+        r'передозиров', r'угарн\w*\s+газ', r'отравлени\w*\s+(гриб|газ|химик)',
+        r'выпил\w*\s+(уксус|отбеливател|растворител)',
+    ],
+    'high_fever': [
+        r'температур\w*\s+(под\s+|выше\s+|больше\s+|около\s+)?(4[0-2]|39[.,][5-9])',
+    ],
+    'acute_abdomen': [
+        r'(резк\w*|невыносим\w*|кинжальн\w*|нестерпим\w*)\s+бол\w*\s+в\s+живот',
+    ],
+}
+
+# Что сообщить пациенту по каждой группе симптомов
+EMERGENCY_REASONS = {
+    'chest_pain': 'боль в груди',
+    'hypertensive_crisis': 'очень высокое давление',
+    'breathing': 'затрудненное дыхание',
+    'consciousness': 'потеря сознания',
+    'stroke': 'признаки инсульта',
+    'bleeding': 'кровотечение',
+    'anaphylaxis': 'отек горла или языка',
+    'seizures': 'судорожный приступ',
+    'suicide': 'мысли о самоубийстве',
+    'poisoning': 'отравление',
+    'high_fever': 'очень высокая температура',
+    'acute_abdomen': 'резкая боль в животе',
+}
+
+# Один регулярный шаблон на все группы: совпавшая группа определяется по имени
+EMERGENCY_RE = re.compile('|'.join(
+    f"(?P<{category}>{'|'.join(patterns)})" for category, patterns in EMERGENCY_PATTERNS.items()))
+
+# Отрицание прямо перед симптомом ("нет боли в груди", "не было обмороков", "ни температуры, ни боли в груди").
+# Отдельное "нет," перед симптомом - ответ на прошлый вопрос ("Нет, болит грудь"), а не отрицание
+NEGATION_RE = re.compile(r'(\bнет|\bне|\bни|\bбез|\bне\s+был\w*|\bникогда\s+не)\s+$')
+
+# Отрицание после симптома в той же части фразы, без запятой между ними ("боли в груди нет")
+AFTER_NEGATION_RE = re.compile(
+    r'^\w*(\s+\w+){0,3}?\s+(нет|не\s+было|не\s+беспоко\w*|отсутству\w*)\b\s*($|[,.!?;])')
+
+
+def is_emergency_answer(answer: Optional[str]) -> bool:
+    """Рекомендация - вызов скорой (EMERGENCY_RECOMMENDATION или ответ LLM с номером 103), а не специалист"""
+    return bool(answer) and bool(EMERGENCY_ANSWER_RE.search(answer))
+
+
+def detect_emergency(text: str) -> Optional[Dict[str, str]]:
+    """Угрожающий жизни симптом в тексте пациента (None, если не найден).
+
+    Возвращает группу симптомов, совпавшую фразу и причину для пациента.
+    """
+    if not text:
+        return None
+    text = normalize_text(text).replace('ё', 'е')
+    for match in EMERGENCY_RE.finditer(text):
+        if NEGATION_RE.search(text[:match.start()]) or AFTER_NEGATION_RE.search(text[match.end():]):
+            continue
+        return {
+            'category': match.lastgroup,
+            'phrase': match.group(0),
+            'reason': EMERGENCY_REASONS[match.lastgroup],
+        }
+    return None
@@ -0,0 +1,183 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+import openai
+
+
+class AsyncLLMClient:
+    """Асинхронный клиент LLM на отдельном цикле событий, общий для процесса.
+
+    Все запросы идут через один AsyncOpenAI с пулом HTTP-соединений (keep-alive), число
+    одновременных запросов ограничено max_concurrency. Ожидающий ответа запрос не занимает
+    отдельный поток: синхронные вызовы (complete, stream) передают корутину в общий цикл
+    и ждут результат, асинхронные (acomplete, astream) можно вызывать из любого цикла событий.
+    """
+
+    def __init__(self, api_key: str, base_url: str, model: str, max_concurrency: int = 16,
+                 max_connections: int = 32, timeout: float = 60.0, temperature: float = 0.3):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.temperature = temperature
+        self.in_flight = 0
+        self.waiting = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Цикл событий клиента; запускается в фоновом потоке при первом обращении"""
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='lilu-llm', daemon=True).start()
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    self._loop = loop
+        return self._loop
+
+    def _openai(self) -> openai.AsyncOpenAI:
+        """AsyncOpenAI с пулом соединений (создается в цикле клиента)"""
+        if self._client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections, keepalive_expiry=60),
+                timeout=httpx.Timeout(self.timeout),
+            )
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                              http_client=self._http_client)
+        return self._client
+
+    async def _connect(self, connections: int) -> int:
+        self._openai()
+
+        async def touch():
+            # Ответ не важен (адрес API без метода), важно открытое TLS-соединение в пуле
+            await self._http_client.get(self.base_url)
+
+        results = await asyncio.gather(*(touch() for _ in range(connections)), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == connections:
+            raise errors[0]
+        return connections - len(errors)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Запуск корутины в цикле клиента без ожидания (для параллельных запросов из синхронного кода)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Выполнение корутины в цикле клиента с ожиданием из текущего потока"""
+        return self.submit(coro).result(timeout)
+
+    async def _bridge(self, coro):
+        """Ожидание корутины из чужого цикла событий"""
+        loop = self.loop
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def _acquire(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _create(self, messages, max_tokens: int, stream: bool, timeout: Optional[float]):
+        """Запрос к LLM с ограничением по времени"""
+        timeout = timeout or self.timeout
+        try:
+            return await asyncio.wait_for(
+                self._openai().chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=self.temperature,
+                    stream=stream,
+                    timeout=timeout
+                ),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"LLM не ответила за {timeout} с") from None
+
+    async def _complete(self, messages, max_tokens: int, timeout: Optional[float]) -> str:
+        await self._acquire()
+        try:
+            response = await self._create(messages, max_tokens, False, timeout)
+            return response.choices[0].message.content
+        finally:
+            self._release()
+
+    async def _stream(self, messages, max_tokens: int, timeout: Optional[float]) -> AsyncIterator[str]:
+        await self._acquire()
+        try:
+            stream = await self._create(messages, max_tokens, True, timeout)
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    yield text
+        finally:
+            self._release()
+
+    async def acomplete(self, messages, max_tokens: int, timeout: Optional[float] = None) -> str:
+        """Ответ LLM целиком (асинхронно)"""
+        return await self._bridge(self._complete(messages, max_tokens, timeout))
+
+    async def astream(self, messages, max_tokens: int, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Части ответа LLM по мере генерации (асинхронно)"""
+        stream = self._stream(messages, max_tokens, timeout)
+        try:
+            while True:
+                try:
+                    yield await self._bridge(stream.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            await self._bridge(stream.aclose())
+
+    def complete(self, messages, max_tokens: int, timeout: Optional[float] = None) -> str:
+        """Ответ LLM целиком (синхронно)"""
+        return self.run(self._complete(messages, max_tokens, timeout))
+
+    def stream(self, messages, max_tokens: int, timeout: Optional[float] = None) -> Iterator[str]:
+        """Части ответа LLM по мере генерации (синхронно, для st.write_stream)"""
+        stream = self._stream(messages, max_tokens, timeout)
+        try:
+            while True:
+                try:
+                    yield self.run(stream.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(stream.aclose())
+
+    def connect(self, connections: int = 1, timeout: Optional[float] = None) -> int:
+        """Открытие соединений пула заранее (TCP и TLS), чтобы первые запросы не ждали рукопожатия.
+
+        Возвращает число открытых соединений; если не открылось ни одно, исключение передается дальше.
+        """
+        return self.run(self._connect(connections), timeout or self.timeout)
+
+    def stats(self) -> Dict:
+        """Текущая загрузка клиента"""
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_connections': self.max_connections,
+        }
@@ -0,0 +1,161 @@
+import re
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+from text_utils import clip_tokens, estimate_tokens, normalize_text
+
+# Бюджет токенов профилей кандидатов в промпте select_top_doctors
+PROFILE_TOKEN_BUDGET = 6000
+
+# Конец профиля каждого кандидата и подпись блока полей, одинаковых у всех кандидатов
+PROFILE_SEPARATOR = "---\n"
+SHARED_FIELDS_LABEL = "У всех кандидатов"
+
+# Поля профиля по убыванию информативности: колонка, короткая подпись, предел токенов (None - без предела).
+# Основные поля получает каждый кандидат, попавший в промпт; подробности добавляются лучшим по
+# предранжированию кандидатам, пока хватает бюджета
+CORE_FIELDS: List[Tuple[str, str, Optional[int]]] = [
+    ('spec', 'Спец', None),
+    ('doctor_specialization', 'Профиль', 40),
+    ('specialities_list', 'Также', 40),
+    ('doctor_category', 'Кат', None),
+    ('degree', 'Степень', None),
+    ('gender', 'Пол', None),
+    ('clean_detail_text', 'Опыт', 100),
+]
+DETAIL_FIELDS: List[Tuple[str, str, Optional[int]]] = [
+    ('clean_review', 'Отзывы', 85),
+    ('education', 'Обр', 45),
+    ('clean_education_add', 'Доп. обр', 70),
+]
+
+# Длинные текстовые поля: выводятся отдельной строкой, повторяющиеся у разных врачей предложения
+# (описание клиники, шаблонные фразы) передаются только один раз
+TEXT_FIELDS = {'clean_detail_text', 'clean_review', 'clean_education_add'}
+MIN_BOILERPLATE_CHARS = 25
+
+# Короткие значения вместо кодов каталога
+VALUE_LABELS = {
+    'doctor_category': {'high': 'высшая', 'first': 'первая', 'second': 'вторая'},
+    'degree': {'Ph.D.Medicine': 'к.м.н.', 'D.Medicine': 'д.м.н.', 'Ph.D.Psychologic': 'к.психол.н.'},
+    'gender': {'male': 'м', 'female': 'ж'},
+}
+
+# Значения-заглушки, которые не несут информации
+EMPTY_VALUES = {'', 'none', 'nan', 'не указано', 'нет отзыва', 'нет отзывов'}
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?;])\s+')
+
+_FIELD_ORDER = [column for column, _, _ in CORE_FIELDS + DETAIL_FIELDS]
+_LABELS = {column: label for column, label, _ in CORE_FIELDS + DETAIL_FIELDS}
+
+
+def _is_empty(value) -> bool:
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return True
+    return normalize_text(value if not isinstance(value, (list, tuple)) else ' '.join(value)).strip(' .') in \
+        EMPTY_VALUES
+
+
+def _field_value(doctor: Dict, column: str, max_tokens: Optional[int], seen: Set[str]) -> Tuple[str, List[str]]:
+    """Сжатое значение поля и его новые шаблонные предложения ('' - поле не нужно)"""
+    value = doctor.get(column)
+    if _is_empty(value):
+        return '', []
+    if column == 'specialities_list':
+        spec = normalize_text(doctor.get('spec') or '')
+        value = ', '.join(item for item in value if item != spec)
+    else:
+        value = VALUE_LABELS.get(column, {}).get(value, value)
+    sentences = []
+    if column in TEXT_FIELDS:
+        parts = [part for part in SENTENCE_SPLIT_RE.split(str(value)) if part.strip()]
+        kept = [part for part in parts if len(part) < MIN_BOILERPLATE_CHARS or normalize_text(part) not in seen]
+        # Поле целиком из повторов (например, "Отзыв содержит только оценку") остается как есть
+        if kept:
+            value = ' '.join(kept)
+        sentences = [normalize_text(part) for part in kept if len(part) >= MIN_BOILERPLATE_CHARS]
+    value = clip_tokens(value, max_tokens) if max_tokens else str(value).strip()
+    return value, sentences
+
+
+def _field_tokens(column: str, value: str) -> int:
+    # Подпись, значение и разделитель ("; " или перевод строки)
+    return estimate_tokens(f"{_LABELS[column]}: {value}; ")
+
+
+def _render(fields: Dict[str, str], shared: Dict[str, str]) -> str:
+    short = [f"{_LABELS[column]}: {fields[column]}" for column in _FIELD_ORDER
+             if column in fields and column not in TEXT_FIELDS and column not in shared]
+    lines = ["; ".join(short)] if short else []
+    lines += [f"{_LABELS[column]}: {fields[column]}" for column in _FIELD_ORDER
+              if column in fields and column in TEXT_FIELDS]
+    return "\n".join(lines) + "\n" + PROFILE_SEPARATOR
+
+
+def pack_profiles(doctors: Sequence[Dict], token_budget: Optional[int] = PROFILE_TOKEN_BUDGET) -> Dict:
+    """Профили кандидатов для LLM в пределах token_budget (None - без ограничения).
+
+    doctors идут в порядке предранжирования. Сначала каждый кандидат по порядку получает основные
+    поля (CORE_FIELDS), пока они помещаются в бюджет; оставшийся бюджет по тому же порядку заполняется
+    подробностями (DETAIL_FIELDS). Заглушки ("none", "нет отзыва") не передаются, короткие поля,
+    одинаковые у всех кандидатов, выносятся в общую строку, повторяющиеся предложения передаются один раз.
+
+    Возвращает текст профилей, число вошедших кандидатов (первые count из doctors) и оценку токенов,
+    а также общую строку (shared) и профили по отдельности (profiles, по одному на каждого из первых
+    count кандидатов). Профиль врача, у которого все поля общие, пустой, но в списке остается: номера
+    для LLM берутся из этого списка, а не из разбора текста.
+    """
+    seen: Set[str] = set()
+    packed: List[Dict[str, str]] = []
+    used = 0
+    for doctor in doctors:
+        fields, sentences = {}, []
+        for column, _, max_tokens in CORE_FIELDS:
+            value, new_sentences = _field_value(doctor, column, max_tokens, seen)
+            if value:
+                fields[column] = value
+                sentences += new_sentences
+        tokens = sum(_field_tokens(column, value) for column, value in fields.items()) + \
+            estimate_tokens(PROFILE_SEPARATOR)
+        if token_budget is not None and packed and used + tokens > token_budget:
+            break
+        packed.append(fields)
+        seen.update(sentences)
+        used += tokens
+
+    for column, _, max_tokens in DETAIL_FIELDS:
+        for fields, doctor in zip(packed, doctors):
+            value, sentences = _field_value(doctor, column, max_tokens, seen)
+            if not value:
+                continue
+            tokens = _field_tokens(column, value)
+            if token_budget is not None and used + tokens > token_budget:
+                continue  # Более короткое поле следующего кандидата еще может поместиться
+            fields[column] = value
+            seen.update(sentences)
+            used += tokens
+
+    shared = {}
+    if len(packed) > 1:
+        for column in _FIELD_ORDER:
+            values = {fields.get(column) for fields in packed}
+            if column not in TEXT_FIELDS and len(values) == 1 and None not in values:
+                shared[column] = values.pop()
+    shared_text = ""
+    if shared:
+        shared_text = f"{SHARED_FIELDS_LABEL}: " + "; ".join(
+            f"{_LABELS[column]}: {value}" for column, value in shared.items()) + "\n" + PROFILE_SEPARATOR
+    profiles = [_render(fields, shared) for fields in packed]
+    text = shared_text + "".join(profiles)
+    return {
+        'text': text,
+        'shared': shared_text,
+        'profiles': profiles,
+        'count': len(packed),
+        'dropped': len(doctors) - len(packed),
+        'tokens': estimate_tokens(text),
+        'budget': token_budget,
+    }
+
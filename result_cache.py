@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Файл кэша сжимается (переписывается только действующими записями), когда записей в нем
+# в LOG_COMPACT_FACTOR раз больше, чем max_entries
+LOG_COMPACT_FACTOR = 2
+
+
+def canonical_key(*parts: Any) -> str:
+    """SHA256 от канонического JSON частей ключа (порядок ключей словарей не важен)"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Общий для всех сессий кэш результатов с вытеснением LRU и сроком жизни записей.
+
+    Значения должны сериализоваться в JSON: при заданном path каждая запись дописывается строкой
+    в конец файла (JSON Lines), и кэш переживает перезапуск сервера. Файл целиком переписывается
+    только при смене версии, очистке и сжатии (см. LOG_COMPACT_FACTOR). version - версия данных, из которых
+    посчитаны результаты (например, каталога врачей); при ее смене кэш очищается.
+    max_bytes (если задан) ограничивает суммарный размер значений в JSON: старые записи
+    вытесняются, пока кэш не уложится и в число записей, и в размер.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 6 * 3600, path: Optional[str] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.path = path
+        self.version = None
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._bytes = 0
+        self._log_records = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            self._load()
+
+    def bind_version(self, version: Any):
+        """Привязка к версии данных; записи другой версии удаляются"""
+        version = json.loads(json.dumps(version, default=str))
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None or self._entries:
+                print(f"Версия данных изменилась, кэш очищен ({len(self._entries)} записей)")
+            self.version = version
+            self._entries.clear()
+            self._bytes = 0
+            self._compact()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def __contains__(self, key: str) -> bool:
+        """Есть ли действующая запись (без учета в счетчиках и порядке вытеснения)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] >= time.time()
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Запись значения; ttl_seconds - срок жизни этой записи вместо общего"""
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.time() + ttl_seconds
+        # Сериализация вне блокировки: под ней только изменение словаря и дозапись одной строки
+        size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        record = json.dumps(['set', key, expires_at, value], ensure_ascii=False) + '\n' if self.path else None
+        with self._lock:
+            self._remove(key)
+            self._add(key, expires_at, value, size)
+            self._evict()
+            if record:
+                self._append(record)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._compact()
+
+    def _add(self, key: str, expires_at: float, value: Any, size: Optional[int] = None):
+        if size is None:
+            size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        """Вытеснение самых давно использованных записей сверх лимитов (под блокировкой)"""
+        while len(self._entries) > self.max_entries or \
+                (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def _load(self):
+        """Чтение сохраненного кэша: записи применяются по порядку, просроченные отбрасываются"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Не удалось прочитать кэш {self.path}: {e}")
+            return
+        now = time.time()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Недописанная строка (процесс остановлен во время записи)
+            if not isinstance(record, list) or not record:
+                continue
+            if record[0] == 'version':
+                self.version = record[1]
+                self._entries.clear()
+                self._bytes = 0
+            elif record[0] == 'set':
+                _, key, expires_at, value = record
+                self._remove(key)
+                if expires_at >= now:
+                    self._add(key, expires_at, value)
+                    self._evict()
+        self._log_records = len(lines)
+        if self._log_records > len(self._entries) + 1:
+            self._compact()
+
+    def _append(self, record: str):
+        """Дозапись одной строки в файл кэша (вызывается под блокировкой)"""
+        self._log_records += 1
+        if self._log_records > LOG_COMPACT_FACTOR * self.max_entries:
+            self._compact()
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(record)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш {self.path}: {e}")
+
+    def _compact(self):
+        """Атомарная перезапись файла кэша действующими записями (вызывается под блокировкой)"""
+        if not self.path:
+            return
+        records = [['version', self.version]] + \
+            [['set', key, expires_at, value] for key, (expires_at, value, _) in self._entries.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+            self._log_records = len(records)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш {self.path}: {e}")
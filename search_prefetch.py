@@ -0,0 +1,233 @@
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+import pandas as pd
+
+from ai_helper import (client, explain_doctors, select_top_doctors_cached, select_top_doctors_cached_async,
+                       select_top_doctors_structured_cached, select_top_doctors_structured_cached_async,
+                       stream_top_doctors_cached)
+from doctor_scoring import local_top_doctors, selected_doctors
+from profile_packer import pack_profiles
+from result_cache import canonical_key
+
+# Общий пул фонового подбора на процесс: число одновременных подборов не растет с числом сессий
+PREFETCH_WORKERS = 4
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='lilu-prefetch')
+
+# Разбор от LLM: структурированный выбор (номера и короткие причины, карточки из каталога)
+# или подробный свободный текст
+STRUCTURED_SELECTION = True
+
+# Сколько последних результатов фонового подбора хранится в сессии
+MAX_PREFETCHED_RESULTS = 4
+
+
+def search_results_key(target_specialty: str, criteria: Dict, query_text: str, catalog_version) -> str:
+    """Ключ результатов подбора: все входные данные, от которых зависит страница результатов"""
+    return canonical_key(target_specialty, criteria, query_text, catalog_version)
+
+
+def compute_search_results(matcher, target_specialty: str, criteria: Dict, criteria_text: str, query_text: str,
+                           with_llm: bool = True, verbose: bool = True) -> Dict:
+    """Полный подбор врачей: кандидаты, локальный рейтинг и (если with_llm) разбор от LLM"""
+    catalog_version = matcher.catalog.version
+    filtered_df, candidates_profiles = matcher.get_filtered_candidates(
+        target_specialty, query_text=query_text, criteria=criteria, verbose=verbose)
+    if 'profiles' in filtered_df.attrs:
+        print(f"Профили кандидатов для {target_specialty}: {filtered_df.attrs['profiles']}")
+    num_doctors = min(5, len(filtered_df))  # Не больше чем есть кандидатов
+    results = {
+        'key': search_results_key(target_specialty, criteria, query_text, catalog_version),
+        'catalog_version': catalog_version,
+        'filtered_df': filtered_df,
+        'candidates_profiles': candidates_profiles,
+        'profile_blocks': filtered_df.attrs.get('profile_blocks', {'shared': "", 'profiles': []}),
+        'local_top': local_top_doctors(filtered_df, criteria, query_text, num_doctors),
+        'recommendation': None,
+        'selection': None,
+        'explanations': {},
+        'llm_done': False,
+    }
+    if with_llm and not filtered_df.empty:
+        refine_with_llm(results, target_specialty, criteria, criteria_text)
+    return results
+
+
+def _selection_arguments(results: Dict, target_specialty: str, criteria: Dict,
+                         criteria_text: str) -> Tuple[tuple, Dict]:
+    """Аргументы подбора от LLM: структурированному выбору - профили по отдельности, номера которых
+    совпадают со строками filtered_df, подробному разбору - текст профилей"""
+    kwargs = {
+        'num_doctors': len(results['local_top']),
+        'criteria': criteria,
+        'catalog_version': results['catalog_version'],
+        'candidate_ids': results['filtered_df'].index.tolist(),
+    }
+    if STRUCTURED_SELECTION:
+        blocks = results['profile_blocks']
+        return (blocks['profiles'], criteria_text, target_specialty), dict(kwargs, shared=blocks['shared'])
+    return (results['candidates_profiles'], criteria_text, target_specialty), kwargs
+
+
+def refine_with_llm(results: Dict, target_specialty: str, criteria: Dict, criteria_text: str) -> Dict:
+    """Разбор кандидатов от LLM поверх локального рейтинга (через общий кэш подбора)"""
+    select = select_top_doctors_structured_cached if STRUCTURED_SELECTION else select_top_doctors_cached
+    args, kwargs = _selection_arguments(results, target_specialty, criteria, criteria_text)
+    results['selection' if STRUCTURED_SELECTION else 'recommendation'] = select(*args, **kwargs)
+    results['llm_done'] = True
+    return results
+
+
+async def refine_with_llm_async(results: Dict, target_specialty: str, criteria: Dict, criteria_text: str) -> Dict:
+    """Асинхронный refine_with_llm: отмена задачи прерывает запрос к LLM (для фонового подбора)"""
+    select = select_top_doctors_structured_cached_async if STRUCTURED_SELECTION else select_top_doctors_cached_async
+    args, kwargs = _selection_arguments(results, target_specialty, criteria, criteria_text)
+    results['selection' if STRUCTURED_SELECTION else 'recommendation'] = await select(*args, **kwargs)
+    results['llm_done'] = True
+    return results
+
+
+def final_top_doctors(results: Dict) -> pd.DataFrame:
+    """Итоговые врачи: выбор LLM, если он есть, иначе локальный рейтинг"""
+    if results.get('selection'):
+        return selected_doctors(results['filtered_df'], results['selection'])
+    return results['local_top']
+
+
+def stream_explanations(results: Dict, target_specialty: str, criteria_text: str) -> Iterator[Tuple[int, str]]:
+    """Объяснения выбора LLM для итоговых врачей, которых еще нет в results['explanations'].
+
+    Отдает (позиция в final_top_doctors, текст) по мере готовности: запросы идут параллельно.
+    """
+    if not results.get('selection'):
+        return
+    top = final_top_doctors(results)
+    explanations = results.setdefault('explanations', {})
+    missing = [position for position, row_id in enumerate(top.index) if row_id not in explanations]
+    if not missing:
+        return
+    doctors = top.to_dict('records')
+    profiles = [pack_profiles([doctors[position]], token_budget=None)['text'] for position in missing]
+    for i, explanation in explain_doctors(profiles, criteria_text, target_specialty):
+        if explanation:
+            explanations[top.index[missing[i]]] = explanation
+            yield missing[i], explanation
+
+
+def stream_refine_with_llm(results: Dict, target_specialty: str, criteria: Dict, criteria_text: str) -> Iterator[str]:
+    """Потоковый refine_with_llm: части разбора отдаются по мере генерации (для st.write_stream)"""
+    parts = []
+    for text in stream_top_doctors_cached(
+            results['candidates_profiles'],
+            criteria_text,
+            target_specialty,
+            num_doctors=len(results['local_top']),
+            criteria=criteria,
+            catalog_version=results['catalog_version'],
+            candidate_ids=results['filtered_df'].index.tolist()):
+        parts.append(text)
+        yield text
+    results['recommendation'] = "".join(parts) or None
+    results['llm_done'] = True
+
+
+class SearchPrefetcher:
+    """Фоновый подбор врачей для одной сессии, пока пациент отвечает на уточняющие вопросы.
+
+    Каждый новый набор ответов заменяет ожидающий запрос (выполняется только последний) и отменяет
+    уже идущий запрос к LLM для прежних ответов. Результат сохраняется, только если ответы с тех пор
+    не менялись; страница результатов забирает его по ключу входных данных без ожидания.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._pending = None
+        self._in_flight = None
+        self._llm_future = None
+        self._running = False
+        self._latest_key = None
+        self._results: Dict[str, Dict] = {}
+
+    def submit(self, target_specialty: str, criteria: Dict, criteria_text: str, query_text: str,
+               with_llm: bool = True):
+        """Запуск подбора в фоне (повторный запрос с теми же данными игнорируется)"""
+        key = (search_results_key(target_specialty, criteria, query_text, self.matcher.catalog.version), with_llm)
+        with self._lock:
+            if key == self._latest_key:
+                return
+            self._latest_key = key
+            self._pending = (key[0], target_specialty, criteria, criteria_text, query_text, with_llm)
+            if self._llm_future is not None:
+                self._llm_future.cancel()  # Разбор для прежних ответов больше не нужен
+            if self._running:
+                return
+            self._running = True
+        _executor.submit(self._run)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                args, self._pending = self._pending, None
+                self._in_flight = args[0] if args else None
+                self._done.notify_all()
+                if args is None:
+                    self._running = False
+                    return
+            _, target_specialty, criteria, criteria_text, query_text, with_llm = args
+            try:
+                results = compute_search_results(self.matcher, target_specialty, criteria, criteria_text, query_text,
+                                                 with_llm=False, verbose=False)
+                if with_llm and not results['filtered_df'].empty and not self._refine(results, target_specialty,
+                                                                                      criteria, criteria_text):
+                    continue
+            except Exception as e:
+                print(f"Ошибка фонового подбора врачей: {e}")
+                continue
+            with self._lock:
+                if results['key'] != self._latest_key[0]:
+                    continue  # Ответы уже изменились: результат для прежних ответов не нужен
+                previous = self._results.pop(results['key'], None)
+                # Результат с разбором LLM не заменяем результатом без него
+                self._results[results['key']] = previous if previous and previous['llm_done'] and not \
+                    results['llm_done'] else results
+                while len(self._results) > MAX_PREFETCHED_RESULTS:
+                    self._results.pop(next(iter(self._results)))
+
+    def _refine(self, results: Dict, target_specialty: str, criteria: Dict, criteria_text: str) -> bool:
+        """Разбор от LLM с возможностью отмены из submit (False - отменен, ответы изменились)"""
+        with self._lock:
+            if self._pending is not None:
+                return False  # Пока искали кандидатов, пришли новые ответы
+            future = self._llm_future = client.submit(
+                refine_with_llm_async(results, target_specialty, criteria, criteria_text))
+        try:
+            future.result()
+            return True
+        except CancelledError:
+            return False
+        finally:
+            with self._lock:
+                self._llm_future = None
+
+    def result_for(self, key: str, wait: float = 0.0) -> Optional[Dict]:
+        """Готовый результат для этих входных данных (None, если еще не посчитан).
+
+        wait > 0 - сколько секунд ждать, если подбор именно для этих данных сейчас выполняется
+        (чтобы не запускать второй такой же вызов LLM).
+        """
+        deadline = time.monotonic() + wait
+        with self._lock:
+            while self._is_computing(key):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._done.wait(remaining)
+            return self._results.get(key)
+
+    def _is_computing(self, key: str) -> bool:
+        """Подбор для key выполняется или ждет очереди (вызывается под блокировкой)"""
+        return self._in_flight == key or (self._pending is not None and self._pending[0] == key)
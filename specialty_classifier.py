@@ -0,0 +1,312 @@
+"""Локальный классификатор специалиста по жалобам: TF-IDF по хешированным признакам и
+логистическая регрессия на NumPy. Обучается на журнале консультаций, где специалиста назвала LLM.
+
+Запуск:
+    python specialty_classifier.py train [--log consultations.jsonl] [--output specialty_model.npz]
+    python specialty_classifier.py evaluate [--log consultations.jsonl] [--min-probability 0.8]
+
+Уверенный ответ модели (вероятность не ниже CLASSIFIER_MIN_PROBABILITY) заменяет вызов LLM
+в get_ai_recommendation, остальные случаи по-прежнему решает LLM.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from doctor_embeddings import _normalized, hashed_counts
+from emergency_detector import is_emergency_answer
+from specialty_resolver import display_name, resolve_specialty
+from text_utils import normalize_text
+
+# Журнал консультаций (жалобы, ответ LLM, время ответа) и файл модели. Журнал содержит жалобы пациентов,
+# поэтому по умолчанию выключен и ограничен по размеру: после CONSULTATION_LOG_MAX_BYTES записи прекращаются
+CONSULTATION_LOG_ENABLED = False
+CONSULTATION_LOG_PATH = "consultations.jsonl"
+CONSULTATION_LOG_MAX_BYTES = 20 * 1024 * 1024
+CLASSIFIER_MODEL_PATH = "specialty_model.npz"
+
+# Ниже этой вероятности решение остается за LLM
+CLASSIFIER_MIN_PROBABILITY = 0.8
+
+# Ответы LLM с вызовом скорой обучают отдельный класс. Модель никогда не отвечает им сама:
+# если вероятность этого класса не ниже EMERGENCY_MAX_PROBABILITY, решение остается за LLM
+EMERGENCY_LABEL = 'скорая'
+EMERGENCY_MAX_PROBABILITY = 0.1
+
+# Обучение: размерность признаков, минимум примеров на класс, доля отложенной выборки
+CLASSIFIER_DIM = 2048
+MIN_CLASS_EXAMPLES = 3
+HOLDOUT_SHARE = 0.2
+EPOCHS = 300
+LEARNING_RATE = 2.0
+L2_PENALTY = 1e-4
+
+_log_lock = threading.Lock()
+
+
+def canonical_label(answer: str) -> Optional[str]:
+    """Каноническая специальность из ответа LLM, EMERGENCY_LABEL для вызова скорой (None - не распознана)"""
+    if not answer:
+        return None
+    if is_emergency_answer(answer):
+        return EMERGENCY_LABEL
+    return resolve_specialty(answer)
+
+
+def log_consultation(text: str, answer: str, latency_ms: Optional[float] = None,
+                     path: Optional[str] = CONSULTATION_LOG_PATH):
+    """Запись ответа LLM в журнал для обучения классификатора (только при CONSULTATION_LOG_ENABLED)"""
+    if not CONSULTATION_LOG_ENABLED or not path or not text or not answer:
+        return
+    record = {'ts': round(time.time(), 3), 'text': text, 'answer': answer, 'latency_ms': latency_ms}
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    try:
+        with _log_lock:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size + len(line.encode('utf-8')) > CONSULTATION_LOG_MAX_BYTES:
+                return
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Не удалось записать журнал консультаций {path}: {e}")
+
+
+def read_consultation_log(path: str) -> List[Dict]:
+    """Записи журнала с распознанным специалистом (повторы текста схлопываются, побеждает последняя)"""
+    records = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            label = canonical_label(record.get('answer'))
+            if label and record.get('text'):
+                records[normalize_text(record['text'])] = dict(record, label=label)
+    return list(records.values())
+
+
+class SpecialtyClassifier:
+    """Линейный классификатор над L2-нормированными TF-IDF векторами хешированных признаков"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, idf: np.ndarray, classes: Sequence[str]):
+        self.weights = weights
+        self.bias = bias
+        self.idf = idf
+        self.classes = list(classes)
+
+    @property
+    def dim(self) -> int:
+        return self.idf.shape[0]
+
+    @staticmethod
+    def _counts(texts: Sequence[str], dim: int) -> np.ndarray:
+        counts = np.zeros((len(texts), dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            counts[i] = hashed_counts(text, dim)
+        return counts
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[str], dim: int = CLASSIFIER_DIM,
+              epochs: int = EPOCHS) -> 'SpecialtyClassifier':
+        """Мультиклассовая логистическая регрессия полным градиентным спуском"""
+        classes = sorted(set(labels))
+        counts = cls._counts(texts, dim)
+        doc_freq = (counts > 0).sum(axis=0)
+        idf = (np.log((1 + len(texts)) / (1 + doc_freq)) + 1).astype(np.float32)
+        features = _normalized(counts * idf)
+        targets = np.zeros((len(texts), len(classes)), dtype=np.float32)
+        targets[np.arange(len(texts)), [classes.index(label) for label in labels]] = 1
+
+        weights = np.zeros((dim, len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        for _ in range(epochs):
+            gradient = _softmax(features @ weights + bias) - targets
+            weights -= LEARNING_RATE * (features.T @ gradient / len(texts) + L2_PENALTY * weights)
+            bias -= LEARNING_RATE * gradient.mean(axis=0)
+        return cls(weights, bias, idf, classes)
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        features = _normalized(self._counts(texts, self.dim) * self.idf)
+        return _softmax(features @ self.weights + self.bias)
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """Специалист и его вероятность"""
+        if not self.classes:
+            return None, 0.0
+        probabilities = self.predict_proba([text])[0]
+        best = int(np.argmax(probabilities))
+        return self.classes[best], float(probabilities[best])
+
+    def confident_specialty(self, text: str, min_probability: float = CLASSIFIER_MIN_PROBABILITY) -> Optional[str]:
+        """Специалист, которым можно заменить ответ LLM (None - решает LLM).
+
+        Класс скорой помощи никогда не возвращается: при заметной вероятности вызова скорой
+        ответ остается за LLM, промпт которой направляет такие случаи на 103.
+        """
+        if not self.classes:
+            return None
+        probabilities = self.predict_proba([text])[0]
+        if EMERGENCY_LABEL in self.classes and \
+                probabilities[self.classes.index(EMERGENCY_LABEL)] >= EMERGENCY_MAX_PROBABILITY:
+            return None
+        best = int(np.argmax(probabilities))
+        if self.classes[best] == EMERGENCY_LABEL or probabilities[best] < min_probability:
+            return None
+        return self.classes[best]
+
+    def save(self, path: str):
+        """Сохранение в .npz: только массивы NumPy, загрузка без pickle за миллисекунды"""
+        with open(path, 'wb') as f:
+            np.savez(f, weights=self.weights, bias=self.bias, idf=self.idf, classes=np.array(self.classes))
+
+    @classmethod
+    def load(cls, path: str) -> 'SpecialtyClassifier':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['weights'], data['bias'], data['idf'], data['classes'].tolist())
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+_model_lock = threading.Lock()
+_loaded_model: Dict[str, Tuple[Tuple[float, int], SpecialtyClassifier]] = {}
+
+
+def load_classifier(path: str = CLASSIFIER_MODEL_PATH) -> Optional[SpecialtyClassifier]:
+    """Модель с диска (перечитывается после переобучения); None - модели нет"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stamp = (stat.st_mtime, stat.st_size)
+    with _model_lock:
+        cached = _loaded_model.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        try:
+            model = SpecialtyClassifier.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Не удалось загрузить классификатор {path}: {e}")
+            return None
+        _loaded_model[path] = (stamp, model)
+        return model
+
+
+def predict_specialty(text: str, min_probability: float = CLASSIFIER_MIN_PROBABILITY,
+                      path: str = CLASSIFIER_MODEL_PATH) -> Optional[str]:
+    """Специалист от локальной модели, если она уверена; иначе None (решает LLM)"""
+    model = load_classifier(path)
+    if model is None or not text:
+        return None
+    label = model.confident_specialty(text, min_probability)
+    return display_name(label) if label else None
+
+
+def _is_holdout(text: str) -> bool:
+    """Стабильное разбиение на обучение и проверку по хешу текста"""
+    return zlib.crc32(normalize_text(text).encode('utf-8')) % 100 < HOLDOUT_SHARE * 100
+
+
+def _trainable(records: List[Dict]) -> List[Dict]:
+    """Записи классов, для которых хватает примеров"""
+    counts = {}
+    for record in records:
+        counts[record['label']] = counts.get(record['label'], 0) + 1
+    return [record for record in records if counts[record['label']] >= MIN_CLASS_EXAMPLES]
+
+
+def train_from_log(log_path: str, output_path: str, holdout: bool = False) -> Dict:
+    """Обучение на журнале консультаций (holdout - без отложенной выборки, для оценки)"""
+    started = time.perf_counter()
+    records = _trainable(read_consultation_log(log_path))
+    if holdout:
+        records = [record for record in records if not _is_holdout(record['text'])]
+    if len({record['label'] for record in records}) < 2:
+        raise ValueError(f"В журнале {log_path} недостаточно примеров: нужно хотя бы два специалиста "
+                         f"по {MIN_CLASS_EXAMPLES} консультации")
+    model = SpecialtyClassifier.train([record['text'] for record in records],
+                                      [record['label'] for record in records])
+    model.save(output_path)
+    return {
+        'output': output_path,
+        'examples': len(records),
+        'classes': len(model.classes),
+        'bytes': os.path.getsize(output_path),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None}
+    return {'p50_ms': round(float(np.percentile(values, 50)), 3),
+            'p95_ms': round(float(np.percentile(values, 95)), 3)}
+
+
+def evaluate(log_path: str, min_probability: float = CLASSIFIER_MIN_PROBABILITY) -> Dict:
+    """Отчет: совпадение с ответами LLM на отложенной выборке, доля вызовов LLM, которые
+    заменяет модель, и время ответа модели против времени ответа LLM из журнала"""
+    records = _trainable(read_consultation_log(log_path))
+    holdout = [record for record in records if _is_holdout(record['text'])]
+    model_path = f"{log_path}.eval.npz"
+    training = train_from_log(log_path, model_path, holdout=True)
+    load_started = time.perf_counter()
+    model = SpecialtyClassifier.load(model_path)
+    load_ms = (time.perf_counter() - load_started) * 1000
+    os.remove(model_path)
+
+    correct = confident = confident_correct = emergency_missed = 0
+    latencies = []
+    for record in holdout:
+        started = time.perf_counter()
+        label, _ = model.predict(record['text'])
+        confident_label = model.confident_specialty(record['text'], min_probability)
+        latencies.append((time.perf_counter() - started) * 1000)
+        correct += label == record['label']
+        if confident_label:
+            confident += 1
+            confident_correct += confident_label == record['label']
+            emergency_missed += record['label'] == EMERGENCY_LABEL
+    llm_latencies = [record['latency_ms'] for record in records if record.get('latency_ms')]
+    return {
+        'train_examples': training['examples'],
+        'holdout_examples': len(holdout),
+        'classes': training['classes'],
+        'accuracy': round(correct / len(holdout), 3) if holdout else None,
+        'min_probability': min_probability,
+        'coverage': round(confident / len(holdout), 3) if holdout else None,
+        'confident_accuracy': round(confident_correct / confident, 3) if confident else None,
+        'emergency_missed': emergency_missed,
+        'model_load_ms': round(load_ms, 3),
+        'model_latency': _percentiles(latencies),
+        'llm_latency': _percentiles(llm_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный классификатор специалиста по жалобам")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help="обучение на журнале консультаций")
+    train_parser.add_argument('--log', default=CONSULTATION_LOG_PATH)
+    train_parser.add_argument('--output', default=CLASSIFIER_MODEL_PATH)
+    evaluate_parser = subparsers.add_parser('evaluate', help="сравнение с LLM на отложенной выборке")
+    evaluate_parser.add_argument('--log', default=CONSULTATION_LOG_PATH)
+    evaluate_parser.add_argument('--min-probability', type=float, default=CLASSIFIER_MIN_PROBABILITY)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        print(f"Классификатор обучен: {train_from_log(args.log, args.output)}")
+    else:
+        print(json.dumps(evaluate(args.log, args.min_probability), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
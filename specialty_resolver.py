@@ -0,0 +1,171 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from text_utils import normalize_text, stem, tokenize
+
+# Канонические специальности: id (значение spec в каталоге или общепринятое название) ->
+# (название для интерфейса, синонимы и словоформы, префиксы слов для поиска в полях специальностей каталога)
+SPECIALTIES: Dict[str, Tuple[str, Sequence[str], Sequence[str]]] = {
+    'терапевт': ('Терапевт', ['терапевт', 'терапия', 'врач общей практики', 'семейный врач', 'участковый врач',
+                              'участковый терапевт'], ['терапевт', 'терапия']),
+    'кардиолог': ('Кардиолог', ['кардиолог', 'кардиология', 'аритмолог'], ['кардиолог', 'аритмолог']),
+    'невролог': ('Невролог', ['невролог', 'неврология', 'невропатолог', 'невропатология'],
+                 ['невролог', 'невропатолог']),
+    'гастроэнтеролог': ('Гастроэнтеролог', ['гастроэнтеролог', 'гастроэнтерология', 'гастролог', 'гепатолог'],
+                        ['гастроэнтеролог', 'гепатолог']),
+    'эндокринолог': ('Эндокринолог', ['эндокринолог', 'эндокринология'], ['эндокринолог']),
+    'офтальмолог': ('Офтальмолог', ['офтальмолог', 'офтальмология', 'окулист', 'глазной врач', 'глазник'],
+                    ['офтальмолог', 'окулист']),
+    'лор': ('ЛОР', ['лор', 'отоларинголог', 'оториноларинголог', 'отоларингология', 'оториноларингология',
+                    'ухо горло нос'], ['лор', 'отоларинголог', 'оториноларинголог']),
+    'дерматолог': ('Дерматолог', ['дерматолог', 'дерматология', 'дерматовенеролог', 'дерматовенерология',
+                                  'венеролог', 'кожный врач', 'кожник', 'трихолог'],
+                   ['дерматолог', 'дерматовенеролог', 'венеролог', 'трихолог']),
+    'гинеколог': ('Гинеколог', ['гинеколог', 'гинекология', 'акушер', 'акушерство', 'акушер гинеколог'],
+                  ['гинеколог', 'акушер']),
+    'уролог': ('Уролог', ['уролог', 'урология', 'андролог'], ['уролог', 'андролог']),
+    'травматолог': ('Травматолог', ['травматолог', 'травматология', 'ортопед', 'травматолог ортопед', 'травмпункт'],
+                    ['травматолог', 'ортопед']),
+    'хирург': ('Хирург', ['хирург', 'хирургия'], ['хирург']),
+    'педиатр': ('Педиатр', ['педиатр', 'педиатрия', 'детский врач', 'неонатолог'], ['педиатр', 'неонатолог']),
+    'психиатр': ('Психиатр', ['психиатр', 'психиатрия', 'психотерапевт', 'нарколог'],
+                 ['психиатр', 'психотерапевт', 'нарколог']),
+    'психолог': ('Психолог', ['психолог', 'психология'], ['психолог']),
+    'стоматолог': ('Стоматолог', ['стоматолог', 'стоматология', 'зубной врач', 'дантист', 'ортодонт',
+                                  'пародонтолог'],
+                   ['стоматолог', 'ортодонт', 'пародонтолог', 'парадонтолог', 'имплантолог']),
+    'онколог': ('Онколог', ['онколог', 'онкология', 'маммолог'], ['онколог', 'онко', 'маммолог']),
+    'аллерголог': ('Аллерголог', ['аллерголог', 'аллергология', 'иммунолог', 'аллерголог иммунолог'],
+                   ['аллерголог', 'иммунолог']),
+    'ревматолог': ('Ревматолог', ['ревматолог', 'ревматология'], ['ревматолог']),
+    'гематолог': ('Гематолог', ['гематолог', 'гематология', 'гемостазиолог'], ['гематолог', 'гемостазиолог']),
+    'рентгенолог': ('Рентгенолог', ['рентгенолог', 'рентгенология'], ['рентгенолог']),
+    'анастезиолог': ('Анестезиолог', ['анестезиолог', 'анастезиолог', 'анестезиология'],
+                     ['анестезиолог', 'анастезиолог']),
+    'врач узд': ('Врач УЗД', ['врач узд', 'врач узи', 'узи', 'узд', 'ультразвуковая диагностика', 'узист'],
+                 ['узи', 'узд', 'уз-диагност', 'ультразвуков']),
+    'массаж': ('Массаж', ['массаж', 'массажист'], ['массаж']),
+    'лфк': ('ЛФК', ['лфк', 'лечебная физкультура'], ['лфк']),
+    # Специальности, которые называет LLM, хотя в spec каталога их нет: ищутся по специализациям врачей
+    'пульмонолог': ('Пульмонолог', ['пульмонолог', 'пульмонология'], ['пульмонолог']),
+    'нефролог': ('Нефролог', ['нефролог', 'нефрология'], ['нефролог']),
+    'инфекционист': ('Инфекционист', ['инфекционист'], ['инфекционист']),
+    'флеболог': ('Флеболог', ['флеболог', 'флебология'], ['флеболог']),
+    'проктолог': ('Проктолог', ['проктолог', 'колопроктолог', 'проктология'], ['проктолог', 'колопроктолог']),
+    'сомнолог': ('Сомнолог', ['сомнолог'], ['сомнолог']),
+    'диетолог': ('Диетолог', ['диетолог', 'нутрициолог'], ['диетолог', 'нутрициолог']),
+    'логопед': ('Логопед', ['логопед'], ['логопед']),
+    'физиотерапевт': ('Физиотерапевт', ['физиотерапевт', 'физиотерапия'], ['физиотерапевт', 'физиотерапия']),
+    'мануальный терапевт': ('Мануальный терапевт', ['мануальный терапевт', 'мануальная терапия', 'остеопат'],
+                            ['мануальн', 'остеопат']),
+    'реабилитолог': ('Реабилитолог', ['реабилитолог'], ['реабилитолог']),
+    'альголог': ('Альголог', ['альголог'], ['альголог']),
+}
+
+# Выбор специальности вручную (show_specialty_selection)
+SELECTABLE_SPECIALTIES = [
+    'терапевт', 'кардиолог', 'невролог', 'гастроэнтеролог', 'эндокринолог', 'офтальмолог', 'лор', 'дерматолог',
+    'гинеколог', 'уролог', 'травматолог', 'хирург', 'педиатр', 'психиатр', 'психолог', 'стоматолог', 'онколог',
+    'аллерголог', 'ревматолог',
+]
+
+# Опечатки: слова не короче MIN_TYPO_LENGTH букв, расстояние правки до 1 (до 2 у слов от LONG_TYPO_LENGTH букв)
+MIN_TYPO_LENGTH = 5
+LONG_TYPO_LENGTH = 9
+
+# Самая длинная фраза-синоним в словах
+_MAX_ALIAS_WORDS = 3
+
+
+def _alias_key(text: str) -> Tuple[str, ...]:
+    return tuple(stem(token) for token in tokenize(normalize_text(text)))
+
+
+def _build_aliases() -> Dict[Tuple[str, ...], str]:
+    aliases = {}
+    for specialty_id, (_, synonyms, _) in SPECIALTIES.items():
+        for synonym in [specialty_id] + list(synonyms):
+            aliases[_alias_key(synonym)] = specialty_id
+    return aliases
+
+
+ALIASES = _build_aliases()
+_TYPO_STEMS = [(key[0], specialty_id) for key, specialty_id in ALIASES.items()
+               if len(key) == 1 and len(key[0]) >= MIN_TYPO_LENGTH]
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (перестановка соседних букв - одна правка); > limit - досрочный выход"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _typo_match(word_stem: str) -> Optional[str]:
+    """Специальность, от названия которой слово отличается опечаткой (только однозначное совпадение)"""
+    if len(word_stem) < MIN_TYPO_LENGTH:
+        return None
+    limit = 2 if len(word_stem) >= LONG_TYPO_LENGTH else 1
+    best, best_distance = set(), limit + 1
+    for alias_stem, specialty_id in _TYPO_STEMS:
+        distance = _edit_distance(word_stem, alias_stem, limit)
+        if distance < best_distance:
+            best, best_distance = {specialty_id}, distance
+        elif distance == best_distance:
+            best.add(specialty_id)
+    return next(iter(best)) if len(best) == 1 and best_distance <= limit else None
+
+
+@lru_cache(maxsize=4096)
+def _resolve(text: str) -> Tuple[str, ...]:
+    stems = _alias_key(text)
+    found = []
+    i = 0
+    while i < len(stems):
+        for size in range(min(_MAX_ALIAS_WORDS, len(stems) - i), 0, -1):
+            specialty_id = ALIASES.get(stems[i:i + size])
+            if specialty_id:
+                break
+        else:
+            size, specialty_id = 1, _typo_match(stems[i])
+        if specialty_id and specialty_id not in found:
+            found.append(specialty_id)
+        i += size
+    return tuple(found)
+
+
+def resolve_specialties(text: str) -> List[str]:
+    """Канонические специальности в тексте в порядке упоминания.
+
+    Понимает синонимы ("окулист", "ухо-горло-нос"), словоформы ("к неврологу") и опечатки
+    ("невралог"), в том числе в целой фразе ответа LLM ("Рекомендую обратиться к неврологу.").
+    """
+    if not text:
+        return []
+    return list(_resolve(str(text)))
+
+
+def resolve_specialty(text: str) -> Optional[str]:
+    """Первая каноническая специальность в тексте (None - специальность не распознана)"""
+    specialties = resolve_specialties(text)
+    return specialties[0] if specialties else None
+
+
+def display_name(specialty_id: str) -> str:
+    """Название специальности для интерфейса"""
+    return SPECIALTIES[specialty_id][0] if specialty_id in SPECIALTIES else specialty_id
+
+
+def catalog_terms(specialty_id: str) -> Sequence[str]:
+    """Префиксы слов, по которым специальность ищется в полях специальностей каталога"""
+    return SPECIALTIES[specialty_id][2] if specialty_id in SPECIALTIES else [specialty_id]
@@ -0,0 +1,49 @@
+import threading
+import time
+
+from audio_cache import AudioCache
+
+
+def test_concurrent_misses_create_once(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1024)
+    calls = []
+
+    def create():
+        calls.append(1)
+        time.sleep(0.05)
+        return b'ogg'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create('k', 'ogg', create)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [cache.path('k', 'ogg')] * 8
+
+
+def test_failed_create_is_not_cached(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1024)
+    assert cache.get_or_create('k', 'ogg', lambda: None) is None
+    assert cache.get_or_create('k', 'ogg', lambda: b'ogg') == cache.path('k', 'ogg')
+
+
+def test_evicts_least_recently_played_by_running_total(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10)
+    cache.put('a', 'ogg', b'1234')
+    cache.put('b', 'ogg', b'1234')
+    cache.get('a', 'ogg')  # 'a' воспроизведен недавно, вытесняется 'b'
+    cache.put('c', 'ogg', b'1234')
+    assert cache.get('b', 'ogg') is None
+    assert cache.get('a', 'ogg') and cache.get('c', 'ogg')
+    assert cache.stats()['bytes'] == 8
+    assert cache.stats()['evictions'] == 1
+
+
+def test_restart_picks_up_existing_files(tmp_path):
+    AudioCache(str(tmp_path), max_bytes=1024).put('a', 'ogg', b'1234')
+    cache = AudioCache(str(tmp_path), max_bytes=1024)
+    assert cache.get('a', 'ogg') == cache.path('a', 'ogg')
+    assert cache.stats()['bytes'] == 4
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog_compiler import compile_catalog
+from compiled_catalog import CompiledDoctorCatalog, write_compiled_catalog
+from doctor_catalog import DoctorCatalog, catalog_sources, reviews_path_for
+from doctor_filters import score_criteria
+from doctor_index import SpecialtyIndex
+from doctors import DoctorMatcher
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'all_doctors.csv')
+
+
+@pytest.fixture(scope='module')
+def catalogs(tmp_path_factory):
+    """Каталог из CSV и он же, скомпилированный и открытый через mmap"""
+    output_path = str(tmp_path_factory.mktemp('compiled') / 'all_doctors.lilu')
+    compile_catalog(CATALOG_PATH, reviews_path_for(CATALOG_PATH), output_path)
+    return DoctorCatalog.load(CATALOG_PATH), CompiledDoctorCatalog(output_path)
+
+
+def test_compiled_catalog_has_same_rows_as_csv(catalogs):
+    csv_catalog, compiled = catalogs
+    assert compiled.rows == csv_catalog.rows
+    expected = csv_catalog.df[compiled.columns]
+    pd.testing.assert_frame_equal(compiled.df, expected, check_dtype=False, check_index_type=False)
+    for name in ('gender_code', 'category_level', 'graduation_year', 'treats_children'):
+        assert compiled.attribute(name).dtype == np.int64
+        assert compiled.attribute(name).tolist() == csv_catalog.attribute(name).tolist()
+
+
+@pytest.mark.parametrize('specialty', ["невролог", "Врач-невролог.", "ЛОР", "детский хирург", "кардиолог", "лог"])
+def test_compiled_catalog_filters_like_csv(catalogs, specialty):
+    csv_catalog, compiled = catalogs
+    assert compiled.index.lookup(specialty) == csv_catalog.index.lookup(specialty)
+    expected = DoctorMatcher._filter_by_specialty(csv_catalog, specialty)
+    found = DoctorMatcher._filter_by_specialty(compiled, specialty)
+    assert found.index.tolist() == expected.index.tolist()
+
+    criteria = {'doctor_gender': 'женщина', 'experience': 'опытный врач'}
+    expected_ids, expected_scores = score_criteria(csv_catalog, expected.index, criteria, min_candidates=1)
+    found_ids, found_scores = score_criteria(compiled, found.index, criteria, min_candidates=1)
+    assert found_ids == expected_ids
+    assert found_scores.tolist() == expected_scores.tolist()
+
+
+def test_float_and_bool_columns_keep_their_type(tmp_path):
+    df = DoctorCatalog.load(CATALOG_PATH).df.head(3).copy()
+    df['rating'] = [4.5, np.nan, 3.25]
+    df['online'] = [True, False, True]
+    output_path = str(tmp_path / 'typed.lilu')
+    write_compiled_catalog(df, SpecialtyIndex.from_dataframe(df), output_path, catalog_sources(CATALOG_PATH))
+
+    compiled = CompiledDoctorCatalog(output_path)
+    assert compiled.attribute('rating').dtype == np.float64
+    assert compiled.df['rating'].dtype == np.float64
+    assert compiled.df['rating'].isna().tolist() == [False, True, False]
+    assert compiled.take([2])['rating'].tolist() == [3.25]
+    assert compiled.df['online'].dtype == np.bool_
+    assert compiled.df['online'].tolist() == [True, False, True]
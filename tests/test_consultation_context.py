@@ -0,0 +1,72 @@
+from ai_helper import initialize_ai_consultation, process_user_answer
+from consultation_context import CONTEXT_TOKEN_BUDGET, KEEP_RECENT_TURNS, MAX_ANSWER_TOKENS, update_context
+from text_utils import estimate_tokens
+
+SYMPTOMS = "Третий день болит голова, в основном в затылке, к вечеру сильнее."
+
+
+def _answer(step: int) -> str:
+    # Длинная расшифровка голосового ответа
+    return f"Ответ {step}: " + "боль то усиливается, то проходит, особенно после работы за компьютером " * 3
+
+
+def _consultation(steps: int) -> dict:
+    consultation = initialize_ai_consultation(SYMPTOMS)
+    for step in range(steps):
+        consultation['current_question'] = f"Вопрос {step}: как часто болит голова?"
+        process_user_answer(consultation, _answer(step))
+    return consultation
+
+
+def _history_tokens(consultation: dict) -> int:
+    # История без системного промпта
+    return sum(estimate_tokens(message['content']) for message in consultation['messages'][1:])
+
+
+def test_short_consultation_is_not_compacted():
+    consultation = _consultation(2)
+    assert consultation['compacted_turns'] == 0
+    assert [message['role'] for message in consultation['messages']] == \
+        ['system', 'user', 'assistant', 'user', 'assistant', 'user']
+    assert consultation['messages'][1]['content'] == SYMPTOMS
+    assert consultation['messages'][-1]['content'] == _answer(1).strip()
+
+
+def test_long_consultation_keeps_recent_turns_within_budget():
+    consultation = _consultation(10)
+    assert consultation['compacted_turns'] > 0
+    assert _history_tokens(consultation) <= CONTEXT_TOKEN_BUDGET
+    assert estimate_tokens(consultation['patient_info']) <= CONTEXT_TOKEN_BUDGET
+
+    # Последние KEEP_RECENT_TURNS шагов передаются целиком, более старые - в сводке после жалоб
+    recent = consultation['messages'][-2 * KEEP_RECENT_TURNS:]
+    expected = []
+    for step in range(10 - KEEP_RECENT_TURNS, 10):
+        expected += [f"Вопрос {step}: как часто болит голова?", _answer(step).strip()]
+    assert [message['content'] for message in recent] == expected
+    assert consultation['messages'][1]['content'].startswith(SYMPTOMS + "\n\nРанее выяснено:\n")
+    assert consultation['context_tokens'] == \
+        _history_tokens(consultation) + estimate_tokens(consultation['messages'][0]['content'])
+
+
+def test_compaction_only_grows_and_keeps_prompt_prefix():
+    consultation = initialize_ai_consultation(SYMPTOMS)
+    previous_compacted = 0
+    for step in range(12):
+        consultation['current_question'] = f"Вопрос {step}: как часто болит голова?"
+        process_user_answer(consultation, _answer(step))
+        assert consultation['compacted_turns'] >= previous_compacted
+        assert consultation['compacted_turns'] <= max(0, step + 1 - KEEP_RECENT_TURNS)
+        assert _history_tokens(consultation) <= CONTEXT_TOKEN_BUDGET
+        previous_compacted = consultation['compacted_turns']
+
+
+def test_recent_turns_are_kept_even_when_over_budget():
+    consultation = initialize_ai_consultation(SYMPTOMS)
+    huge = "очень длинный ответ " * 500
+    consultation['turns'] = [{'question': "Где болит?", 'answer': huge}, {'question': "Как давно?", 'answer': huge}]
+    update_context(consultation)
+    assert consultation['compacted_turns'] == 0
+    answers = [message['content'] for message in consultation['messages'][3::2]]
+    assert len(answers) == KEEP_RECENT_TURNS
+    assert all(estimate_tokens(answer) <= MAX_ANSWER_TOKENS for answer in answers)
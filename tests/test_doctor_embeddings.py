@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+from doctor_catalog import DoctorCatalog
+from doctor_embeddings import EMBEDDING_DIM, DoctorEmbeddings, query_fields
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'all_doctors.csv')
+
+# Жалобы без названия специальности и специальности, которые должны быть среди лучших
+RELEVANCE_QUERIES = {
+    "болит колено после бега": {'травматолог'},
+    "болит ухо": {'лор'},
+    "болит зуб": {'стоматолог'},
+    "тревога и бессонница": {'психиатр', 'психолог'},
+    "сыпь на коже": {'дерматолог'},
+    "кашель и температура": {'терапевт', 'лор'},
+    "болит спина и немеет нога": {'невролог'},
+    "плохо вижу": {'офтальмолог'},
+}
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return DoctorCatalog.load(CATALOG_PATH)
+
+
+@pytest.mark.parametrize('query, expected', RELEVANCE_QUERIES.items())
+def test_complaint_finds_matching_specialty(catalog, query, expected):
+    row_ids = [row_id for row_id, _ in catalog.embeddings.search(query, 5)]
+    specs = catalog.df['spec'].to_numpy()[row_ids]
+    assert specs[0] in expected
+    assert sum(spec in expected for spec in specs) >= 4
+
+
+def test_matrix_is_quantized(catalog):
+    embeddings = catalog.embeddings
+    assert embeddings.matrix.dtype == np.int8
+    assert embeddings.matrix.shape == (catalog.rows, EMBEDDING_DIM)
+
+
+def test_blocked_int8_scores_match_float_scores(catalog):
+    embeddings = catalog.embeddings
+    tiled = DoctorEmbeddings(np.tile(embeddings.matrix, (5, 1)), embeddings.idf)
+    query = embeddings.embed_query("болит ухо")
+    expected = tiled.matrix.astype(np.float32) @ query / tiled.scale
+    assert np.allclose(tiled.scores(query), expected, atol=1e-5)
+
+
+def test_query_gets_specialty_for_everyday_words():
+    assert query_fields("Болят уши")[-1][0] == 'лор'
+    assert query_fields("ухудшение памяти") == [("ухудшение памяти", 1.0)]
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from doctor_filters import apply_criteria, score_criteria
+from doctor_ranking import rank_candidates
+
+# Шесть врачей: пол (1 - м, 2 - ж), категория, степень, год окончания вуза, детский прием
+COLUMNS = {
+    'gender_code': np.array([1, 2, 2, 1, 2, 2]),
+    'category_level': np.array([3, 3, 1, 0, 2, 3]),
+    'degree_level': np.array([0, 1, 0, 2, 0, 2]),
+    'graduation_year': np.array([1990, 2020, 0, 1985, 2000, 1995]),
+    'treats_children': np.array([0, 1, 1, 0, 1, 1]),
+}
+CATALOG = SimpleNamespace(rows=6, attribute=lambda name: COLUMNS[name])
+
+
+def test_filters_only_given_candidates():
+    result = apply_criteria(CATALOG, np.array([1, 2, 3, 4]), {'doctor_gender': 'женщина'}, min_candidates=1)
+    assert sorted(result) == [1, 2, 4]
+
+
+def test_filter_leaving_too_few_candidates_is_skipped():
+    criteria = {'doctor_gender': 'женщина', 'academic_degree': 'доктор наук'}
+    assert apply_criteria(CATALOG, [1, 2, 4, 5], criteria, min_candidates=2) == [5, 1, 2, 4]
+
+
+def test_soft_score_orders_experienced_first():
+    result = apply_criteria(CATALOG, [1, 4, 5], {'experience': 'опытный врач'}, min_candidates=1)
+    assert result == [5, 4, 1]
+
+
+def test_criteria_match_outranks_better_text_match():
+    # Врач 1 лучше всех по жалобам (BM25), но пациент просит опытного врача, а опытнее врачи 5 и 4
+    candidates = pd.DataFrame({'tokens': [['мигрень', 'мигрень', 'головная', 'боль'], ['головная', 'боль'],
+                                          ['спина']]}, index=[1, 4, 5])
+    row_ids, scores = score_criteria(CATALOG, candidates.index, {'experience': 'опытный врач'}, min_candidates=1)
+
+    ranked = rank_candidates(candidates.loc[row_ids], "мигрень", top_n=3, priority=scores)
+
+    assert ranked.index.tolist() == [5, 4, 1]
+    assert rank_candidates(candidates, "мигрень", top_n=3).index[0] == 1
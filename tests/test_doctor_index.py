@@ -0,0 +1,88 @@
+import os
+import re
+from functools import lru_cache
+
+import pandas as pd
+import pytest
+
+from doctor_catalog import DoctorCatalog
+from doctor_index import INDEX_FIELDS, PHRASE_FIELDS
+from text_utils import split_specialties, tokenize
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'all_doctors.csv')
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return DoctorCatalog.load(CATALOG_PATH)
+
+
+# Разбиение специализаций строки не зависит от запроса
+_split_specialties = lru_cache(maxsize=None)(split_specialties)
+
+
+def _iterrows_filter(doctors, target_specialty: str, split=_split_specialties):
+    """Построчный поиск, как в исходном DoctorMatcher.filter_by_specialty (номера строк)"""
+    target_specialty = target_specialty.lower()
+    rows = []
+    for row_id, doctor in enumerate(doctors):
+        spec_match = not pd.isna(doctor.get('spec')) and target_specialty in doctor['spec'].lower()
+        doctor_spec_match = (not pd.isna(doctor.get('doctor_specialization'))
+                             and target_specialty in doctor['doctor_specialization'].lower())
+        specialties_match = (not pd.isna(doctor.get('specialities'))
+                             and any(target_specialty in spec for spec in split(str(doctor['specialities']))))
+        detail_match = (not pd.isna(doctor.get('detail_text'))
+                        and target_specialty in doctor['detail_text'].lower())
+        if spec_match or doctor_spec_match or specialties_match or detail_match:
+            rows.append(row_id)
+    return tuple(rows)
+
+
+@pytest.fixture(scope='module')
+def doctors(catalog):
+    """Строки iterrows по поисковым полям, очищенным от HTML при загрузке (пустая строка - пропуск)"""
+    df = catalog.df
+    df = pd.DataFrame({field: df[f'lower_{field}'].where(df[f'lower_{field}'] != '') for field in INDEX_FIELDS})
+    return [doctor.to_dict() for _, doctor in df.iterrows()]
+
+
+@lru_cache(maxsize=None)
+def _old_split(specialties_text: str):
+    """Исходное разбиение специализаций (по любой букве 'и')"""
+    return [spec.strip().lower() for spec in re.split(',|;|и', specialties_text) if spec.strip()]
+
+
+def _queries(catalog):
+    """Запросы из словаря каталога: фразы специальностей, отдельные слова и их части"""
+    phrases = set()
+    for field in PHRASE_FIELDS:
+        for value in catalog.df[f'lower_{field}']:
+            if value:
+                phrases.update(split_specialties(value) if field == 'specialities' else [value.strip()])
+    words = {token for phrase in phrases for token in tokenize(phrase)}
+    parts = {word[:length] for word in words for length in (2, 5) if len(word) > length}
+    return sorted(phrases | words | parts | {"врач-", "детский хирург", "лор", "УЗИ", "нет такой специальности"})
+
+
+def test_lookup_matches_iterrows_filter_on_bundled_catalog(catalog, doctors):
+    # Исходная семантика на очищенных от HTML полях: подстрока в spec, doctor_specialization,
+    # detail_text или в одной из специализаций
+    for query in _queries(catalog):
+        assert catalog.index.lookup(query) == _iterrows_filter(doctors, query), query
+
+
+def test_lookup_is_superset_of_original_iterrows_filter(catalog, doctors):
+    # Старое разбиение специализаций по букве 'и' теряло совпадения, индекс находит все то же и больше
+    for query in _queries(catalog):
+        original = set(_iterrows_filter(doctors, query, split=_old_split))
+        assert original <= set(catalog.index.lookup(query)), query
+
+
+def test_lookup_terms_matches_iterrows_over_specialty_fields(catalog):
+    df = catalog.df
+    for terms in (["невролог"], ["лор", "оториноларинголог"], ["хирург"], ["детск", "педиатр"], ["кардио"]):
+        pattern = re.compile(r'(?<![\w-])(' + '|'.join(re.escape(term) for term in terms) + ')')
+        expected = tuple(row_id for row_id, texts in enumerate(zip(*(df[f'lower_{field}'] for field in PHRASE_FIELDS)))
+                         if any(text and pattern.search(text) for text in texts))
+        assert catalog.index.lookup_terms(terms) == expected, terms
+        assert expected, terms
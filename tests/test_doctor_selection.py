@@ -0,0 +1,92 @@
+import ai_helper
+from profile_packer import PROFILE_SEPARATOR, SHARED_FIELDS_LABEL, pack_profiles
+
+# У второго врача все поля совпадают с общими: его профиль пустой
+DOCTORS = [
+    {'spec': 'терапевт', 'gender': 'female', 'degree': 'D.Medicine'},
+    {'spec': 'терапевт', 'gender': 'female'},
+    {'spec': 'терапевт', 'gender': 'female', 'doctor_category': 'high'},
+]
+CANDIDATE_IDS = [101, 102, 103]
+
+
+def test_doctor_with_only_shared_fields_keeps_its_profile():
+    packed = pack_profiles(DOCTORS, token_budget=None)
+    assert packed['shared'].startswith(SHARED_FIELDS_LABEL)
+    assert len(packed['profiles']) == packed['count'] == 3
+    assert all(profile.endswith(PROFILE_SEPARATOR) for profile in packed['profiles'])
+    assert packed['text'] == packed['shared'] + "".join(packed['profiles'])
+
+
+def test_selection_numbers_match_candidate_ids(monkeypatch):
+    prompts = []
+
+    async def acomplete(messages, max_tokens, timeout=None):
+        prompts.append(messages[-1]['content'])
+        return '[{"n": 3, "reason": "высшая категория"}, {"n": 2, "reason": "подходит"}]'
+
+    monkeypatch.setattr(ai_helper.client, 'acomplete', acomplete)
+    monkeypatch.setattr(ai_helper, 'SELECTION_CACHE', ai_helper.ResultCache())
+    packed = pack_profiles(DOCTORS, token_budget=None)
+    selection = ai_helper.select_top_doctors_structured_cached(
+        packed['profiles'], "без предпочтений", "Терапевт", 2, criteria={}, catalog_version=1,
+        candidate_ids=CANDIDATE_IDS, shared=packed['shared'])
+
+    assert [item['row_id'] for item in selection] == [103, 102]
+    assert "[3] Кат: высшая" in prompts[0]
+
+
+def _fake_llm(monkeypatch, answer):
+    calls = []
+
+    async def acomplete(messages, max_tokens, timeout=None):
+        calls.append(messages[-1]['content'])
+        return answer(messages[-1]['content'])
+
+    monkeypatch.setattr(ai_helper.client, 'acomplete', acomplete)
+    return calls
+
+
+def test_short_candidate_list_is_selected_in_one_call(monkeypatch):
+    calls = _fake_llm(monkeypatch, lambda prompt: '[{"n": 2, "reason": ""}]')
+    profiles = [f"Опыт: врач {i}\n---\n" for i in range(6)]
+
+    selection = ai_helper.select_top_doctors_structured(profiles, "", "Терапевт", 1)
+
+    assert len(calls) == 1
+    assert selection == [{'index': 1, 'reason': ''}]
+
+
+def test_long_candidate_list_is_selected_in_two_stages(monkeypatch):
+    monkeypatch.setattr(ai_helper, 'SELECTION_MAP_REDUCE_TOKENS', 100)
+    monkeypatch.setattr(ai_helper, 'SELECTION_CHUNK_TOKENS', 60)
+    # Последний кандидат каждой части - лучший; первая часть LLM не отвечает разобранным JSON
+    calls = _fake_llm(monkeypatch, lambda prompt: "не знаю" if "врач 1 " in prompt else
+                      '[{"n": %d, "reason": ""}]' % prompt.count("---"))
+    profiles = [f"Опыт: врач {i} {'подробно ' * 8}\n---\n" for i in range(12)]
+    chunks = ai_helper.selection_chunks(profiles)
+    assert len(chunks) > 2 and ai_helper.needs_map_reduce(profiles)
+
+    selection = ai_helper.select_top_doctors_structured(profiles, "", "Терапевт", 1)
+
+    # Часть из одного кандидата проходит без запроса к LLM
+    assert len(calls) == sum(len(chunk) > 1 for chunk in chunks) + 1
+    survivors = [chunk[0] if 1 in chunk else chunk[-1] for chunk in chunks]
+    assert all(f"врач {i} " in calls[-1] for i in survivors)
+    assert selection == [{'index': survivors[-1], 'reason': ''}]
+
+
+def test_selection_is_not_shared_between_different_criteria_texts(monkeypatch):
+    calls = _fake_llm(monkeypatch, lambda prompt: '[{"n": 1, "reason": "подходит"}]')
+    monkeypatch.setattr(ai_helper, 'SELECTION_CACHE', ai_helper.ResultCache())
+    packed = pack_profiles(DOCTORS, token_budget=None)
+
+    def select(criteria_text):
+        return ai_helper.select_top_doctors_structured_cached(
+            packed['profiles'], criteria_text, "Терапевт", 1, criteria={}, catalog_version=1,
+            candidate_ids=CANDIDATE_IDS, shared=packed['shared'])
+
+    select("Хронические заболевания: диабет")
+    select("Хронические заболевания: диабет")
+    select("Хронические заболевания: астма")
+    assert len(calls) == 2
@@ -0,0 +1,62 @@
+import pytest
+
+import ai_helper
+from emergency_detector import EMERGENCY_RECOMMENDATION, detect_emergency, is_emergency_answer
+from specialty_classifier import EMERGENCY_LABEL, canonical_label
+
+
+@pytest.mark.parametrize('text, category', [
+    ("Сильные боли в груди и отдает в левую руку", 'chest_pain'),
+    ("болит грудь", 'chest_pain'),
+    ("со вчерашнего вечера давит в груди", 'chest_pain'),
+    ("грудь болит при нагрузке", 'chest_pain'),
+    ("сильная боль в грудной клетке", 'chest_pain'),
+    ("боль за грудиной", 'chest_pain'),
+    ("Нет, болит грудь", 'chest_pain'),
+    ("болит грудь, нет сил", 'chest_pain'),
+    ("давление 180", 'hypertensive_crisis'),
+    ("давление поднялось до 190", 'hypertensive_crisis'),
+    ("утром было 200/110", 'hypertensive_crisis'),
+])
+def test_detects_emergency(text, category):
+    result = detect_emergency(text)
+    assert result is not None
+    assert result['category'] == category
+
+
+@pytest.mark.parametrize('text', [
+    "боли в грудном отделе позвоночника",
+    "нет, боли в груди нет",
+    "боли в груди нет, беспокоит кашель",
+    "нет ни температуры, ни боли в груди",
+    "не болит грудь",
+    "давление 120 на 80",
+    "давление 130",
+    "кашель и температура 37.5",
+])
+def test_ignores_non_emergency(text):
+    assert detect_emergency(text) is None
+
+
+@pytest.mark.parametrize('answer', [
+    EMERGENCY_RECOMMENDATION,
+    "вызов скорой помощи по номеру 103",
+    "Срочно вызовите скорую (103)!",
+])
+def test_emergency_answer(answer):
+    assert is_emergency_answer(answer)
+    assert canonical_label(answer) == EMERGENCY_LABEL
+
+
+@pytest.mark.parametrize('answer', [None, "", "Кардиолог", "Терапевт, кабинет 1035"])
+def test_specialist_answer_is_not_emergency(answer):
+    assert not is_emergency_answer(answer)
+
+
+def test_consultation_emergency_answer_becomes_banner(monkeypatch):
+    consultation = {'provisional_specialty': "вызов скорой помощи по номеру 103", 'confidence': 1.0}
+    assert ai_helper.get_consultation_recommendation(consultation) == EMERGENCY_RECOMMENDATION
+
+    monkeypatch.setattr(ai_helper, 'get_ai_recommendation', lambda patient_info: "Вызовите скорую по номеру 103")
+    consultation = {'provisional_specialty': None, 'confidence': 0.0, 'patient_info': "болит грудь"}
+    assert ai_helper.get_consultation_recommendation(consultation) == EMERGENCY_RECOMMENDATION
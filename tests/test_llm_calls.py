@@ -0,0 +1,35 @@
+import ai_helper
+
+
+def test_sync_ask_question_runs_async_path_and_records_metrics_silently(monkeypatch, capsys):
+    calls = []
+
+    async def acomplete(messages, max_tokens, timeout=None):
+        calls.append(messages)
+        return "Где болит?"
+
+    monkeypatch.setattr(ai_helper.client, 'acomplete', acomplete)
+    monkeypatch.setattr(ai_helper, 'ASK_CACHE', ai_helper.ResultCache())
+    monkeypatch.setattr(ai_helper, 'LLM_METRICS', ai_helper.deque(maxlen=10))
+    messages = [{'role': 'user', 'content': "болит голова"}]
+
+    assert ai_helper.ask_question(messages) == "Где болит?"
+    assert ai_helper.ask_question(messages) == "Где болит?"  # Второй раз из кэша
+
+    assert len(calls) == 1
+    assert ai_helper.llm_stats()['calls']['ask_question']['calls'] == 1
+    assert capsys.readouterr().out == ""
+
+
+def test_async_error_returns_fallback(monkeypatch):
+    async def acomplete(messages, max_tokens, timeout=None):
+        raise TimeoutError("LLM не ответила")
+
+    monkeypatch.setattr(ai_helper.client, 'acomplete', acomplete)
+    monkeypatch.setattr(ai_helper, 'ASK_CACHE', ai_helper.ResultCache())
+    monkeypatch.setattr(ai_helper, 'LLM_METRICS', ai_helper.deque(maxlen=10))
+
+    answer = ai_helper.client.run(ai_helper.ask_question_async([{'role': 'user', 'content': "кашель"}]))
+
+    assert answer == ai_helper.ASK_QUESTION_FALLBACK
+    assert ai_helper.llm_metrics_summary()['ask_question']['errors'] == 1
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from doctor_catalog import DoctorCatalog
+from doctors import PROFILE_COLUMNS, DoctorMatcher, _to_records
+from profile_packer import PROFILE_SEPARATOR, SHARED_FIELDS_LABEL, pack_profiles
+from text_utils import estimate_tokens
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'all_doctors.csv')
+
+
+@pytest.fixture(scope='module')
+def therapists():
+    catalog = DoctorCatalog.load(CATALOG_PATH)
+    return _to_records(DoctorMatcher._filter_by_specialty(catalog, "терапевт"), PROFILE_COLUMNS)
+
+
+def _doctor(**fields):
+    doctor = {'spec': 'невролог', 'gender': 'male', 'doctor_category': 'none', 'degree': 'none',
+              'clean_detail_text': '', 'clean_review': 'нет отзыва', 'education': 'none'}
+    doctor.update(fields)
+    return doctor
+
+
+@pytest.mark.parametrize('budget', [800, 2000, 4000])
+def test_budget_is_respected_and_tail_is_dropped(therapists, budget):
+    packed = pack_profiles(therapists, token_budget=budget)
+    assert packed['tokens'] <= budget
+    assert packed['count'] + packed['dropped'] == len(therapists)
+    assert packed['dropped'] > 0
+    assert len(packed['profiles']) == packed['count']
+    assert packed['text'] == packed['shared'] + ''.join(packed['profiles'])
+
+
+def test_details_go_to_best_ranked_candidates_first():
+    doctors = [_doctor(doctor_category=category, clean_review=f"Пациент {i} доволен приемом, врач подробно "
+                                                             f"объяснил схему лечения и ответил на вопросы.")
+               for i, category in enumerate(['high', 'first', 'second', 'high', 'first'])]
+    partial = False
+    for budget in range(50, 400, 10):
+        packed = pack_profiles(doctors, token_budget=budget)
+        assert packed['tokens'] <= budget
+        reviewed = ["Отзывы: " in profile for profile in packed['profiles']]
+        # Отзывы получают первые по предранжированию кандидаты: после кандидата без отзыва их нет
+        assert reviewed == sorted(reviewed, reverse=True)
+        partial |= packed['count'] == len(doctors) and reviewed[0] and not reviewed[-1]
+    assert partial
+
+
+def test_first_candidate_is_kept_even_over_budget(therapists):
+    packed = pack_profiles(therapists, token_budget=1)
+    assert packed['count'] == 1
+
+
+def test_fields_shared_by_all_candidates_go_to_header():
+    doctors = [_doctor(doctor_category='high'), _doctor(doctor_category='first'), _doctor(doctor_category='high')]
+    packed = pack_profiles(doctors)
+    assert packed['shared'] == f"{SHARED_FIELDS_LABEL}: Спец: невролог; Пол: м\n{PROFILE_SEPARATOR}"
+    assert [profile.split('\n')[0] for profile in packed['profiles']] == ["Кат: высшая", "Кат: первая", "Кат: высшая"]
+    assert "нет отзыва" not in packed['text'] and "none" not in packed['text']
+
+
+def test_single_candidate_has_no_shared_header():
+    packed = pack_profiles([_doctor()])
+    assert packed['shared'] == ""
+    assert packed['profiles'] == [f"Спец: невролог; Пол: м\n{PROFILE_SEPARATOR}"]
+
+
+def test_candidate_with_only_shared_fields_keeps_empty_profile():
+    packed = pack_profiles([_doctor(), _doctor(), _doctor(clean_detail_text="Ведет прием взрослых.")])
+    assert packed['count'] == 3
+    assert packed['profiles'][:2] == [f"\n{PROFILE_SEPARATOR}"] * 2
+    assert packed['profiles'][2] == f"Опыт: Ведет прием взрослых.\n{PROFILE_SEPARATOR}"
+
+
+def test_empty_candidate_list():
+    packed = pack_profiles([])
+    assert packed['count'] == 0 and packed['profiles'] == [] and packed['text'] == ""
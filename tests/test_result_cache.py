@@ -0,0 +1,58 @@
+import json
+
+from result_cache import LOG_COMPACT_FACTOR, ResultCache
+
+
+def _lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_set_appends_one_line_and_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ResultCache(path=path)
+    cache.bind_version('v1')
+    cache.set('a', {'x': 1})
+    cache.set('b', [1, 2])
+    records = _lines(path)
+    assert records[0] == ['version', 'v1']
+    assert [(record[0], record[1], record[3]) for record in records[1:]] == [('set', 'a', {'x': 1}),
+                                                                              ('set', 'b', [1, 2])]
+
+    restored = ResultCache(path=path)
+    assert restored.version == 'v1'
+    assert restored.get('a') == {'x': 1}
+    assert restored.get('b') == [1, 2]
+
+
+def test_overwrites_and_expired_entries_are_dropped_on_load(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ResultCache(path=path)
+    cache.set('a', 1)
+    cache.set('a', 2)
+    cache.set('old', 3, ttl_seconds=-1)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('["set", "torn"')  # Процесс остановлен посреди записи
+
+    restored = ResultCache(path=path)
+    assert restored.get('a') == 2
+    assert restored.get('old') is None
+    assert len(_lines(path)) == 2  # Файл сжат при загрузке: версия и одна запись
+
+
+def test_log_is_compacted_when_it_outgrows_the_cache(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ResultCache(max_entries=4, path=path)
+    for i in range(LOG_COMPACT_FACTOR * 4 + 1):
+        cache.set(f'k{i}', i)
+    assert len(_lines(path)) <= LOG_COMPACT_FACTOR * 4
+    assert ResultCache(max_entries=4, path=path).get(f'k{LOG_COMPACT_FACTOR * 4}') == LOG_COMPACT_FACTOR * 4
+
+
+def test_version_change_clears_persisted_entries(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ResultCache(path=path)
+    cache.bind_version('v1')
+    cache.set('a', 1)
+    cache.bind_version('v2')
+    assert ResultCache(path=path).get('a') is None
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import search_prefetch
+from search_prefetch import SearchPrefetcher, search_results_key
+
+CATALOG_VERSION = 1
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Фоновый подбор без каталога: разбор LLM для ответа 'медленный' ждет отмены"""
+    calls = {'started': [], 'cancelled': [], 'local_gate': threading.Event()}
+    calls['local_gate'].set()
+
+    def compute(matcher, target_specialty, criteria, criteria_text, query_text, with_llm=True, verbose=True):
+        calls['local_gate'].wait(5)
+        return {'key': search_results_key(target_specialty, criteria, query_text, CATALOG_VERSION),
+                'filtered_df': pd.DataFrame({'spec': [target_specialty]}), 'llm_done': False}
+
+    async def refine(results, target_specialty, criteria, criteria_text):
+        calls['started'].append(criteria_text)
+        try:
+            await asyncio.sleep(5 if criteria_text == 'медленный' else 0)
+        except asyncio.CancelledError:
+            calls['cancelled'].append(criteria_text)
+            raise
+        results['llm_done'] = True
+        return results
+
+    monkeypatch.setattr(search_prefetch, 'compute_search_results', compute)
+    monkeypatch.setattr(search_prefetch, 'refine_with_llm_async', refine)
+    return calls
+
+
+def _prefetcher():
+    return SearchPrefetcher(SimpleNamespace(catalog=SimpleNamespace(version=CATALOG_VERSION)))
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_new_answers_cancel_running_llm_selection(llm):
+    prefetcher = _prefetcher()
+    prefetcher.submit('Терапевт', {'a': 1}, 'медленный', 'запрос 1')
+    assert _wait_until(lambda: llm['started'] == ['медленный'])
+
+    prefetcher.submit('Терапевт', {'a': 2}, 'быстрый', 'запрос 2')
+    new_key = search_results_key('Терапевт', {'a': 2}, 'запрос 2', CATALOG_VERSION)
+    result = prefetcher.result_for(new_key, wait=5)
+
+    assert result is not None and result['llm_done']
+    assert llm['cancelled'] == ['медленный']
+    assert prefetcher.result_for(search_results_key('Терапевт', {'a': 1}, 'запрос 1', CATALOG_VERSION)) is None
+
+
+def test_results_for_superseded_answers_are_dropped(llm):
+    prefetcher = _prefetcher()
+    llm['local_gate'].clear()
+    prefetcher.submit('Терапевт', {'a': 1}, 'быстрый', 'запрос 1')
+    assert _wait_until(lambda: prefetcher._in_flight is not None)
+    prefetcher.submit('Терапевт', {'a': 2}, 'быстрый', 'запрос 2')
+    llm['local_gate'].set()
+
+    new_key = search_results_key('Терапевт', {'a': 2}, 'запрос 2', CATALOG_VERSION)
+    assert prefetcher.result_for(new_key, wait=5) is not None
+    assert list(prefetcher._results) == [new_key]
+    assert llm['started'] == ['быстрый']  # Разбор для прежних ответов не запускался
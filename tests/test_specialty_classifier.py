@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pytest
+
+import specialty_classifier
+from specialty_classifier import (
+    EMERGENCY_LABEL,
+    EMERGENCY_MAX_PROBABILITY,
+    SpecialtyClassifier,
+    predict_specialty,
+    train_from_log,
+)
+
+# Жалобы и ответы LLM для журнала консультаций
+CONSULTATIONS = {
+    "Рекомендую обратиться к неврологу.": [
+        "болит голова и кружится", "мигрень с аурой", "онемение пальцев рук", "головная боль по утрам",
+        "сильная головная боль и тошнота"],
+    "Вам нужен гастроэнтеролог": [
+        "болит живот после еды", "изжога и отрыжка", "вздутие живота", "тяжесть в желудке", "боль в животе справа"],
+    "Срочно вызовите скорую помощь: 103": [
+        "давящая боль в груди отдает в руку", "потерял сознание", "не могу дышать и синеют губы",
+        "боль в груди и холодный пот", "онемела половина лица"],
+}
+
+
+def _fixed_model(probabilities):
+    """Модель, которая на любой текст отвечает заданным распределением вероятностей"""
+    classes = list(probabilities)
+    return SpecialtyClassifier(np.zeros((16, len(classes)), dtype=np.float32),
+                               np.log(np.array([probabilities[label] for label in classes], dtype=np.float32)),
+                               np.ones(16, dtype=np.float32), classes)
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / 'consultations.jsonl'
+    with open(path, 'w', encoding='utf-8') as f:
+        for answer, texts in CONSULTATIONS.items():
+            for text in texts:
+                f.write(json.dumps({'text': text, 'answer': answer, 'latency_ms': 900}, ensure_ascii=False) + "\n")
+    return str(path)
+
+
+def test_threshold_gates_the_answer():
+    model = _fixed_model({'невролог': 0.7, 'терапевт': 0.3})
+    assert model.confident_specialty("болит голова", min_probability=0.8) is None
+    assert model.confident_specialty("болит голова", min_probability=0.6) == 'невролог'
+
+
+@pytest.mark.parametrize('probabilities', [
+    {'невролог': 0.05, EMERGENCY_LABEL: 0.95},  # Скорая - самый вероятный класс
+    {'невролог': 0.85, EMERGENCY_LABEL: EMERGENCY_MAX_PROBABILITY + 0.05},  # Уверенный ответ, но риск скорой
+])
+def test_emergency_class_is_never_returned(probabilities):
+    model = _fixed_model(probabilities)
+    assert model.confident_specialty("боль в груди", min_probability=0.0) is None
+
+
+def test_low_emergency_probability_does_not_block_answer():
+    model = _fixed_model({'невролог': 0.95, EMERGENCY_LABEL: 0.05})
+    assert model.confident_specialty("болит голова", min_probability=0.8) == 'невролог'
+
+
+def test_model_trained_on_log_answers_confidently_but_not_for_emergencies(log_path, tmp_path):
+    model_path = str(tmp_path / 'model.npz')
+    result = train_from_log(log_path, model_path)
+    assert result['classes'] == 3 and result['examples'] == 15
+
+    model = SpecialtyClassifier.load(model_path)
+    assert sorted(model.classes) == sorted(['невролог', 'гастроэнтеролог', EMERGENCY_LABEL])
+    for text in CONSULTATIONS["Срочно вызовите скорую помощь: 103"]:
+        assert model.predict(text)[0] == EMERGENCY_LABEL
+        assert model.confident_specialty(text, min_probability=0.0) is None
+    assert predict_specialty("мигрень с аурой", min_probability=0.5, path=model_path) == "Невролог"
+    assert predict_specialty("мигрень с аурой", min_probability=1.0, path=model_path) is None
+    assert predict_specialty("изжога и отрыжка", min_probability=0.5, path=model_path) == "Гастроэнтеролог"
+
+
+def test_without_model_llm_decides(tmp_path):
+    assert predict_specialty("болит голова", path=str(tmp_path / 'missing.npz')) is None
+
+
+def test_consultation_log_is_off_by_default(tmp_path):
+    path = tmp_path / 'consultations.jsonl'
+    specialty_classifier.log_consultation("болит голова", "Невролог", path=str(path))
+    assert not path.exists()
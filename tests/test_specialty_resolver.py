@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from doctor_catalog import DoctorCatalog
+from doctor_index import SpecialtyIndex
+from doctors import DoctorMatcher
+from specialty_resolver import catalog_terms, display_name, resolve_specialties, resolve_specialty
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'all_doctors.csv')
+
+
+@pytest.mark.parametrize('text, specialty_id', [
+    ("невролог", 'невролог'),
+    ("Врач-невролог.", 'невролог'),
+    ("к неврологу", 'невролог'),
+    ("Рекомендую обратиться к неврологу.", 'невролог'),
+    ("невралог", 'невролог'),
+    ("кардилог", 'кардиолог'),
+    ("ЛОР", 'лор'),
+    ("ухо-горло-нос", 'лор'),
+    ("окулист", 'офтальмолог'),
+    ("Врач УЗИ", 'врач узд'),
+])
+def test_resolves_aliases_word_forms_and_typos(text, specialty_id):
+    assert resolve_specialty(text) == specialty_id
+
+
+def test_unknown_and_short_words_are_not_guessed():
+    assert resolve_specialty("абракадабра") is None
+    assert resolve_specialty("лорр") is None  # Опечатки ищутся только в словах от MIN_TYPO_LENGTH букв
+    assert resolve_specialty("") is None
+
+
+def test_several_specialties_in_order_of_mention():
+    assert resolve_specialties("Сначала к кардиологу, потом к неврологу и снова к кардиологу") == [
+        'кардиолог', 'невролог']
+    assert display_name('лор') == "ЛОР"
+
+
+def test_lookup_terms_ignores_detail_text():
+    # spec, specialities, doctor_specialization, detail_text
+    index = SpecialtyIndex([
+        ("невролог", None, None, None),
+        ("терапевт", None, None, "консультирует вместе с неврологом"),
+        ("педиатр", "детский невролог, эпилептолог", None, None),
+        ("нейрохирург", None, None, None),
+    ])
+    assert index.lookup_terms(catalog_terms('невролог')) == (0, 2)
+    assert index.lookup("невролог") == (0, 1, 2)  # Подстрочный поиск по-прежнему смотрит и описание
+    assert index.lookup_terms(catalog_terms('хирург')) == ()  # Только начало слова: не нейрохирург
+
+
+def test_filter_by_specialty_resolves_free_text_on_bundled_catalog():
+    catalog = DoctorCatalog.load(CATALOG_PATH)
+    expected = DoctorMatcher._filter_by_specialty(catalog, "невролог")
+    assert not expected.empty
+    assert expected['lower_spec'].str.contains("невролог").any()
+    for text in ("Врач-невролог.", "невралог", "к неврологу"):
+        assert DoctorMatcher._filter_by_specialty(catalog, text).index.tolist() == expected.index.tolist()
+    ent = DoctorMatcher._filter_by_specialty(catalog, "ЛОР")
+    assert not ent.empty and ent.index.tolist() == list(catalog.index.lookup_terms(catalog_terms('лор')))
@@ -0,0 +1,29 @@
+import pytest
+
+import ai_helper
+from ai_helper import EARLY_STOP_CONFIDENCE, initialize_ai_consultation, parse_triage_response
+
+
+@pytest.mark.parametrize('answer', [
+    "Специалист: Кардиолог\nУверенность: 60\nВопрос: Есть ли одышка?",
+    "**Специалист:** Кардиолог\n**Уверенность:** 60\n**Вопрос:** Есть ли одышка?",
+    "Специалист: **Кардиолог**\nУверенность: __60__\nВопрос: Есть ли одышка?",
+])
+def test_parses_plain_and_markdown_labels(answer):
+    assert parse_triage_response(answer) == ("Есть ли одышка?", "Кардиолог", 0.6)
+
+
+def test_prompt_uses_early_stop_threshold():
+    prompt = initialize_ai_consultation("болит голова")['messages'][0]['content']
+    assert f"уверенность {EARLY_STOP_CONFIDENCE * 100:.0f} и выше" in prompt
+
+
+def test_stream_stops_early_on_bold_confident_answer(monkeypatch):
+    chunks = ["**Специалист:** Невро", "лог\n**Уверен", "ность:** 90\n", "**Вопрос:** Как давно?"]
+    monkeypatch.setattr(ai_helper, 'ask_question_stream', lambda messages: iter(chunks))
+    consultation = initialize_ai_consultation("болит голова")
+
+    assert list(ai_helper.generate_next_question_stream(consultation)) == []
+    assert consultation['provisional_specialty'] == "Невролог"
+    assert consultation['confidence'] == 0.9
+    assert ai_helper.is_consultation_complete(consultation)
@@ -0,0 +1,99 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import warmup
+
+
+@pytest.fixture
+def steps(monkeypatch):
+    monkeypatch.setattr(warmup, '_status', {'state': 'idle', 'started_at': None, 'finished_at': None, 'steps': {}})
+    results = {'catalog': lambda path: {'rows': 1}, 'llm': lambda: {'connections': 1}, 'speech': lambda: {}}
+    monkeypatch.setattr(warmup, '_warm_catalog', lambda path: results['catalog'](path))
+    monkeypatch.setattr(warmup, '_warm_llm', lambda: results['llm']())
+    monkeypatch.setattr(warmup, '_warm_speech', lambda: results['speech']())
+    return results
+
+
+def _fail():
+    raise RuntimeError("нет соединения")
+
+
+def _ready_code(server):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/ready") as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_ready_when_all_steps_succeed(steps):
+    status = warmup.run_warmup()
+    assert status['state'] == 'ready' and status['ready']
+    assert warmup.is_ready()
+
+
+def test_not_ready_when_a_step_fails(steps):
+    steps['llm'] = _fail
+    status = warmup.run_warmup()
+    assert status['state'] == 'failed' and not status['ready']
+    assert status['steps']['llm']['ok'] is False
+    assert status['steps']['catalog']['ok'] is True
+    assert not warmup.is_ready()
+
+
+def test_readiness_endpoint_returns_503_after_failed_step(steps):
+    server = warmup.serve_readiness(0)
+    try:
+        steps['speech'] = _fail
+        warmup.run_warmup()
+        code, body = _ready_code(server)
+        assert code == 503 and body['state'] == 'failed'
+
+        steps['speech'] = lambda: {}
+        warmup.run_warmup()
+        assert _ready_code(server)[0] == 200
+    finally:
+        server.shutdown()
+
+
+@pytest.fixture
+def speech(monkeypatch):
+    import audio_text
+    services = {'connected': 2, 'synthesized': None}
+    monkeypatch.setattr(warmup, 'static_phrases', lambda: ["Здравствуйте", "Опишите жалобы", "Спасибо"])
+    monkeypatch.setattr(audio_text, 'connect_speechkit', lambda: services['connected'])
+    monkeypatch.setattr(audio_text, 'tts_cache_stats', lambda: {})
+    monkeypatch.setattr(audio_text, 'presynthesize',
+                        lambda texts: sum(services['synthesized'] is None or text in services['synthesized']
+                                          for text in texts))
+    return services
+
+
+def test_speech_step_ok_when_all_phrases_synthesized(speech):
+    step = warmup._warm_speech()
+    assert step.get('ok', True) and step['ready'] == step['phrases'] == 3
+
+
+def test_speech_step_fails_without_speechkit(monkeypatch, speech):
+    monkeypatch.setattr(warmup, '_status', {'state': 'idle', 'started_at': None, 'finished_at': None, 'steps': {}})
+    speech['connected'] = 0
+    warmup._run_step('speech', warmup._warm_speech)
+    step = warmup.warmup_status()['steps']['speech']
+    assert step['ok'] is False and step['speechkit_services'] == 0
+
+
+def test_speech_step_fails_when_phrases_not_synthesized(monkeypatch, speech):
+    monkeypatch.setattr(warmup, '_warm_catalog', lambda path: {'rows': 1})
+    monkeypatch.setattr(warmup, '_warm_llm', lambda: {'connections': 1})
+    server = warmup.serve_readiness(0)
+    try:
+        speech['synthesized'] = {"Здравствуйте"}  # presynthesize проглатывает ошибки и возвращает 0
+        status = warmup.run_warmup()
+        assert status['state'] == 'failed'
+        assert status['steps']['speech']['ok'] is False and status['steps']['speech']['ready'] == 1
+        assert _ready_code(server)[0] == 503
+    finally:
+        server.shutdown()
@@ -0,0 +1,63 @@
+import html
+import re
+from functools import lru_cache
+from typing import List
+
+HTML_TAG_RE = re.compile('<[^<]+?>')
+WHITESPACE_RE = re.compile(r'\s+')
+TOKEN_RE = re.compile(r'\w+')
+SPECIALTY_SPLIT_RE = re.compile(r',|;|\sи\s')
+
+
+def clean_html(text: str) -> str:
+    """Удаление HTML тегов и сущностей, схлопывание пробелов"""
+    text = HTML_TAG_RE.sub(' ', str(text))
+    return WHITESPACE_RE.sub(' ', html.unescape(text)).strip()
+
+
+def normalize_text(text: str) -> str:
+    """Очищенный текст в нижнем регистре"""
+    return clean_html(text).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбиение нормализованного текста на слова"""
+    return TOKEN_RE.findall(text)
+
+
+def split_specialties(text: str) -> List[str]:
+    """Разбиение строки специализаций на отдельные фразы"""
+    return [spec.strip() for spec in SPECIALTY_SPLIT_RE.split(normalize_text(text)) if spec.strip()]
+
+
+# Окончания для грубого стемминга русских слов (от длинных к коротким)
+_RUSSIAN_ENDINGS = sorted([
+    'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ция', 'ции', 'ать', 'ять', 'ить', 'еть',
+    'ах', 'ях', 'ов', 'ев', 'ей', 'ой', 'ый', 'ий', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ом', 'ем', 'ам', 'ям',
+    'ых', 'их', 'ую', 'юю', 'ет', 'ит', 'ут', 'ют', 'ат', 'ят',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+_MIN_STEM_LENGTH = 3
+
+
+@lru_cache(maxsize=200000)
+def stem(token: str) -> str:
+    """Отбрасывание типичного окончания, чтобы 'колено' и 'коленом' совпадали"""
+    for ending in _RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= _MIN_STEM_LENGTH:
+            return token[:-len(ending)]
+    return token
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов LLM (для русского текста ~3 символа на токен)"""
+    return (len(text) + 2) // 3
+
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    """Текст, обрезанный по границе слова до max_tokens (по оценке estimate_tokens)"""
+    text = WHITESPACE_RE.sub(' ', str(text)).strip()
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    clipped = text[:max_tokens * 3 - 1]
+    return (clipped.rsplit(' ', 1)[0] or clipped) + '…'
@@ -2,21 +2,27 @@ import streamlit as st
 import threading
 import time
 import os
-from audio_text import text_to_ogg, recognize_audio
+from audio_text import presynthesize_in_background, text_to_ogg, recognize_audio
 from audio_recording import load_audio
 from complaints_collector import ComplaintsCollector
 from ai_helper import generate_next_question
 
+# Постоянные фразы диалога (озвучиваются из кэша синтеза, см. audio_text.TTS_CACHE)
+VOICE_INTRO = ("**Здравствуйте!**<[huge]>Меня зовут **Лилу**, <[huge]> я **помогу** вам подобрать врача. "
+               "Сейчас я  задам несколько **уточняющих** вопросов.")
+ANALYZING_PHRASE = "Анализирую **всю** полученную информацию..."
+COMPLETION_PHRASE = "Консультация **завершена**. <[huge]>Спасибо!"
+FIXED_PHRASES = [VOICE_INTRO, ANALYZING_PHRASE, COMPLETION_PHRASE]
+
+
 class VoiceDialog:
     def __init__(self):
         self.complaints_collector = ComplaintsCollector()
         self.is_active = False
         self.dialog_history = []
 
-        # Создаем папки для аудио
-        self.questions_folder = "audio/dialog_questions"
+        # Папка для записанных ответов (вопросы озвучиваются через кэш синтеза)
         self.answers_folder = "audio/dialog_answers"
-        os.makedirs(self.questions_folder, exist_ok=True)
         os.makedirs(self.answers_folder, exist_ok=True)
 
     def start_dialog(self, initial_data=None):
@@ -30,10 +36,13 @@ class VoiceDialog:
 
         self.complaints_collector.start_collection(initial_data)
 
+        # Завершающие фразы готовятся в фоне, пока идет диалог (вступление озвучивается сразу)
+        presynthesize_in_background([ANALYZING_PHRASE, COMPLETION_PHRASE])
+
         # Озвучиваем начальную информацию БЕЗ добавления в историю
         initial_info = self._compile_voice_intro(initial_data)
         if initial_info:
-            self._speak(initial_info)  # Только озвучка
+            self._speak(initial_info, cacheable=initial_info in FIXED_PHRASES)  # Только озвучка
             time.sleep(2)
 
         # Запускаем диалог в отдельном потоке
@@ -43,10 +52,7 @@ class VoiceDialog:
 
     def _compile_voice_intro(self, initial_data):
         """Компиляция вступительного текста для озвучки"""
-        parts = ["**Здравствуйте!**<[huge]>Меня зовут **Лилу**, <[huge]> я **помогу** вам подобрать врача.",
-                 "Сейчас я  задам несколько **уточняющих** вопросов."]
-
-        return " ".join(parts)
+        return VOICE_INTRO
 
     def _run_dialog(self):
         """Основная логика голосового диалога"""
@@ -84,7 +90,7 @@ class VoiceDialog:
             # Завершение
             if self.is_active and self.complaints_collector.completed:
                 self._add_to_history(" Лилу", "Анализирую **всю полученную** информацию...")
-                self._speak("Анализирую **всю** полученную информацию...")
+                self._speak(ANALYZING_PHRASE, cacheable=True)
 
                 recommendation = self.complaints_collector.recommendation
                 result_msg = f"Рекомендация: {recommendation}"
@@ -93,7 +99,7 @@ class VoiceDialog:
                     f"На основе **ваших симптомов** <[large]>и предоставленной информации, <[huge]>моя рекомендация: {recommendation}")
 
                 self._add_to_history("", "Консультация завершена")
-                self._speak("Консультация **завершена**. <[huge]>Спасибо!")
+                self._speak(COMPLETION_PHRASE, cacheable=True)
 
         except Exception as e:
             error_msg = f"Ошибка: {str(e)}"
@@ -102,10 +108,10 @@ class VoiceDialog:
         finally:
             self.is_active = False
 
-    def _speak(self, text):
-        """Озвучивание текста"""
+    def _speak(self, text, cacheable=False):
+        """Озвучивание текста (cacheable - постоянная фраза из FIXED_PHRASES)"""
         try:
-            success = text_to_ogg(text, self.questions_folder)
+            success = text_to_ogg(text, cacheable)
             if not success:
                 print("Не удалось сохранить аудио вопрос")
         except Exception as e:
@@ -2,9 +2,54 @@ import streamlit as st
 import threading
 import time
 import os
-from audio_text import text_to_ogg, recognize_audio
+from audio_text import presynthesize_in_background, text_to_ogg, recognize_audio
 from audio_recording import load_audio
 
+# Уточняющие вопросы (постоянные фразы, озвучиваются из кэша синтеза, см. audio_text.TTS_CACHE)
+ADDITIONAL_QUESTIONS = [
+    {
+        'key': 'patient_type',
+        'text': "Какой врач н+ужен**вам**<[huge]> детский или взрослый ?",
+    },
+    {
+        'key': 'doctor_gender',
+        'text': "Важен ли **пол** врача?",
+    },
+    {
+        'key': 'experience',
+        'text': "Какие требования к **опыту** врача? <[large]>Например: <[medium]>молодой специалист <[medium]>или опытный врач .",
+    },
+    {
+        'key': 'academic_degree',
+        'text': "Нужна ли **ученая степень**? <[large]>или это не важно?",
+    },
+    {
+        'key': 'appointment_type',
+        'text': "Какой **тип** приема нужен?<[huge]> Первичный<[large]> повторный<[huge]> или профилактический?",
+    },
+    {
+        'key': 'previous_diagnosis',
+        'text': "Если вы **уже были** у врача-специалиста раньше, <[huge]>какой **диагноз **вам поставили?",
+    },
+    {
+        'key': 'chronic_diseases',
+        'text': "Есть ли у вас **хронические** заболевания?<[huge]>Например: диабет<[huge]>, гипертония,<[medium]> астма<[huge]> или аллергии?",
+    },
+    {
+        'key': 'additional_examinations',
+        'text': "Какие **обследования** вам могут понадобиться? <[huge]>Например: <[medium]>УЗИ <[medium]>или Рентген?",
+    },
+    {
+        'key': 'special_requirements',
+        'text':  "Есть ли у вас **особые** пожелания <[large]>или уточнения ?<[huge]>Например: <[medium]>английский язык,<[medium]> или онлайн консультация",
+    }
+]
+
+# Приветствие и завершение уточняющих вопросов
+GREETING_PHRASE = "Я задам несколько **уточняющих вопросов **, <[medium]>для более точного подбора врача."
+COMPLETION_PHRASE = "**Спасибо** за ответы! <[huge]>Все уточняющие вопросы **завершены**."
+FIXED_PHRASES = [GREETING_PHRASE] + [question['text'] for question in ADDITIONAL_QUESTIONS] + [COMPLETION_PHRASE]
+
 
 class VoiceAdditionalQuestions:
     def __init__(self):
@@ -13,61 +58,13 @@ class VoiceAdditionalQuestions:
         self.answers = {}
         self.questions_completed = False
 
-        # Папки для аудио
-        self.questions_folder = "audio/additional_questions"
+        # Папка для записанных ответов (вопросы озвучиваются через кэш синтеза)
         self.answers_folder = "audio/additional_answers"
-        os.makedirs(self.questions_folder, exist_ok=True)
         os.makedirs(self.answers_folder, exist_ok=True)
 
         # Список уточняющих вопросов
-        # В списке вопросов сделаем их короче:
-        self.questions = [
-            {
-                'key': 'patient_type',
-                'text': "Какой врач н+ужен**вам**<[huge]> детский или взрослый ?",
-
-            },
-            {
-                'key': 'doctor_gender',
-                'text': "Важен ли **пол** врача?",
-
-            },
-            {
-                'key': 'experience',
-                'text': "Какие требования к **опыту** врача? <[large]>Например: <[medium]>молодой специалист <[medium]>или опытный врач .",
-
-            },
-            {
-                'key': 'academic_degree',
-                'text': "Нужна ли **ученая степень**? <[large]>или это не важно?",
-
-            },
-            {
-                'key': 'appointment_type',
-                'text': "Какой **тип** приема нужен?<[huge]> Первичный<[large]> повторный<[huge]> или профилактический?",
-
-            },
-            {
-                'key': 'previous_diagnosis',
-                'text': "Если вы **уже были** у врача-специалиста раньше, <[huge]>какой **диагноз **вам поставили?",
-
-            },
-            {
-                'key': 'chronic_diseases',
-                'text': "Есть ли у вас **хронические** заболевания?<[huge]>Например: диабет<[huge]>, гипертония,<[medium]> астма<[huge]> или аллергии?",
-
-            },
-            {
-                'key': 'additional_examinations',
-                'text': "Какие **обследования** вам могут понадобиться? <[huge]>Например: <[medium]>УЗИ <[medium]>или Рентген?",
-
-            },
-            {
-                'key': 'special_requirements',
-                'text':  "Есть ли у вас **особые** пожелания <[large]>или уточнения ?<[huge]>Например: <[medium]>английский язык,<[medium]> или онлайн консультация",
-
-            }
-        ]
+        self.questions = list(ADDITIONAL_QUESTIONS)
+
     def start_questions(self):
         """Запуск уточняющих вопросов с голосом"""
         self.is_active = True
@@ -75,6 +72,9 @@ class VoiceAdditionalQuestions:
         self.answers = {}
         self.current_question_index = 0
 
+        # Вопросы, которых еще нет в кэше, синтезируются в фоне, пока звучит приветствие
+        presynthesize_in_background(FIXED_PHRASES[1:])
+
         # Запускаем в отдельном потоке
         thread = threading.Thread(target=self._run_questions)
         thread.daemon = True
@@ -84,7 +84,7 @@ class VoiceAdditionalQuestions:
         """Основная логика уточняющих вопросов"""
         try:
             # Приветствие
-            self._speak("Я задам несколько **уточняющих вопросов **, <[medium]>для более точного подбора врача.")
+            self._speak(GREETING_PHRASE, cacheable=True)
             time.sleep(2)
 
             # Задаем вопросы
@@ -97,7 +97,7 @@ class VoiceAdditionalQuestions:
 
                 # Озвучиваем вопрос
                 question_text = question_data['text']
-                self._speak(question_text)
+                self._speak(question_text, cacheable=True)
                 self._add_to_history("🤖 Лилу", question_text)
                 time.sleep(1)
 
@@ -118,9 +118,8 @@ class VoiceAdditionalQuestions:
 
             # Завершение
             if self.is_active:
-                completion_text = "**Спасибо** за ответы! <[huge]>Все уточняющие вопросы **завершены**."
-                self._speak(completion_text)
-                self._add_to_history("✅", completion_text)
+                self._speak(COMPLETION_PHRASE, cacheable=True)
+                self._add_to_history("✅", COMPLETION_PHRASE)
                 self.questions_completed = True
 
         except Exception as e:
@@ -130,10 +129,10 @@ class VoiceAdditionalQuestions:
         finally:
             self.is_active = False
 
-    def _speak(self, text):
-        """Озвучивание текста"""
+    def _speak(self, text, cacheable=False):
+        """Озвучивание текста (cacheable - постоянная фраза из FIXED_PHRASES)"""
         try:
-            success = text_to_ogg(text, self.questions_folder)
+            success = text_to_ogg(text, cacheable)
             if not success:
                 print(f"⚠️ Не удалось озвучить: {text}")
         except Exception as e:
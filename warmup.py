@@ -0,0 +1,162 @@
+"""Прогрев процесса при старте сервера: каталог врачей, соединения с LLM и SpeechKit,
+кэш озвучки постоянных фраз голосовых диалогов.
+
+Запуск перед переключением трафика (ждет окончания прогрева, код выхода 1 - какой-то шаг не удался):
+    python warmup.py [--catalog all_doctors.csv]
+
+В приложении прогрев запускается в фоне (start_warmup), первая сессия не ждет его окончания.
+Готовность - is_ready() и warmup_status(), а при заданном READINESS_PORT - HTTP GET /ready
+(200 - все шаги прогрева удались, 503 - прогрев еще идет или какой-то шаг не удался).
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+from doctor_catalog import DEFAULT_CATALOG_PATH, get_catalog
+
+# Потоки синтеза постоянных фраз и соединения LLM, которые открываются заранее
+WARMUP_TTS_WORKERS = 4
+WARMUP_LLM_CONNECTIONS = 4
+
+# Порт HTTP-проверки готовности (None - не запускать)
+READINESS_PORT = None
+
+_lock = threading.Lock()
+_status: Dict = {'state': 'idle', 'started_at': None, 'finished_at': None, 'steps': {}}
+
+
+def static_phrases() -> List[str]:
+    """Постоянные фразы голосового диалога и уточняющих вопросов (без повторов)"""
+    from voce_dialog import FIXED_PHRASES as DIALOG_PHRASES
+    from voice_additional_questions import FIXED_PHRASES as ADDITIONAL_PHRASES
+    return list(dict.fromkeys(DIALOG_PHRASES + ADDITIONAL_PHRASES))
+
+
+def _warm_catalog(catalog_path: str) -> Dict:
+    catalog = get_catalog(catalog_path)
+    catalog.embeddings  # Матрица для семантического поиска строится при первом обращении
+    return {'rows': catalog.rows}
+
+
+def _warm_llm() -> Dict:
+    from ai_helper import client
+    return {'connections': client.connect(WARMUP_LLM_CONNECTIONS)}
+
+
+def _warm_speech() -> Dict:
+    from audio_text import connect_speechkit, presynthesize, tts_cache_stats
+    connected = connect_speechkit()
+    phrases = static_phrases()
+    with ThreadPoolExecutor(max_workers=WARMUP_TTS_WORKERS, thread_name_prefix='lilu-warmup-tts') as pool:
+        ready = sum(pool.map(lambda text: presynthesize([text]), phrases))
+    step = {'speechkit_services': connected, 'phrases': len(phrases), 'ready': ready, 'cache': tts_cache_stats()}
+    # presynthesize не пробрасывает ошибки синтеза, поэтому неудачу шага определяем по счетчикам
+    if connected == 0:
+        step.update(ok=False, error="нет соединения ни с одним сервисом SpeechKit")
+    elif ready < len(phrases):
+        step.update(ok=False, error=f"синтезировано {ready} из {len(phrases)} постоянных фраз")
+    return step
+
+
+def _run_step(name: str, func: Callable[[], Dict]):
+    started = time.perf_counter()
+    try:
+        step = {'ok': True, **func()}  # Шаг может сам вернуть ok=False и error, сохранив свои счетчики
+        if not step['ok']:
+            print(f"Прогрев: шаг {name} не удался: {step.get('error')}")
+    except Exception as e:
+        print(f"Прогрев: шаг {name} не удался: {e}")
+        step = {'ok': False, 'error': str(e)}
+    step['seconds'] = round(time.perf_counter() - started, 3)
+    with _lock:
+        _status['steps'][name] = step
+
+
+def run_warmup(catalog_path: str = DEFAULT_CATALOG_PATH) -> Dict:
+    """Прогрев с ожиданием окончания: шаги идут параллельно, ошибка одного не останавливает остальные.
+
+    Готовность ('ready') - только если удались все шаги, иначе состояние 'failed'. Приложение при этом
+    продолжает работать: соединения и фразы создаются при первом обращении.
+    """
+    with _lock:
+        _status.update(state='running', started_at=time.time(), finished_at=None, steps={})
+    steps = {
+        'catalog': lambda: _warm_catalog(catalog_path),
+        'llm': _warm_llm,
+        'speech': _warm_speech,
+    }
+    with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix='lilu-warmup') as pool:
+        for name, func in steps.items():
+            pool.submit(_run_step, name, func)
+    with _lock:
+        failed = [name for name, step in _status['steps'].items() if not step['ok']]
+        _status.update(state='failed' if failed else 'ready', finished_at=time.time())
+    status = warmup_status()
+    print(f"Прогрев закончен: {status}")
+    return status
+
+
+def start_warmup(catalog_path: str = DEFAULT_CATALOG_PATH, readiness_port: Optional[int] = READINESS_PORT) -> bool:
+    """Прогрев в фоновом потоке, один раз на процесс (False - уже запущен)"""
+    with _lock:
+        if _status['state'] != 'idle':
+            return False
+        _status['state'] = 'starting'
+    if readiness_port:
+        serve_readiness(readiness_port)
+    threading.Thread(target=run_warmup, args=(catalog_path,), name='lilu-warmup', daemon=True).start()
+    return True
+
+
+def is_ready() -> bool:
+    """Прогрев закончен и все шаги удались, сессии работают с установившейся задержкой"""
+    return _status['state'] == 'ready'
+
+
+def warmup_status() -> Dict:
+    """Состояние прогрева и результаты шагов"""
+    with _lock:
+        status = json.loads(json.dumps(_status, default=str))
+    status['ready'] = status['state'] == 'ready'
+    return status
+
+
+class _ReadinessHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0].rstrip('/') not in ('', '/ready'):
+            self.send_error(404)
+            return
+        status = warmup_status()
+        body = json.dumps(status, ensure_ascii=False).encode('utf-8')
+        self.send_response(200 if status['ready'] else 503)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Проверки готовности приходят часто, в лог не пишем
+
+
+def serve_readiness(port: int) -> ThreadingHTTPServer:
+    """HTTP-проверка готовности на отдельном порту (для балансировщика или оркестратора)"""
+    server = ThreadingHTTPServer(('', port), _ReadinessHandler)
+    threading.Thread(target=server.serve_forever, name='lilu-readiness', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогрев сервера Лилу")
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH)
+    args = parser.parse_args()
+    status = run_warmup(args.catalog)
+    print(json.dumps(status, ensure_ascii=False, indent=2))
+    raise SystemExit(0 if all(step['ok'] for step in status['steps'].values()) else 1)
+
+
+if __name__ == "__main__":
+    main()